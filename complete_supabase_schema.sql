@@ -17,11 +17,19 @@ CREATE TABLE IF NOT EXISTS properties (
     phone TEXT,
     city TEXT,
     url TEXT,
+    latitude DOUBLE PRECISION, -- geocoded from city/address (utils/geocoder.py)
+    longitude DOUBLE PRECISION,
+    location_precision TEXT, -- 'street' or 'city' (city centroid only, left out of geo search)
     sent BOOLEAN DEFAULT FALSE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Existing databases
+ALTER TABLE properties ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION;
+ALTER TABLE properties ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION;
+ALTER TABLE properties ADD COLUMN IF NOT EXISTS location_precision TEXT;
+
 -- =====================================================
 -- 2. POSTS TABLE (ETL processed posts from MongoDB)
 -- =====================================================
@@ -47,11 +55,17 @@ CREATE TABLE IF NOT EXISTS schedules (
     start_option TEXT, -- 'immediately', 'on-date', 'on-time'
     end_option TEXT,   -- 'never', 'on-date', 'after-count'
     max_posts INTEGER,
+    posts_scraped INTEGER DEFAULT 0, -- running total used by end_option 'after-count'
+    last_run_at TIMESTAMP WITH TIME ZONE,
     is_active BOOLEAN DEFAULT TRUE,
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
     updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Existing databases
+ALTER TABLE schedules ADD COLUMN IF NOT EXISTS posts_scraped INTEGER DEFAULT 0;
+ALTER TABLE schedules ADD COLUMN IF NOT EXISTS last_run_at TIMESTAMP WITH TIME ZONE;
+
 -- =====================================================
 -- 4. SCRAPING_LOGS TABLE (Track scraping activities)
 -- =====================================================
@@ -65,9 +79,13 @@ CREATE TABLE IF NOT EXISTS scraping_logs (
     posts_saved INTEGER DEFAULT 0,
     status TEXT, -- 'running', 'completed', 'failed'
     error_message TEXT,
+    metrics JSONB, -- per-phase timings and per-group counters of the run
     created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
 );
 
+-- Existing databases
+ALTER TABLE scraping_logs ADD COLUMN IF NOT EXISTS metrics JSONB;
+
 -- =====================================================
 -- 5. EMAIL_NOTIFICATIONS TABLE (Track sent notifications)
 -- =====================================================
@@ -115,6 +133,20 @@ CREATE INDEX IF NOT EXISTS idx_properties_created_at ON properties(created_at DE
 CREATE INDEX IF NOT EXISTS idx_properties_city ON properties(city);
 CREATE INDEX IF NOT EXISTS idx_properties_price ON properties(price);
 CREATE INDEX IF NOT EXISTS idx_properties_sent ON properties(sent);
+-- Property upserts resolve conflicts on url (keep the newest row of duplicate urls before indexing)
+DELETE FROM properties a USING properties b WHERE a.url = b.url AND a.id < b.id;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_properties_url ON properties(url);
+
+-- Optional: geo search in Postgres (the app uses an in-process index, services/geo_search.py)
+-- CREATE EXTENSION IF NOT EXISTS cube;
+-- CREATE EXTENSION IF NOT EXISTS earthdistance;
+-- CREATE INDEX IF NOT EXISTS idx_properties_location ON properties USING gist (ll_to_earth(latitude, longitude));
+-- SELECT *, earth_distance(ll_to_earth(latitude, longitude), ll_to_earth(32.7775, 35.0216)) AS meters
+--   FROM properties
+--   WHERE earth_box(ll_to_earth(32.7775, 35.0216), 2000) @> ll_to_earth(latitude, longitude)
+--     AND earth_distance(ll_to_earth(latitude, longitude), ll_to_earth(32.7775, 35.0216)) <= 2000
+--     AND price <= 5000
+--   ORDER BY meters;
 
 -- Posts table indexes
 CREATE INDEX IF NOT EXISTS idx_posts_mongo_id ON posts(mongo_id);
@@ -169,7 +201,8 @@ VALUES
 ('scraping_interval', '20', 'Minutes between scraping runs'),
 ('max_posts_per_run', '50', 'Maximum posts to scrape per run'),
 ('email_notifications', 'true', 'Enable email notifications'),
-('default_city', 'Tel Aviv', 'Default city for filtering');
+('default_city', 'Tel Aviv', 'Default city for filtering'),
+('post_filters', '["להשכרה", "3 חדרים", "4 חדרים"]', 'JSON list of words that exclude a post from scraping');
 
 -- Insert sample Facebook groups
 INSERT INTO facebook_groups (group_name, group_url, is_active) 
@@ -1,17 +1,20 @@
+import threading
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 from flask import Flask, jsonify
 
-from services.fb_scraper import get_env_path
+from utils.env import load_env
 from .database import init_app
 import os
-from dotenv import load_dotenv
 # from etc.fb_scraper import  get_env_path
 from pymongo.errors import PyMongoError
-from pymongo import MongoClient
 from .extensions import socketio  # Import socketio from extensions.py
 from flask_sqlalchemy import SQLAlchemy # type: ignore
 
 # Load the .env file
-load_dotenv(dotenv_path=get_env_path())
+load_env()
 
 # Celery configuration
 # def make_celery(app):
@@ -26,29 +29,129 @@ load_dotenv(dotenv_path=get_env_path())
 
 
 
+def _count_with_app_context(app, count_function):
+    with app.app_context():
+        try:
+            return count_function()
+        except PyMongoError:
+            return float("nan")
+
+def _ensure_indexes_in_background(app):
+    # Index builds are idempotent round trips to Mongo; the app does not wait for them
+    def run():
+        from flaskr.models.indexes import ensure_indexes
+        with app.app_context():
+            try:
+                ensure_indexes()
+            except PyMongoError as e:
+                app.logger.warning(f"Could not ensure Mongo indexes: {e}")
+
+    threading.Thread(target=run, name="mongo-indexes", daemon=True).start()
+
+def _check_sql_schema_in_background(app):
+    # Read-only: the changes are made by `flask migrate-properties`, never as a side effect of starting the app
+    if not app.config.get('SQLALCHEMY_DATABASE_URI'):
+        return
+
+    def run():
+        from sqlalchemy.exc import SQLAlchemyError
+        from flaskr.database import mySQL_db
+        from flaskr.models.SQL.schema import check_property_schema
+        with app.app_context():
+            try:
+                problems = check_property_schema(mySQL_db.engine)
+            except SQLAlchemyError as e:
+                app.logger.warning(f"Could not check the SQL properties table: {e}")
+                return
+            if problems:
+                app.logger.warning(f"The SQL properties table is behind the model ({'; '.join(problems)}), "
+                                   f"run `flask migrate-properties`")
+
+    threading.Thread(target=run, name="sql-schema-check", daemon=True).start()
+
 def create_app():
+    from utils.startup import StartupTimer
+    startup = StartupTimer(started_at=_IMPORT_STARTED)
+    startup.record("imports", time.perf_counter() - _IMPORT_STARTED)
+
     app = Flask(__name__)
     
-    # Load configuration
+    # Load configuration (flask_pymongo's client is the only Mongo client of the app)
     app.config["MONGO_URI"] = os.getenv("MONGO_CONNECTION_STRING")
- 
-    # Initialize MongoClient once and store it in app.config
-    app.config['MONGO_CLIENT'] =  MongoClient(os.getenv("MONGO_CONNECTION_STRING"))
 
     # # Set up the MySQL database URI using environment variables
     app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("SQLALCHEMY_DATABASE_URI")
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
 
-    # Initialize SocketIO with the app
-    # socketio.init_app(app)
+    # Initialize SocketIO with the app and start pushing new listings to the dashboards.
+    # With several worker processes, SOCKETIO_MESSAGE_QUEUE (e.g. redis://redis:6379/0) must be set so a
+    # listing scraped by one worker reaches the dashboards connected to the others; without it the app
+    # has to run as a single process.
+    with startup.phase("socketio"):
+        socketio.init_app(app, message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE") or None)
+        from services.live_feed import live_feed
+        live_feed.init_app(app)
 
     # Register Blueprints or routes here
-    from . import routes
-    app.register_blueprint(blueprint=routes.bp)
+    with startup.phase("routes"):
+        from . import routes
+        app.register_blueprint(blueprint=routes.bp)
 
     # Initialize the database
-    init_app(app)
+    with startup.phase("database"):
+        init_app(app)
+
+    # Create the Mongo indexes the repository queries rely on, and check the SQL properties table is migrated
+    _ensure_indexes_in_background(app)
+    _check_sql_schema_in_background(app)
+
+    # `flask audit-queries`: explain() every repository query and flag collection scans
+    @app.cli.command("audit-queries")
+    def audit_queries_command():
+        from flaskr.models.indexes import audit_queries
+        collection_scans = 0
+        for description, collection_name, stages, is_collection_scan in audit_queries():
+            flag = "COLLSCAN" if is_collection_scan else "ok"
+            print(f"{flag:8} {collection_name}: {description} -> {' > '.join(reversed(stages))}")
+            collection_scans += is_collection_scan
+        if collection_scans:
+            raise SystemExit(f"{collection_scans} queries scan the whole collection")
+
+    with startup.phase("services"):
+        # Load the settings, schedules and groups into the config cache in the background
+        from services.config_cache import config_cache
+        config_cache.init_app(app)
+
+        # Start the in-process scrape scheduler (enabled with SCHEDULER_ENABLED=true)
+        from services.scheduler import scheduler
+        scheduler.init_app(app)
+
+        # `flask archive-posts` / `flask rehydrate-posts`: move old posts to the monthly archives and back
+        from services import retention
+        retention.init_app(app)
+
+        # `flask rebuild-price-stats`: recompute the /api/stats rollups from the posts
+        from services import price_stats
+        price_stats.init_app(app)
+
+        # `flask migrate-properties`: add the new columns and the unique url index to the SQL properties table
+        from flaskr.models.SQL import schema
+        schema.init_app(app)
+
+        # `flask geocode-properties`: add coordinates to properties inserted before geocoding existed
+        from services import geocoding
+        geocoding.init_app(app)
+
+        # Deliver queued email notifications in the background
+        from services.notification_dispatcher import dispatcher
+        dispatcher.init_app(app)
+
+    # Queue depths exposed on /metrics (evaluated only when scraped)
+    from utils.metrics import register_queue
+    from flaskr.models.outbox import count_pending_notifications
+    register_queue("live_feed", live_feed.queue_size)
+    register_queue("email_outbox", lambda: _count_with_app_context(app, count_pending_notifications), shared=True)
     
     # Middleware to handle PyMongo exceptions
     @app.errorhandler(code_or_exception=PyMongoError)
@@ -56,4 +159,5 @@ def create_app():
         app.logger.error(f"Database error: {error}")
         return jsonify({"status": "error", "message": "A database error occurred."}), 500
 
+    startup.report()
     return app
@@ -3,13 +3,16 @@ Complete Supabase REST API Client for Apartment Hunter Bot
 Supports all database tables and operations
 """
 import os
-import requests
 from typing import List, Dict, Optional, Any
-from dotenv import load_dotenv
 import logging
 from datetime import datetime
+from utils.env import load_env
+from utils.lazy import LazyObject
+from utils.metrics import DB_LATENCY, timed
+from utils.resilience import http
+from utils.supabase_bulk import BulkResult, bulk_upsert
 
-load_dotenv()
+load_env()
 
 class CompleteSupabaseClient:
     def __init__(self):
@@ -29,16 +32,48 @@ class CompleteSupabaseClient:
     def test_connection(self) -> bool:
         """Test if Supabase API is accessible"""
         try:
-            response = requests.get(f"{self.base_url}/rest/v1/", headers=self.headers, timeout=10)
+            response = http.get(f"{self.base_url}/rest/v1/", headers=self.headers, timeout=10)
             return response.status_code in [200, 404]
         except Exception as e:
             logging.error(f"Supabase connection test failed: {e}")
             return False
     
+    # =====================================================
+    # GENERIC TABLE OPERATIONS (used by the storage repository)
+    # =====================================================
+
+    @timed(DB_LATENCY, backend="supabase", operation="select_rows")
+    def select_rows(self, table: str, filters: Dict = None, limit: int = 100, order_by: str = None,
+                    columns: str = "*") -> List[Dict]:
+        """Get rows of any table, filtered by equality on each filter key, or membership for list values (raises on failure)"""
+        url = f"{self.base_url}/rest/v1/{table}"
+        params = {"select": columns}
+        if limit:
+            params["limit"] = limit
+        if order_by:
+            params["order"] = order_by
+        for key, value in (filters or {}).items():
+            if isinstance(value, (list, tuple, set)):
+                quoted = ",".join('"{}"'.format(str(item).replace('\\', '\\\\').replace('"', '\\"')) for item in value)
+                params[key] = f"in.({quoted})"
+            else:
+                params[key] = f"eq.{value}"
+
+        response = http.get(url, headers=self.headers, params=params, timeout=30)
+        response.raise_for_status()
+        return response.json()
+
+    @timed(DB_LATENCY, backend="supabase", operation="upsert_rows")
+    def upsert_rows(self, table: str, rows: List[Dict], on_conflict: str, ignore_duplicates: bool = False) -> BulkResult:
+        """Upsert many rows in concurrent chunks; rows matching on_conflict are merged (or skipped)"""
+        return bulk_upsert(f"{self.base_url}/rest/v1/{table}", self.headers, rows,
+                           on_conflict=on_conflict, ignore_duplicates=ignore_duplicates)
+
     # =====================================================
     # PROPERTIES TABLE OPERATIONS
     # =====================================================
     
+    @timed(DB_LATENCY, backend="supabase", operation="get_properties")
     def get_properties(self, limit: int = 100, order_by: str = "created_at.desc", filters: Dict = None) -> List[Dict]:
         """Get properties from the database"""
         try:
@@ -53,7 +88,7 @@ class CompleteSupabaseClient:
                 for key, value in filters.items():
                     params[key] = f"eq.{value}"
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
             response.raise_for_status()
             
             return response.json()
@@ -61,11 +96,12 @@ class CompleteSupabaseClient:
             logging.error(f"Failed to get properties: {e}")
             return []
     
+    @timed(DB_LATENCY, backend="supabase", operation="insert_property")
     def insert_property(self, property_data: Dict) -> bool:
         """Insert a new property"""
         try:
             url = f"{self.base_url}/rest/v1/properties"
-            response = requests.post(url, headers=self.headers, json=property_data, timeout=30)
+            response = http.post(url, headers=self.headers, json=property_data, timeout=30)
             response.raise_for_status()
             return True
         except Exception as e:
@@ -77,17 +113,63 @@ class CompleteSupabaseClient:
         try:
             url = f"{self.base_url}/rest/v1/properties"
             params = {"id": f"eq.{property_id}"}
-            response = requests.patch(url, headers=self.headers, params=params, json=updates, timeout=30)
+            response = http.patch(url, headers=self.headers, params=params, json=updates, timeout=30)
             response.raise_for_status()
             return True
         except Exception as e:
             logging.error(f"Failed to update property: {e}")
             return False
     
+    @timed(DB_LATENCY, backend="supabase", operation="get_properties_without_location")
+    def get_properties_without_location(self, limit: int = 500, after_id: int = 0) -> List[Dict]:
+        """Get a page of properties that were not geocoded yet (or before precisions were stored), by ascending id"""
+        try:
+            url = f"{self.base_url}/rest/v1/properties"
+            params = {
+                "select": "id,city,address",
+                "or": "(latitude.is.null,location_precision.is.null)",
+                "id": f"gt.{after_id}",
+                "order": "id.asc",
+                "limit": limit
+            }
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logging.error(f"Failed to get properties without location: {e}")
+            return []
+
+    @timed(DB_LATENCY, backend="supabase", operation="get_located_properties")
+    def get_located_properties(self, limit: int = 1000, after_id: int = 0) -> List[Dict]:
+        """Get a page of street-level geocoded properties (the columns the apartments API returns), by ascending id"""
+        try:
+            url = f"{self.base_url}/rest/v1/properties"
+            params = {
+                "select": "id,description,address,price,rooms,size,phone,city,url,created_at,latitude,longitude,"
+                          "location_precision",
+                # City centroids would put every listing of a city on one point
+                "location_precision": "eq.street",
+                "id": f"gt.{after_id}",
+                "order": "id.asc",
+                "limit": limit
+            }
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logging.error(f"Failed to get located properties: {e}")
+            return []
+
+    @timed(DB_LATENCY, backend="supabase", operation="update_property_locations")
+    def update_property_locations(self, rows: List[Dict]) -> BulkResult:
+        """Set the location of many properties ({id, latitude, longitude, location_precision} rows)"""
+        return bulk_upsert(f"{self.base_url}/rest/v1/properties", self.headers, rows, on_conflict="id")
+
     # =====================================================
     # POSTS TABLE OPERATIONS
     # =====================================================
     
+    @timed(DB_LATENCY, backend="supabase", operation="get_posts")
     def get_posts(self, limit: int = 100, order_by: str = "created_at.desc") -> List[Dict]:
         """Get posts from the database"""
         try:
@@ -98,7 +180,7 @@ class CompleteSupabaseClient:
                 "limit": limit
             }
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
             response.raise_for_status()
             
             return response.json()
@@ -106,32 +188,28 @@ class CompleteSupabaseClient:
             logging.error(f"Failed to get posts: {e}")
             return []
     
+    @timed(DB_LATENCY, backend="supabase", operation="insert_post")
     def insert_post(self, post_data: Dict) -> bool:
         """Insert a new post"""
         try:
             url = f"{self.base_url}/rest/v1/posts"
-            response = requests.post(url, headers=self.headers, json=post_data, timeout=30)
+            response = http.post(url, headers=self.headers, json=post_data, timeout=30)
             response.raise_for_status()
             return True
         except Exception as e:
             logging.error(f"Failed to insert post: {e}")
             return False
     
-    def insert_posts_bulk(self, posts: List[Dict]) -> bool:
-        """Insert multiple posts at once"""
-        try:
-            url = f"{self.base_url}/rest/v1/posts"
-            response = requests.post(url, headers=self.headers, json=posts, timeout=60)
-            response.raise_for_status()
-            return True
-        except Exception as e:
-            logging.error(f"Failed to insert posts bulk: {e}")
-            return False
+    @timed(DB_LATENCY, backend="supabase", operation="insert_posts_bulk")
+    def insert_posts_bulk(self, posts: List[Dict]) -> BulkResult:
+        """Insert multiple posts at once (posts already loaded, by mongo_id, are merged)"""
+        return bulk_upsert(f"{self.base_url}/rest/v1/posts", self.headers, posts, on_conflict="mongo_id")
     
     # =====================================================
     # SCHEDULES TABLE OPERATIONS
     # =====================================================
     
+    @timed(DB_LATENCY, backend="supabase", operation="get_schedules")
     def get_schedules(self, active_only: bool = True) -> List[Dict]:
         """Get schedules from the database"""
         try:
@@ -141,7 +219,7 @@ class CompleteSupabaseClient:
             if active_only:
                 params["is_active"] = "eq.true"
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
             response.raise_for_status()
             
             return response.json()
@@ -149,29 +227,34 @@ class CompleteSupabaseClient:
             logging.error(f"Failed to get schedules: {e}")
             return []
     
-    def save_schedule(self, schedule_data: Dict) -> bool:
-        """Save or update a schedule"""
-        try:
+    @timed(DB_LATENCY, backend="supabase", operation="save_schedule")
+    def save_schedule(self, schedule_data: Dict, schedule_id: int = None) -> bool:
+        """Save or update a schedule (the given one, else the latest) in one upsert"""
+        if schedule_id is None:
             # Check if schedule exists
             existing = self.get_schedules(active_only=False)
-            
-            if existing:
-                # Update existing schedule
-                schedule_id = existing[0]['id']
-                url = f"{self.base_url}/rest/v1/schedules"
-                params = {"id": f"eq.{schedule_id}"}
-                response = requests.patch(url, headers=self.headers, params=params, json=schedule_data, timeout=30)
-            else:
-                # Insert new schedule
-                url = f"{self.base_url}/rest/v1/schedules"
-                response = requests.post(url, headers=self.headers, json=schedule_data, timeout=30)
-            
+            schedule_id = existing[0]['id'] if existing else None
+
+        if schedule_id is None:
+            # Insert new schedule
+            return bool(bulk_upsert(f"{self.base_url}/rest/v1/schedules", self.headers, [schedule_data]))
+        # Update existing schedule
+        return bool(bulk_upsert(f"{self.base_url}/rest/v1/schedules", self.headers,
+                                [{**schedule_data, "id": schedule_id}], on_conflict="id"))
+
+    @timed(DB_LATENCY, backend="supabase", operation="update_schedule")
+    def update_schedule(self, schedule_id: int, updates: Dict) -> bool:
+        """Update a schedule by ID"""
+        try:
+            url = f"{self.base_url}/rest/v1/schedules"
+            params = {"id": f"eq.{schedule_id}"}
+            response = http.patch(url, headers=self.headers, params=params, json=updates, timeout=30)
             response.raise_for_status()
             return True
         except Exception as e:
-            logging.error(f"Failed to save schedule: {e}")
+            logging.error(f"Failed to update schedule: {e}")
             return False
-    
+
     # =====================================================
     # SCRAPING LOGS TABLE OPERATIONS
     # =====================================================
@@ -186,19 +269,31 @@ class CompleteSupabaseClient:
                 "status": "running"
             }
             
-            response = requests.post(url, headers=self.headers, json=log_data, timeout=30)
+            response = http.post(url, headers=self.headers, json=log_data, timeout=30)
             response.raise_for_status()
             return True
         except Exception as e:
             logging.error(f"Failed to create scraping log: {e}")
             return False
     
+    @timed(DB_LATENCY, backend="supabase", operation="insert_scraping_log")
+    def insert_scraping_log(self, log_data: Dict) -> bool:
+        """Insert a complete scraping log entry (written once at the end of a run)"""
+        try:
+            url = f"{self.base_url}/rest/v1/scraping_logs"
+            response = http.post(url, headers=self.headers, json=log_data, timeout=30)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to insert scraping log: {e}")
+            return False
+    
     def update_scraping_log(self, run_id: str, updates: Dict) -> bool:
         """Update a scraping log entry"""
         try:
             url = f"{self.base_url}/rest/v1/scraping_logs"
             params = {"run_id": f"eq.{run_id}"}
-            response = requests.patch(url, headers=self.headers, params=params, json=updates, timeout=30)
+            response = http.patch(url, headers=self.headers, params=params, json=updates, timeout=30)
             response.raise_for_status()
             return True
         except Exception as e:
@@ -215,7 +310,7 @@ class CompleteSupabaseClient:
                 "limit": limit
             }
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
             response.raise_for_status()
             
             return response.json()
@@ -227,7 +322,8 @@ class CompleteSupabaseClient:
     # EMAIL NOTIFICATIONS TABLE OPERATIONS
     # =====================================================
     
-    def log_email_notification(self, recipient_email: str, subject: str, posts_count: int) -> bool:
+    @timed(DB_LATENCY, backend="supabase", operation="log_email_notification")
+    def log_email_notification(self, recipient_email: str, subject: str, posts_count: int, status: str = "sent") -> bool:
         """Log an email notification"""
         try:
             url = f"{self.base_url}/rest/v1/email_notifications"
@@ -235,10 +331,10 @@ class CompleteSupabaseClient:
                 "recipient_email": recipient_email,
                 "subject": subject,
                 "posts_count": posts_count,
-                "status": "sent"
+                "status": status
             }
             
-            response = requests.post(url, headers=self.headers, json=notification_data, timeout=30)
+            response = http.post(url, headers=self.headers, json=notification_data, timeout=30)
             response.raise_for_status()
             return True
         except Exception as e:
@@ -255,7 +351,7 @@ class CompleteSupabaseClient:
                 "limit": limit
             }
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
             response.raise_for_status()
             
             return response.json()
@@ -267,6 +363,7 @@ class CompleteSupabaseClient:
     # USER SETTINGS TABLE OPERATIONS
     # =====================================================
     
+    @timed(DB_LATENCY, backend="supabase", operation="get_setting")
     def get_setting(self, setting_key: str) -> Optional[str]:
         """Get a user setting value"""
         try:
@@ -276,7 +373,7 @@ class CompleteSupabaseClient:
                 "setting_key": f"eq.{setting_key}"
             }
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
             response.raise_for_status()
             
             data = response.json()
@@ -285,41 +382,38 @@ class CompleteSupabaseClient:
             logging.error(f"Failed to get setting {setting_key}: {e}")
             return None
     
-    def set_setting(self, setting_key: str, setting_value: str, description: str = None) -> bool:
-        """Set a user setting value"""
+    @timed(DB_LATENCY, backend="supabase", operation="get_settings")
+    def get_settings(self) -> Optional[Dict[str, str]]:
+        """Get all user settings as {setting_key: setting_value} (None if the request failed)"""
         try:
-            # Check if setting exists
             url = f"{self.base_url}/rest/v1/user_settings"
-            params = {"setting_key": f"eq.{setting_key}"}
-            
-            # Try to update first
-            update_data = {"setting_value": setting_value}
-            if description:
-                update_data["description"] = description
-            
-            response = requests.patch(url, headers=self.headers, params=params, json=update_data, timeout=30)
-            
-            if response.status_code == 200:
-                return True
-            
-            # If update failed, insert new setting
-            setting_data = {
-                "setting_key": setting_key,
-                "setting_value": setting_value,
-                "description": description or f"Setting for {setting_key}"
-            }
+            params = {"select": "setting_key,setting_value"}
             
-            response = requests.post(url, headers=self.headers, json=setting_data, timeout=30)
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
             response.raise_for_status()
-            return True
+            
+            return {row['setting_key']: row['setting_value'] for row in response.json()}
         except Exception as e:
-            logging.error(f"Failed to set setting {setting_key}: {e}")
-            return False
+            logging.error(f"Failed to get settings: {e}")
+            return None
+    
+    @timed(DB_LATENCY, backend="supabase", operation="set_setting")
+    def set_setting(self, setting_key: str, setting_value: str, description: str = None) -> bool:
+        """Set a user setting value (one upsert on setting_key)"""
+        setting_data = {"setting_key": setting_key, "setting_value": setting_value}
+        if description:
+            setting_data["description"] = description
+        result = bulk_upsert(f"{self.base_url}/rest/v1/user_settings", self.headers, [setting_data],
+                             on_conflict="setting_key")
+        if not result:
+            logging.error(f"Failed to set setting {setting_key}")
+        return bool(result)
     
     # =====================================================
     # FACEBOOK GROUPS TABLE OPERATIONS
     # =====================================================
     
+    @timed(DB_LATENCY, backend="supabase", operation="get_facebook_groups")
     def get_facebook_groups(self, active_only: bool = True) -> List[Dict]:
         """Get Facebook groups"""
         try:
@@ -329,7 +423,7 @@ class CompleteSupabaseClient:
             if active_only:
                 params["is_active"] = "eq.true"
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
             response.raise_for_status()
             
             return response.json()
@@ -347,7 +441,7 @@ class CompleteSupabaseClient:
                 "is_active": True
             }
             
-            response = requests.post(url, headers=self.headers, json=group_data, timeout=30)
+            response = http.post(url, headers=self.headers, json=group_data, timeout=30)
             response.raise_for_status()
             return True
         except Exception as e:
@@ -359,12 +453,67 @@ class CompleteSupabaseClient:
         try:
             url = f"{self.base_url}/rest/v1/facebook_groups"
             params = {"id": f"eq.{group_id}"}
-            response = requests.patch(url, headers=self.headers, params=params, json=updates, timeout=30)
+            response = http.patch(url, headers=self.headers, params=params, json=updates, timeout=30)
             response.raise_for_status()
             return True
         except Exception as e:
             logging.error(f"Failed to update Facebook group: {e}")
             return False
 
-# Global instance
-supabase_client = CompleteSupabaseClient()
+    @timed(DB_LATENCY, backend="supabase", operation="upsert_facebook_groups")
+    def upsert_facebook_groups(self, groups: List[Dict]) -> bool:
+        """Insert or update many Facebook groups (matched on group_url) in one request"""
+        try:
+            url = f"{self.base_url}/rest/v1/facebook_groups"
+            params = {"on_conflict": "group_url"}
+            headers = {**self.headers, "Prefer": "resolution=merge-duplicates,return=minimal"}
+            response = http.post(url, headers=headers, params=params, json=groups, timeout=30)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to upsert Facebook groups: {e}")
+            return False
+
+    # =====================================================
+    # RETENTION (archival of old rows)
+    # =====================================================
+
+    @timed(DB_LATENCY, backend="supabase", operation="get_rows_created_before")
+    def get_rows_created_before(self, table: str, cutoff: str, limit: int = 1000, after_id: int = 0) -> List[Dict]:
+        """Get a page of rows created before the cutoff, by ascending id (keyset pagination)"""
+        try:
+            url = f"{self.base_url}/rest/v1/{table}"
+            params = {
+                "select": "*",
+                "created_at": f"lt.{cutoff}",
+                "id": f"gt.{after_id}",
+                "order": "id.asc",
+                "limit": limit
+            }
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logging.error(f"Failed to get old rows from {table}: {e}")
+            return []
+
+    @timed(DB_LATENCY, backend="supabase", operation="restore_rows")
+    def restore_rows(self, table: str, rows: List[Dict]) -> BulkResult:
+        """Insert archived rows back, keeping their ids (rows that still exist are merged)"""
+        return bulk_upsert(f"{self.base_url}/rest/v1/{table}", self.headers, rows, on_conflict="id")
+
+    @timed(DB_LATENCY, backend="supabase", operation="delete_rows")
+    def delete_rows(self, table: str, ids: List[int]) -> bool:
+        """Delete rows by id"""
+        try:
+            url = f"{self.base_url}/rest/v1/{table}"
+            params = {"id": f"in.({','.join(str(row_id) for row_id in ids)})"}
+            response = http.delete(url, headers=self.headers, params=params, timeout=30)
+            response.raise_for_status()
+            return True
+        except Exception as e:
+            logging.error(f"Failed to delete rows from {table}: {e}")
+            return False
+
+# Global instance, created on first use (raises there if SUPABASE_ANON_KEY is missing)
+supabase_client = LazyObject(CompleteSupabaseClient)
@@ -1,27 +1,61 @@
-from flaskr.database import mySQL_db as db
-from flaskr.models.SQL.property import Property
+from datetime import datetime, timezone
+
+from flaskr.data_access.repository import MERGE, SQLAlchemyRepository, get_repository
+from utils.geocoder import geocoder
+
+PROPERTY_FIELDS = ('price', 'size', 'rooms', 'city', 'address', 'url', 'description', 'phone')
+
+# save_properties
+def save_properties(rows, on_conflict=MERGE):
+    """
+    Geocodes and upserts a batch of properties in one statement per batch, keyed by url.
+    An edited listing (same url) gets its price/description/etc. updated.
+
+    Parameters:
+    - rows: Property dicts (price, size, rooms, city, address, url, description, phone).
+    - on_conflict: "merge" to update existing urls, "ignore" to leave them untouched.
+
+    Returns:
+    - The number of properties inserted or changed.
+    """
+    properties = [{field: row.get(field) for field in PROPERTY_FIELDS} for row in rows]
+    geocoder.enrich(properties)
+    return SQLAlchemyRepository().upsert("properties", properties, key="url", on_conflict=on_conflict)
+
+def property_from_post(post) -> dict:
+    """Maps a scraped Mongo post onto a properties row (keyed by the post link)."""
+    rooms = post.get('rooms')
+    return {
+        'description': post.get('content'),
+        'price': post.get('price'),
+        'size': post.get('size'),
+        # properties.rooms is an INTEGER column; half rooms stay readable in the description
+        'rooms': int(rooms) if rooms is not None and float(rooms).is_integer() else None,
+        'city': post.get('city'),
+        'address': post.get('address'),
+        'phone': post.get('phone'),
+        'url': post.get('link'),
+        'sent': False,
+        'created_at': datetime.now(timezone.utc)
+    }
+
+def save_new_properties(posts):
+    """
+    Geocodes and inserts the properties of newly scraped posts into the configured
+    properties backend (the table the dashboard lists). Urls already stored are left untouched.
+
+    Parameters:
+    - posts: The Mongo posts that were just inserted (posts without a link are skipped).
+
+    Returns:
+    - The property rows that were actually inserted.
+    """
+    rows = [property_from_post(post) for post in posts if post.get('link')]
+    if not rows:
+        return []
+    geocoder.enrich(rows)
+    return get_repository("properties").insert_new("properties", rows, key="url")
 
 # save_post_to_db
 def save_post_on_db(data):
-    new_property = Property(
-        price=data['price'],
-        size=data['size'],
-        rooms=data['rooms'],
-        city=data['city'],
-        address=data['address'],
-        url=data['url'],
-        description= data['description'],
-        phone=data['phone']
-    )
-    
-    db.session.add(new_property)
-    db.session.commit()
-
-# read_post_from_db
-
-# update_post_from_db
-
-# Check if post exists
-def check_exists(str_to_check):
-    exists = db.session.query(Property.id).filter(Property.url == str_to_check).first()
-    return exists is not None
+    return save_properties([data])
@@ -0,0 +1,412 @@
+"""
+Storage repository with pluggable backends.
+
+Every backend exposes the same batched operations on named tables ("posts",
+"properties"):
+- upsert(table, rows, key, on_conflict="merge"): write many rows in as few round trips as
+  the backend allows; rows whose `key` already exists are merged ("merge") or left
+  untouched ("ignore")
+- find(table, filters=None, limit=100, order_by=None): bulk read with equality filters and
+  a Supabase-style order ("created_at.desc")
+- insert_new(table, rows, key): insert only the rows whose `key` is not stored yet and
+  return those rows (what was actually inserted, e.g. to publish or count it)
+
+Backends: MongoRepository, SQLAlchemyRepository (Postgres/MySQL/SQLite through the
+SQL models), SupabaseRepository (REST) and SQLiteRepository (schemaless, in memory by
+default, for tests and benchmarks). `get_repository("posts")` / `get_repository("properties")`
+return the configured backend (POSTS_BACKEND, default mongo; PROPERTIES_BACKEND, default supabase).
+"""
+import json
+import logging
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+from bson import ObjectId
+from sqlalchemy import or_
+
+MERGE = "merge"
+IGNORE = "ignore"
+SQL_BATCH_SIZE = 500
+
+
+def _parse_order(order_by):
+    """'created_at.desc' -> ('created_at', True)"""
+    if not order_by:
+        return None, False
+    field, _, direction = order_by.partition(".")
+    return field, direction.lower() == "desc"
+
+
+def _unique_by_key(rows, key):
+    """Drops rows without a key and merges rows sharing one (a batch may not hit the same key twice)."""
+    unique = {}
+    for row in rows:
+        if row.get(key) is None:
+            continue
+        if row[key] in unique and unique[row[key]] is not row:
+            unique[row[key]].update(row)
+        else:
+            unique[row[key]] = row
+    return list(unique.values())
+
+
+def _group_by_fields(rows):
+    """Groups rows by their set of fields (a multi-row INSERT needs the same columns in every row)."""
+    groups = {}
+    for row in rows:
+        groups.setdefault(tuple(sorted(row)), []).append(row)
+    return groups
+
+
+def _generated_columns(sql_table):
+    return {column.name for column in sql_table.primary_key.columns}
+
+
+def _jsonable(value):
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, (ObjectId, Decimal)):
+        return str(value) if isinstance(value, ObjectId) else float(value)
+    return value
+
+
+class Repository:
+    """Interface of the storage backends"""
+
+    name = "base"
+
+    def upsert(self, table, rows, key, on_conflict=MERGE) -> int:
+        """Writes rows in batch. Returns the number of rows inserted or changed."""
+        raise NotImplementedError
+
+    def find(self, table, filters=None, limit=100, order_by=None) -> list:
+        raise NotImplementedError
+
+    def existing_keys(self, table, key, values) -> set:
+        """Returns the subset of `values` already stored under `key`."""
+        raise NotImplementedError
+
+    def insert_new(self, table, rows, key) -> list:
+        """Inserts the rows whose key is not stored yet. Returns the rows actually inserted."""
+        rows = _unique_by_key(rows, key)
+        if not rows:
+            return []
+        existing = self.existing_keys(table, key, [row[key] for row in rows])
+        new_rows = [row for row in rows if row[key] not in existing]
+        if new_rows:
+            self.upsert(table, new_rows, key, on_conflict=IGNORE)
+        return new_rows
+
+
+class MongoRepository(Repository):
+    name = "mongo"
+    COLLECTIONS = {"posts": "collection"}
+
+    def __init__(self, database=None):
+        self._database = database
+
+    def _collection(self, table):
+        if self._database is None:
+            from flaskr.database import mongo
+            return mongo.db[self.COLLECTIONS.get(table, table)]
+        return self._database[self.COLLECTIONS.get(table, table)]
+
+    def _bulk_upsert(self, table, rows, key, on_conflict):
+        """Returns the rows (unique by key) and the indexes of the rows that were inserted."""
+        from pymongo import UpdateOne
+
+        rows = _unique_by_key(rows, key)
+        if not rows:
+            return rows, [], 0
+        operator = "$set" if on_conflict == MERGE else "$setOnInsert"
+        operations = [UpdateOne({key: row[key]}, {operator: {field: value for field, value in row.items() if field != "_id"}},
+                                upsert=True)
+                      for row in rows]
+        result = self._collection(table).bulk_write(operations, ordered=False)
+        # Mongo assigns the _id of upserted documents; hand them back like insert_one does
+        for index, upserted_id in result.upserted_ids.items():
+            rows[index].setdefault("_id", upserted_id)
+        return rows, sorted(result.upserted_ids), result.modified_count
+
+    def upsert(self, table, rows, key, on_conflict=MERGE) -> int:
+        rows, inserted, modified = self._bulk_upsert(table, rows, key, on_conflict)
+        return len(inserted) + modified
+
+    def existing_keys(self, table, key, values) -> set:
+        return {document[key] for document in self._collection(table).find({key: {"$in": list(values)}},
+                                                                           {key: 1, "_id": 0})}
+
+    def insert_new(self, table, rows, key) -> list:
+        # Exact even against concurrent writers: only upserted documents count as inserted
+        rows, inserted, _ = self._bulk_upsert(table, rows, key, IGNORE)
+        return [rows[index] for index in inserted]
+
+    def find(self, table, filters=None, limit=100, order_by=None) -> list:
+        cursor = self._collection(table).find(filters or {})
+        field, descending = _parse_order(order_by)
+        if field:
+            cursor = cursor.sort(field, -1 if descending else 1)
+        if limit:
+            cursor = cursor.limit(limit)
+        return list(cursor)
+
+
+class SQLAlchemyRepository(Repository):
+    """
+    Writes through the SQL models' tables with SQLAlchemy Core (no ORM object per row).
+
+    On Postgres and SQLite a batch is one INSERT ... ON CONFLICT (key) statement (the key needs
+    a unique index); merges only rewrite rows whose values changed. MySQL uses
+    INSERT ... ON DUPLICATE KEY UPDATE.
+    """
+
+    name = "sqlalchemy"
+
+    def __init__(self, engine=None):
+        self._engine = engine
+
+    @property
+    def engine(self):
+        if self._engine is None:
+            from flaskr.database import mySQL_db
+            return mySQL_db.engine
+        return self._engine
+
+    @staticmethod
+    def table(name):
+        if name == "properties":
+            from flaskr.models.SQL.property import Property
+            return Property.__table__
+        if name == "posts":
+            from ETL.models.Post import Post
+            return Post.__table__
+        raise ValueError(f"No SQL model for table {name}")
+
+    def upsert(self, table, rows, key, on_conflict=MERGE) -> int:
+        sql_table = self.table(table)
+        columns = set(sql_table.columns.keys())
+        # Unset primary keys are left to the database (an explicit NULL would not autoincrement)
+        generated = _generated_columns(sql_table)
+        rows = [{field: value for field, value in row.items()
+                 if field in columns and not (value is None and field in generated)}
+                for row in _unique_by_key(rows, key)]
+        if not rows:
+            return 0
+
+        insert = self._dialect_insert()
+        if insert is None:
+            return self._upsert_portable(sql_table, rows, key, on_conflict)
+
+        written = 0
+        with self.engine.begin() as connection:
+            # One INSERT ... ON CONFLICT statement per batch of rows sharing the same columns
+            for fields, group in _group_by_fields(rows).items():
+                for start in range(0, len(group), SQL_BATCH_SIZE):
+                    statement = self._upsert_statement(insert, sql_table, fields, key, on_conflict,
+                                                       group[start:start + SQL_BATCH_SIZE])
+                    result = connection.execute(statement)
+                    written += max(result.rowcount or 0, 0)
+        return written
+
+    def _dialect_insert(self):
+        """The dialect's INSERT construct with conflict handling, or None when it has none."""
+        dialect = self.engine.dialect.name
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        elif dialect == "sqlite":
+            from sqlalchemy.dialects.sqlite import insert
+        elif dialect in ("mysql", "mariadb"):
+            from sqlalchemy.dialects.mysql import insert
+        else:
+            return None
+        return insert
+
+    def _upsert_statement(self, insert, sql_table, fields, key, on_conflict, rows):
+        statement = insert(sql_table).values(rows)
+        update_fields = [field for field in fields if field != key and field not in _generated_columns(sql_table)]
+        if self.engine.dialect.name in ("mysql", "mariadb"):
+            # MySQL resolves conflicts on any unique index (url / mongo_id are the only ones besides the id)
+            if on_conflict == IGNORE or not update_fields:
+                return statement.prefix_with("IGNORE")
+            return statement.on_duplicate_key_update({field: statement.inserted[field] for field in update_fields})
+
+        if on_conflict == IGNORE or not update_fields:
+            return statement.on_conflict_do_nothing(index_elements=[key])
+        # Only rows whose values actually changed are rewritten (and counted)
+        return statement.on_conflict_do_update(
+            index_elements=[key],
+            set_={field: statement.excluded[field] for field in update_fields},
+            where=or_(*[sql_table.c[field].is_distinct_from(statement.excluded[field]) for field in update_fields]))
+
+    def _upsert_portable(self, sql_table, rows, key, on_conflict) -> int:
+        """SELECT the existing keys, then INSERT the new rows and UPDATE the others (dialects without upserts)."""
+        key_column = sql_table.c[key]
+        with self.engine.begin() as connection:
+            existing = {value for (value,) in connection.execute(
+                sql_table.select().with_only_columns(key_column).where(key_column.in_([row[key] for row in rows])))}
+            new_rows = [row for row in rows if row[key] not in existing]
+            if new_rows:
+                connection.execute(sql_table.insert(), new_rows)
+            if on_conflict == MERGE:
+                for row in rows:
+                    if row[key] in existing:
+                        update_values = {field: value for field, value in row.items() if field not in (key, "id")}
+                        if update_values:
+                            connection.execute(sql_table.update().where(key_column == row[key]).values(**update_values))
+        return len(rows) if on_conflict == MERGE else len(new_rows)
+
+    def find(self, table, filters=None, limit=100, order_by=None) -> list:
+        sql_table = self.table(table)
+        query = sql_table.select()
+        for field, value in (filters or {}).items():
+            query = query.where(sql_table.c[field] == value)
+        field, descending = _parse_order(order_by)
+        if field:
+            query = query.order_by(sql_table.c[field].desc() if descending else sql_table.c[field])
+        if limit:
+            query = query.limit(limit)
+        with self.engine.connect() as connection:
+            return [dict(row._mapping) for row in connection.execute(query)]
+
+    def existing_keys(self, table, key, values) -> set:
+        key_column = self.table(table).c[key]
+        values = list(values)
+        existing = set()
+        with self.engine.connect() as connection:
+            for start in range(0, len(values), SQL_BATCH_SIZE):
+                query = (self.table(table).select().with_only_columns(key_column)
+                         .where(key_column.in_(values[start:start + SQL_BATCH_SIZE])))
+                existing.update(value for (value,) in connection.execute(query))
+        return existing
+
+
+class SupabaseRepository(Repository):
+    name = "supabase"
+
+    def __init__(self, client=None):
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            from flaskr.complete_supabase_client import supabase_client
+            return supabase_client
+        return self._client
+
+    def upsert(self, table, rows, key, on_conflict=MERGE) -> int:
+        rows = [_jsonable({field: value for field, value in row.items() if field != "_id"})
+                for row in _unique_by_key(rows, key)]
+        if not rows:
+            return 0
+        result = self.client.upsert_rows(table, rows, on_conflict=key, ignore_duplicates=on_conflict == IGNORE)
+        return len(result.succeeded)
+
+    def find(self, table, filters=None, limit=100, order_by=None) -> list:
+        return self.client.select_rows(table, filters=filters, limit=limit, order_by=order_by)
+
+    def existing_keys(self, table, key, values) -> set:
+        values = list(values)
+        existing = set()
+        for start in range(0, len(values), 200):
+            chunk = values[start:start + 200]
+            rows = self.client.select_rows(table, filters={key: chunk}, limit=len(chunk), columns=key)
+            existing.update(row[key] for row in rows)
+        return existing
+
+
+class SQLiteRepository(Repository):
+    """Schemaless store (one JSON document per key) for tests and benchmarks."""
+
+    name = "sqlite"
+
+    def __init__(self, path=":memory:"):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._tables = set()
+
+    def _table(self, table):
+        if table not in self._tables:
+            self._connection.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" (key TEXT PRIMARY KEY, data TEXT NOT NULL)')
+            self._tables.add(table)
+        return f'"{table}"'
+
+    def upsert(self, table, rows, key, on_conflict=MERGE) -> int:
+        rows = [_jsonable(row) for row in _unique_by_key(rows, key)]
+        if not rows:
+            return 0
+        with self._lock, self._connection:
+            name = self._table(table)
+            keys = [str(row[key]) for row in rows]
+            existing = {}
+            for start in range(0, len(keys), 500):
+                chunk = keys[start:start + 500]
+                existing.update(self._connection.execute(
+                    f"SELECT key, data FROM {name} WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+
+            documents = {}
+            for row_key, row in zip(keys, rows):
+                if row_key in existing and on_conflict == IGNORE:
+                    continue
+                base = documents.get(row_key) or (json.loads(existing[row_key]) if row_key in existing else {})
+                documents[row_key] = {**base, **row}
+            self._connection.executemany(f"INSERT OR REPLACE INTO {name} (key, data) VALUES (?, ?)",
+                                         [(row_key, json.dumps(document, ensure_ascii=False))
+                                          for row_key, document in documents.items()])
+        return len(documents)
+
+    def find(self, table, filters=None, limit=100, order_by=None) -> list:
+        with self._lock:
+            name = self._table(table)
+            documents = [json.loads(data) for (data,) in self._connection.execute(f"SELECT data FROM {name}")]
+        documents = [document for document in documents
+                     if all(document.get(field) == value for field, value in (filters or {}).items())]
+        field, descending = _parse_order(order_by)
+        if field:
+            # Rows without the field go last in both directions, like Postgres NULLS LAST for asc
+            missing = [document for document in documents if document.get(field) is None]
+            documents = sorted((document for document in documents if document.get(field) is not None),
+                               key=lambda document: document[field], reverse=descending) + missing
+        return documents[:limit] if limit else documents
+
+    def existing_keys(self, table, key, values) -> set:
+        values = list(values)
+        found = set()
+        with self._lock:
+            name = self._table(table)
+            for start in range(0, len(values), 500):
+                chunk = [str(value) for value in values[start:start + 500]]
+                found.update(row_key for (row_key,) in self._connection.execute(
+                    f"SELECT key FROM {name} WHERE key IN ({','.join('?' * len(chunk))})", chunk))
+        return {value for value in values if str(value) in found}
+
+
+BACKENDS = {
+    MongoRepository.name: MongoRepository,
+    SQLAlchemyRepository.name: SQLAlchemyRepository,
+    SupabaseRepository.name: SupabaseRepository,
+    SQLiteRepository.name: SQLiteRepository,
+}
+
+DEFAULT_BACKENDS = {"posts": "mongo", "properties": "supabase"}
+
+_repositories = {}
+
+
+def get_repository(kind) -> Repository:
+    """Returns the configured repository for "posts" (POSTS_BACKEND) or "properties" (PROPERTIES_BACKEND)."""
+    backend = os.getenv(f"{kind.upper()}_BACKEND", DEFAULT_BACKENDS[kind]).lower()
+    repository = _repositories.get(backend)
+    if repository is None:
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown storage backend {backend!r}, expected one of {', '.join(BACKENDS)}")
+        repository = _repositories[backend] = BACKENDS[backend]()
+        logging.info(f"Using the {backend} storage backend for {kind}")
+    return repository
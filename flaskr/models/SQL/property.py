@@ -14,8 +14,11 @@ class Property(db.Model):
     rooms = db.Column(db.Integer, nullable=True) 
     city = db.Column(db.String(255), nullable=True)
     address = db.Column(db.String(255), nullable=True)
+    latitude = db.Column(db.Float, nullable=True)
+    longitude = db.Column(db.Float, nullable=True)
+    location_precision = db.Column(db.String(10), nullable=True)  # 'street' or 'city' (centroid)
     phone = db.Column(db.String(15), nullable=True)
-    url = db.Column(db.String(255), nullable=True)
+    url = db.Column(db.String(255), nullable=True, unique=True)  # upserts resolve conflicts on url
     sent = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
     # updated_at = db.Column(db.DateTime, default=datetime.now(timezone.utc), onupdate=datetime.now(timezone.utc))
@@ -0,0 +1,128 @@
+"""
+Migration of the SQL properties table to the Property model.
+
+`check_property_schema` only reads the table and is run at startup, which logs a
+warning when the table is behind the model. The changes themselves are made by
+`flask migrate-properties`, run once per deploy: it creates the table or adds the
+missing nullable columns and, when url is not unique yet, deletes the older rows
+of duplicate urls (after confirmation) and creates the unique index the property
+upserts resolve conflicts on. The statements run on Postgres, MySQL and SQLite.
+"""
+import logging
+
+import click
+from sqlalchemy import inspect, text
+
+from flaskr.models.SQL.property import Property
+
+URL_INDEX_NAME = "idx_properties_url"
+
+COUNT_DUPLICATE_URLS_SQL = text(
+    "SELECT COUNT(*) - COUNT(DISTINCT url) FROM properties WHERE url IS NOT NULL")
+# Keeps the newest row of every url. The derived table lets MySQL read the table it deletes from.
+DEDUPE_PROPERTIES_SQL = text(
+    "DELETE FROM properties WHERE url IS NOT NULL AND id NOT IN "
+    "(SELECT id FROM (SELECT MAX(id) AS id FROM properties WHERE url IS NOT NULL GROUP BY url) AS newest)")
+# Only run when the index is missing: MySQL has no CREATE INDEX IF NOT EXISTS
+CREATE_URL_INDEX_SQL = text(f"CREATE UNIQUE INDEX {URL_INDEX_NAME} ON properties (url)")
+
+
+def _has_unique_url(inspector) -> bool:
+    unique_indexes = [index["column_names"] for index in inspector.get_indexes("properties") if index.get("unique")]
+    unique_constraints = [constraint["column_names"] for constraint in inspector.get_unique_constraints("properties")]
+    return ["url"] in unique_indexes + unique_constraints
+
+
+def _missing_columns(inspector) -> list:
+    existing_columns = {column["name"] for column in inspector.get_columns(Property.__table__.name)}
+    return [column for column in Property.__table__.columns if column.name not in existing_columns]
+
+
+def check_property_schema(engine) -> list:
+    """
+    Compares the properties table with the Property model without changing anything.
+
+    Returns:
+    - A list of what `flask migrate-properties` would fix (empty when up to date).
+    """
+    inspector = inspect(engine)
+    if not inspector.has_table(Property.__table__.name):
+        return [f"table {Property.__table__.name} is missing"]
+    problems = [f"column {column.name} is missing" for column in _missing_columns(inspector)]
+    if not _has_unique_url(inspector):
+        problems.append("url is not unique")
+    return problems
+
+
+def count_duplicate_urls(engine) -> int:
+    """Number of property rows that the url deduplication would delete."""
+    with engine.connect() as connection:
+        return connection.execute(COUNT_DUPLICATE_URLS_SQL).scalar() or 0
+
+
+def migrate_properties(engine, dedupe: bool = True) -> list:
+    """
+    Brings the properties table up to the Property model.
+
+    Parameters:
+    - engine: The SQLAlchemy engine of the properties database.
+    - dedupe: Delete the older rows of duplicate urls so the unique index can be created.
+      Without it the index is only created when there are no duplicates.
+
+    Returns:
+    - A list of the changes made.
+    """
+    table = Property.__table__
+    inspector = inspect(engine)
+    if not inspector.has_table(table.name):
+        table.create(engine)
+        return [f"created table {table.name}"]
+
+    changes = []
+    with engine.begin() as connection:
+        for column in _missing_columns(inspector):
+            if not column.nullable:
+                changes.append(f"skipped the NOT NULL column {column.name} (existing rows have no value)")
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+            changes.append(f"added column {column.name}")
+
+    if not _has_unique_url(inspector):
+        with engine.begin() as connection:
+            duplicates = connection.execute(COUNT_DUPLICATE_URLS_SQL).scalar() or 0
+            if duplicates and not dedupe:
+                changes.append(f"kept {duplicates} duplicate urls, {URL_INDEX_NAME} not created")
+                return changes
+            if duplicates:
+                deleted = connection.execute(DEDUPE_PROPERTIES_SQL).rowcount
+                changes.append(f"deleted {deleted} older rows of duplicate urls")
+            connection.execute(CREATE_URL_INDEX_SQL)
+        changes.append(f"created {URL_INDEX_NAME}")
+
+    if changes:
+        logging.info(f"Migrated the properties table: {'; '.join(changes)}")
+    return changes
+
+
+def init_app(app):
+    """Registers `flask migrate-properties`."""
+
+    @app.cli.command("migrate-properties")
+    @click.option("--yes", is_flag=True, help="Delete the older rows of duplicate urls without asking.")
+    def migrate_properties_command(yes):
+        from flaskr.database import mySQL_db
+        engine = mySQL_db.engine
+        problems = check_property_schema(engine)
+        if not problems:
+            print("The properties table is up to date")
+            return
+
+        print(f"To migrate: {'; '.join(problems)}")
+        dedupe = True
+        duplicates = count_duplicate_urls(engine) if "url is not unique" in problems else 0
+        if duplicates and not yes:
+            dedupe = click.confirm(f"Delete the {duplicates} older rows of duplicate urls (the newest row of each "
+                                   f"url is kept)?", default=False)
+        for change in migrate_properties(engine, dedupe=dedupe):
+            print(change)
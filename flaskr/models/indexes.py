@@ -0,0 +1,155 @@
+import logging
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import OperationFailure
+
+from flaskr.database import mongo
+from flaskr.models.outbox import PENDING, SENDING
+from flaskr.models.post import content_hash, post_id_from_link
+
+# collection name -> list of (keys, options). Created idempotently by ensure_indexes().
+REQUIRED_INDEXES = {
+    "collection": [
+        # Dedup by normalized post ID. Partial so legacy posts without a post_id (or duplicates
+        # left over from the regex lookup days) do not block the index.
+        ([("post_id", ASCENDING)], {"name": "post_id_unique", "unique": True,
+                                    "partialFilterExpression": {"post_id": {"$type": "string"}}}),
+        # Only the unsent posts are ever queried by flag, so only they are indexed
+        ([("hasBeenSent", ASCENDING)], {"name": "unsent_posts",
+                                        "partialFilterExpression": {"hasBeenSent": False}}),
+        ([("date_posted", DESCENDING)], {"name": "date_posted"}),
+        ([("content_hash", ASCENDING)], {"name": "content_hash"}),
+    ],
+    # Dedup keys of archived posts (see services.retention)
+    "post_fingerprints": [
+        ([("post_id", ASCENDING)], {"name": "post_id", "partialFilterExpression": {"post_id": {"$type": "string"}}}),
+        ([("content_hash", ASCENDING)], {"name": "content_hash"}),
+    ],
+    "price_stats": [
+        ([("week", ASCENDING), ("city", ASCENDING), ("rooms", ASCENDING)], {"name": "week_city_rooms"}),
+    ],
+    "outbox": [
+        ([("status", ASCENDING), ("next_attempt_at", ASCENDING)], {"name": "status_next_attempt"}),
+        ([("status", ASCENDING), ("locked_until", ASCENDING)], {"name": "status_locked_until"}),
+    ],
+}
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# The queries the repository functions run: (description, collection, filter, sort)
+AUDITED_QUERIES = [
+    ("check_exists", "collection", {"post_id": "0"}, None),
+    ("content_exists", "collection", {"content_hash": "0"}, None),
+    ("check_exists (archived)", "post_fingerprints", {"post_id": "0"}, None),
+    ("content_exists (archived)", "post_fingerprints", {"content_hash": "0"}, None),
+    ("existing_post_ids", "collection", {"post_id": {"$in": ["0"], "$type": "string"}}, None),
+    ("existing_post_ids (archived)", "post_fingerprints", {"post_id": {"$in": ["0"], "$type": "string"}}, None),
+    ("existing_content_hashes", "collection", {"content_hash": {"$in": ["0"], "$type": "string"}}, None),
+    ("get_posts_by_filter (unsent posts)", "collection", {"hasBeenSent": False, "queued": {"$ne": True}}, None),
+    ("latest posts", "collection", {}, [("date_posted", DESCENDING)]),
+    ("claim_next_notification", "outbox",
+     {"$or": [{"status": PENDING, "next_attempt_at": {"$lte": _EPOCH}}, {"status": SENDING, "locked_until": {"$lte": _EPOCH}}]},
+     [("next_attempt_at", ASCENDING)]),
+    ("get_stats", "price_stats", {"week": {"$in": ["2024-W01"]}, "city": "0"}, [("week", ASCENDING)]),
+    ("count_pending_notifications", "outbox", {"status": {"$in": [PENDING, SENDING]}}, None),
+]
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def backfill_post_keys():
+    """
+    Sets post_id and content_hash on posts inserted before they existed.
+
+    When several legacy posts share a post ID, only the oldest one gets it so the
+    unique index can be built.
+
+    Returns:
+    - The number of posts that were updated.
+    """
+    collection = mongo.db.collection
+    seen_post_ids = set(collection.distinct("post_id"))
+    missing = collection.find(
+        {"$or": [{"post_id": {"$exists": False}}, {"content_hash": {"$exists": False}}]},
+        {"link": 1, "content": 1, "post_id": 1}
+    ).sort("_id", ASCENDING).batch_size(BACKFILL_BATCH_SIZE)
+
+    updated = 0
+    operations = []
+    for post in missing:
+        values = {"content_hash": content_hash(post.get("content"))}
+        if "post_id" not in post:
+            post_id = post_id_from_link(post.get("link"))
+            if post_id and post_id not in seen_post_ids:
+                values["post_id"] = post_id
+                seen_post_ids.add(post_id)
+        operations.append(UpdateOne({"_id": post["_id"]}, {"$set": values}))
+
+        if len(operations) >= BACKFILL_BATCH_SIZE:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += collection.bulk_write(operations, ordered=False).modified_count
+
+    return updated
+
+
+def ensure_indexes():
+    """
+    Creates the required indexes that do not exist yet. Safe to call on every start.
+
+    The post keys are backfilled the first time the post_id index is created.
+
+    Returns:
+    - The names of the indexes that were created.
+    """
+    created = []
+    for collection_name, indexes in REQUIRED_INDEXES.items():
+        collection = mongo.db[collection_name]
+        existing = collection.index_information()
+        for keys, options in indexes:
+            if options["name"] in existing:
+                continue
+            if options["name"] == "post_id_unique":
+                logging.info(f"Backfilled post keys on {backfill_post_keys()} posts")
+            try:
+                collection.create_index(keys, **options)
+                created.append(options["name"])
+            except OperationFailure as e:
+                # e.g. an index with the same keys but another name or options already exists
+                logging.warning(f"Could not create index {collection_name}.{options['name']}: {e}")
+
+    if created:
+        logging.info(f"Created Mongo indexes: {', '.join(created)}")
+    return created
+
+
+def _plan_stages(plan):
+    """Yields every stage name of an explain() plan tree."""
+    if not isinstance(plan, dict):
+        return
+    if "stage" in plan:
+        yield plan["stage"]
+    for key in ("inputStage", "queryPlan"):
+        yield from _plan_stages(plan.get(key))
+    for child in plan.get("inputStages", []):
+        yield from _plan_stages(child)
+
+
+def audit_queries():
+    """
+    Runs explain() on each repository query.
+
+    Returns:
+    - A list of (description, collection, stages, is_collection_scan) tuples.
+    """
+    results = []
+    for description, collection_name, filter_criteria, sort in AUDITED_QUERIES:
+        cursor = mongo.db[collection_name].find(filter_criteria, {"_id": 1})
+        if sort:
+            cursor = cursor.sort(sort)
+        winning_plan = cursor.explain().get("queryPlanner", {}).get("winningPlan", {})
+        stages = list(_plan_stages(winning_plan))
+        results.append((description, collection_name, stages, "COLLSCAN" in stages))
+    return results
@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta, timezone
+from flaskr.database import mongo
+
+PENDING = "pending"
+SENDING = "sending"
+SENT = "sent"
+FAILED = "failed"
+
+def build_notification(recipients, subject, post_ids):
+    """
+    Builds an outbox document for a notification about the given posts.
+
+    Parameters:
+    - recipients: List of email addresses that receive the notification.
+    - subject: Subject of the email.
+    - post_ids: The exact _ids of the posts included in the notification.
+
+    Returns:
+    - The outbox document (not inserted yet).
+    """
+    now = datetime.now(timezone.utc)
+    return {
+        "recipients": list(recipients),
+        "subject": subject,
+        "post_ids": list(post_ids),
+        "status": PENDING,
+        "attempts": 0,
+        "next_attempt_at": now,
+        "locked_until": None,
+        "last_error": None,
+        "created_at": now
+    }
+
+def insert_notifications(notifications, session=None):
+    """
+    Inserts outbox documents.
+
+    Returns:
+    - The list of inserted IDs.
+    """
+    if not notifications:
+        return []
+    result = mongo.db.outbox.insert_many(notifications, session=session)
+    return result.inserted_ids
+
+def claim_next_notification(lease_seconds=300):
+    """
+    Atomically claims the next notification that is due for delivery.
+
+    A notification stuck in 'sending' (e.g. the process died mid-send) is
+    claimable again once its lease expired.
+
+    Parameters:
+    - lease_seconds: How long the claim is held before another dispatcher may retry it.
+
+    Returns:
+    - The claimed outbox document, or None if nothing is due.
+    """
+    now = datetime.now(timezone.utc)
+    return mongo.db.outbox.find_one_and_update(
+        filter={"$or": [
+            {"status": PENDING, "next_attempt_at": {"$lte": now}},
+            {"status": SENDING, "locked_until": {"$lte": now}}
+        ]},
+        update={"$set": {"status": SENDING, "locked_until": now + timedelta(seconds=lease_seconds)}},
+        sort=[("next_attempt_at", 1)],
+        return_document=True)
+
+def mark_notification_sent(notification_id):
+    mongo.db.outbox.update_one(
+        {"_id": notification_id},
+        {"$set": {"status": SENT, "sent_at": datetime.now(timezone.utc), "locked_until": None}})
+
+def mark_notification_retry(notification_id, attempts, error, next_attempt_at, give_up=False):
+    """
+    Records a failed delivery attempt and schedules the next one (or gives up).
+    """
+    mongo.db.outbox.update_one(
+        {"_id": notification_id},
+        {"$set": {
+            "status": FAILED if give_up else PENDING,
+            "attempts": attempts,
+            "last_error": error,
+            "next_attempt_at": next_attempt_at,
+            "locked_until": None
+        }})
+
+def count_pending_notifications():
+    return mongo.db.outbox.count_documents({"status": {"$in": [PENDING, SENDING]}})
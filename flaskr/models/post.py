@@ -1,9 +1,37 @@
+import hashlib
+import re
 from datetime import datetime
 from bson.objectid import ObjectId
 from flaskr.database import mongo
 from pymongo.errors import PyMongoError
+from utils.metrics import DB_LATENCY, timed
 
-def update_posts_by_filter(filter_criteria, update_values):
+def post_id_from_link(link):
+    """
+    Extracts the normalized Facebook post ID from a post link.
+
+    Parameters:
+    - link: The cleaned post URL (e.g., 'https://www.facebook.com/groups/123/posts/456').
+
+    Returns:
+    - The post ID ('456'), or None if the link has no post ID.
+    """
+    if not link:
+        return None
+    match = re.search(r"/posts/([^/?#]+)", link)
+    if match:
+        return match.group(1)
+    return link.rstrip("/").split("/")[-1] or None
+
+def content_hash(content):
+    """
+    Hashes the post content with whitespace collapsed, so reposts of the same text match.
+    """
+    normalized = " ".join((content or "").split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()
+
+@timed(DB_LATENCY, backend="mongo", operation="update_posts_by_filter")
+def update_posts_by_filter(filter_criteria, update_values, session=None):
     """
     Updates posts in the database based on the given filter criteria.
 
@@ -17,23 +45,99 @@ def update_posts_by_filter(filter_criteria, update_values):
     
     result = mongo.db.collection.update_many(
         filter=filter_criteria, 
-        update={'$set': update_values})
+        update={'$set': update_values},
+        session=session)
     
     return result.modified_count
 
-def get_posts_by_filter(filter_criteria):
+DEFAULT_BATCH_SIZE = 500
+
+def find_posts(filter_criteria, projection=None, sort=None, limit=0, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Returns a lazy cursor over the posts matching the filter criteria.
+
+    Parameters:
+    - filter_criteria: A dictionary containing the filter criteria (e.g., {'link': 'https://example.com'}).
+    - projection: Optional projection of the fields to return (e.g., {'link': 1, 'content': 1}).
+    - sort: Optional list of (field, direction) pairs.
+    - limit: Maximum number of posts to return (0 means no limit).
+    - batch_size: Number of documents fetched from the server per round trip.
+
+    Returns:
+    - A pymongo cursor; documents are fetched as it is iterated.
+    """
+    cursor = mongo.db.collection.find(filter_criteria, projection).batch_size(batch_size)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit:
+        cursor = cursor.limit(limit)
+    return cursor
+
+def iter_post_batches(filter_criteria, projection=None, sort=None, limit=0, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Streams the posts matching the filter criteria as lists of at most batch_size posts.
+
+    Parameters are the same as `find_posts`.
+    """
+    batch = []
+    for post in find_posts(filter_criteria, projection=projection, sort=sort, limit=limit, batch_size=batch_size):
+        batch.append(post)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+@timed(DB_LATENCY, backend="mongo", operation="get_posts_by_filter")
+def get_posts_by_filter(filter_criteria, projection=None, sort=None, limit=0):
     """
     Retrieves posts from the database based on the given filter criteria.
 
+    Prefer `find_posts`/`iter_post_batches` when the result can be large.
+
     Parameters:
     - filter_criteria: A dictionary containing the filter criteria (e.g., {'link': 'https://example.com'}).
+    - projection, sort, limit: See `find_posts`.
 
     Returns:
     - A list of posts that match the filter criteria.
     """
-    posts = mongo.db.collection.find(filter_criteria)
-    return list(posts) 
+    return list(find_posts(filter_criteria, projection=projection, sort=sort, limit=limit))
+
+@timed(DB_LATENCY, backend="mongo", operation="get_posts_by_ids")
+def get_posts_by_ids(post_ids, projection=None):
+    """
+    Retrieves posts by their _ids.
+
+    Parameters:
+    - post_ids: A list of post _ids.
+    - projection: Optional projection of the fields to return.
+
+    Returns:
+    - A list of the matching posts.
+    """
+    return list(mongo.db.collection.find({"_id": {"$in": list(post_ids)}}, projection))
 
+@timed(DB_LATENCY, backend="mongo", operation="mark_posts_as_sent")
+def mark_posts_as_sent(post_ids, recipients, session=None):
+    """
+    Marks exactly the given posts as sent to the given recipients, in one bulk write.
+
+    Parameters:
+    - post_ids: The _ids of the posts that were delivered.
+    - recipients: The addresses they were delivered to (kept in `sent_to` so a retried
+      notification never sends the same post twice to the same recipient).
+
+    Returns:
+    - The number of documents that were updated.
+    """
+    result = mongo.db.collection.update_many(
+        filter={"_id": {"$in": list(post_ids)}},
+        update={"$set": {"hasBeenSent": True}, "$addToSet": {"sent_to": {"$each": list(recipients)}}},
+        session=session)
+    return result.modified_count
+
+@timed(DB_LATENCY, backend="mongo", operation="insert_post")
 def insert_post(post):
     """
     Inserts a new post into the database.
@@ -45,9 +149,12 @@ def insert_post(post):
     - The ID of the inserted post.
     """
     
+    post.setdefault("post_id", post_id_from_link(post.get("link")))
+    post.setdefault("content_hash", content_hash(post.get("content")))
     result = mongo.db.collection.insert_one(post)
     return result.inserted_id
 
+@timed(DB_LATENCY, backend="mongo", operation="insert_posts")
 def insert_posts(posts: list):
     try:
         result = mongo.db.collection.insert_many(documents=posts)
@@ -92,16 +199,74 @@ def delete_post(post_id):
     
     pass
    
-def check_exists(url_substring):
+@timed(DB_LATENCY, backend="mongo", operation="check_exists")
+def check_exists(post_id):
     """
-    Checks if a post whose URL contains the given substring exists in MongoDB.
+    Checks if a post with the given normalized post ID exists in MongoDB (uses the unique post_id index).
+    Archived posts are found through their fingerprint.
 
     Parameters:
-    - url_substring: Substring of the URL to search for.
+    - post_id: The Facebook post ID (see `post_id_from_link`).
+
+    Returns:
+    - True if such a post exists, False otherwise (always False without a post ID).
+    """
+    if not post_id:
+        # {"post_id": None} would match every post without a post_id
+        return False
+    return (mongo.db.collection.find_one({"post_id": post_id}, {"_id": 1}) is not None
+            or mongo.db.post_fingerprints.find_one({"post_id": post_id}, {"_id": 1}) is not None)
+
+@timed(DB_LATENCY, backend="mongo", operation="content_exists")
+def content_exists(post_content_hash):
+    """
+    Checks if a post with the same content already exists (uses the content_hash index).
+    Archived posts are found through their fingerprint.
+
+    Parameters:
+    - post_content_hash: The hash returned by `content_hash`.
 
     Returns:
     - True if such a post exists, False otherwise.
     """
-    existing_post = mongo.db.collection.find_one({"link": {"$regex": url_substring}})
-    return existing_post is not None
+    return (mongo.db.collection.find_one({"content_hash": post_content_hash}, {"_id": 1}) is not None
+            or mongo.db.post_fingerprints.find_one({"content_hash": post_content_hash}, {"_id": 1}) is not None)
+
+def _existing_values(field, values) -> set:
+    """Returns the values of `field` among `values` that a hot or archived post already has."""
+    wanted = {value for value in values if value}
+    found = set()
+    for collection in (mongo.db.collection, mongo.db.post_fingerprints):
+        missing = list(wanted - found)
+        if not missing:
+            break
+        # $type matches the partial post_id indexes (and is a no-op for the hashes, which are strings)
+        cursor = collection.find({field: {"$in": missing, "$type": "string"}}, {field: 1, "_id": 0})
+        found.update(document[field] for document in cursor)
+    return found
+
+@timed(DB_LATENCY, backend="mongo", operation="existing_post_ids")
+def existing_post_ids(post_ids) -> set:
+    """
+    Batch version of `check_exists`: one query on the posts and one on the fingerprints.
 
+    Parameters:
+    - post_ids: Facebook post IDs (empty IDs are ignored).
+
+    Returns:
+    - The set of the given post IDs that already exist.
+    """
+    return _existing_values("post_id", post_ids)
+
+@timed(DB_LATENCY, backend="mongo", operation="existing_content_hashes")
+def existing_content_hashes(post_content_hashes) -> set:
+    """
+    Batch version of `content_exists`.
+
+    Parameters:
+    - post_content_hashes: Hashes returned by `content_hash`.
+
+    Returns:
+    - The set of the given hashes that already exist.
+    """
+    return _existing_values("content_hash", post_content_hashes)
@@ -1,21 +1,25 @@
-import threading
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, Response, render_template, jsonify, request
 from sqlalchemy import desc
-from services.fb_scraper import run_scraper, scrape_and_store_posts, send_email_with_new_posts
+from services.fb_scraper import run_scraper, scrape_and_store_posts, enqueue_new_posts_email
+from services.scheduler import scrape_lock
+from services.group_registry import group_registry
+from services.alert_rules import alert_engine
+from services.price_stats import get_stats
+from services.geo_search import check_point, geo_index
+from utils.geocoder import geocoder
+from utils.metrics import ROUTE_LATENCY, render_metrics, timed
 from pymongo.errors import PyMongoError
 from flaskr.models import post
 from flaskr.models.SQL.property import Property
 from flaskr.database import mySQL_db
-from flaskr.supabase_client import supabase_client
+from flaskr.data_access.repository import get_repository
 from datetime import datetime, timedelta
 from pytz import timezone
 import logging
+import math
+import time
 
 
-# Global lock variable
-lock = threading.Lock()
-is_running = False
-
 # Create a Blueprint for routes
 bp = Blueprint('main', __name__)
 
@@ -35,28 +39,16 @@ def script_scheduling():
 def links():
     return render_template(template_name_or_list='saved_links.html')
 
+@timed(ROUTE_LATENCY, route="/get_posts")
 def scrape_posts():
-    global is_running
-    
-    try:
-        scrape_and_store_posts()
+    # Shared with the in-process scheduler so a manual run never overlaps a scheduled one
+    if not scrape_lock.acquire(blocking=False):
         return jsonify({"status": "error", "message": "Scraper is already running. Please wait until it finishes."}), 429
 
-    # Lock the code to ensure the process runs only once
-    # with lock:
-    #     if is_running:
-    #         return jsonify({"status": "error", "message": "Scraper is already running. Please wait until it finishes."}), 429
-
-    #     # Mark that the scraper has started running
-    #     is_running = True
-    
-    # logging.info("Scraping posts...")
-    # try:
-    #     scrape_and_store_posts()
-        
-    #     return jsonify({"message": "Scraping and saving posts completed"}), 200
-        
-
+    logging.info("Scraping posts...")
+    try:
+        new_posts = scrape_and_store_posts()
+        return jsonify({"message": "Scraping and saving posts completed", "new_posts": new_posts}), 200
 
     except PyMongoError as e:
         logging.error(f"|Database error occurred|")
@@ -66,9 +58,7 @@ def scrape_posts():
         return jsonify({"status": "error", "message": str(e)}), 500
     
     finally:
-        # Release the lock when scraper finishes
-        # with lock:
-        #     is_running = False
+        scrape_lock.release()
         logging.info("Scraper finished running.")
 
 def run_scraper_route():
@@ -79,10 +69,10 @@ def run_scraper_route():
             return jsonify({ "message": "No new posts found"})
         
         post.insert_posts(posts=posts)
-        print("\n--------- Sending email with the new posts --------- \n")
-        send_email_with_new_posts()
+        print("\n--------- Queueing email with the new posts --------- \n")
+        enqueue_new_posts_email()
 
-        return jsonify({"status": "success", "message": f"Scraper ran successfully!\n{len(posts)} new posts found\nAn email has been sent\n"})
+        return jsonify({"status": "success", "message": f"Scraper ran successfully!\n{len(posts)} new posts found\nAn email has been queued\n"})
     
     except PyMongoError as e:
         return jsonify({"status": "error", "message": "Database error occurred."}), 500
@@ -104,7 +94,8 @@ def add_property():
             'sent': False
         }
         
-        success = supabase_client.insert_property(property_data)
+        geocoder.enrich([property_data])
+        success = get_repository("properties").upsert("properties", [property_data], key="url")
         
         if success:
             return jsonify({"status": "success", "message": "Property added successfully"})
@@ -119,7 +110,7 @@ def add_property():
 def print_properties():
     try:
         # Use Supabase REST API instead of direct database connection
-        properties = supabase_client.get_properties(limit=100)
+        properties = get_repository("properties").find("properties", limit=100)
 
         for property in properties:
             print(f'ID: {property.get("id")}, Description: {property.get("description")}, Price: {property.get("price")}')
@@ -129,45 +120,156 @@ def print_properties():
         logging.error(f"Error getting properties: {e}")
         return f"Error getting properties: {str(e)}"
 
+@bp.route('/api/filters/reload', methods=['POST'])
+def reload_filters():
+    # Picks up edited post_filters / post_include_filters settings without a restart
+    group_registry.refresh(force=True)
+    exclude, include = group_registry.get_post_filter().rules
+    return jsonify({"status": "success", "exclude": list(exclude), "include": list(include)})
+
+@bp.route('/api/alert_rules', methods=['GET', 'POST'])
+def alert_rules():
+    if request.method == 'GET':
+        alert_engine.refresh()
+        return jsonify([rule.to_dict() for rule in alert_engine.rules])
+
+    rules = request.get_json(silent=True)
+    if not isinstance(rules, list):
+        return jsonify({"status": "error", "message": "Expected a JSON list of alert rules"}), 400
+
+    if not alert_engine.save(rules):
+        return jsonify({"status": "error", "message": "Failed to save alert rules"}), 500
+    return jsonify({"status": "success", "rules": len(alert_engine.rules)})
+
 @bp.route('/apartments')
 def index():
     return render_template('apartments.html')
 
+# Last successful /api/apartments response, served (marked stale) while the backend is down
+_last_apartments = {}
+
 @bp.route('/api/apartments')
+@timed(ROUTE_LATENCY, route="/api/apartments")
 def get_apartments():
     try:
-        # Use Supabase REST API instead of direct database connection
-        properties = supabase_client.get_properties(limit=100, order_by="created_at.desc")
+        properties = get_repository("properties").find("properties", limit=100, order_by="created_at.desc")
         
-        apartments = [
-            {
-                'description': p.get('description', ''),
-                'address': p.get('address', ''),
-                'price': float(p.get('price', 0)) if p.get('price') is not None else None,
-                'rooms': p.get('rooms'),
-                'size': p.get('size'),
-                'phone': p.get('phone', ''),
-                'city': p.get('city', ''),
-                'url': p.get('url', ''),
-                'created_at': p.get('created_at', '')
-            } for p in properties
-        ]
+        apartments = [to_apartment(p) for p in properties]
+        _last_apartments.update(apartments=apartments, fetched_at=time.monotonic())
     except Exception as e:
         logging.error(f"Supabase API error in get_apartments: {e}")
+        if _last_apartments:
+            response = jsonify(_last_apartments["apartments"])
+            response.headers["X-Data-Stale"] = "true"
+            response.headers["Age"] = str(int(time.monotonic() - _last_apartments["fetched_at"]))
+            return response
         return jsonify({
             "error": "Database connection failed. Please check your Supabase project status.",
             "details": str(e),
             "apartments": []
         }), 500
     
-    for apartment in apartments:
-        if apartment['created_at']:
-            utc_dt = datetime.strptime(apartment['created_at'], '%Y-%m-%dT%H:%M:%S')
-            israel_dt = utc_to_israel_time(utc_dt)
-            apartment['created_at'] = israel_dt.strftime('%d-%m-%Y %H:%M:%S')
     return jsonify(apartments)
 
+def to_apartment(p):
+    apartment = {
+        'description': p.get('description', ''),
+        'address': p.get('address', ''),
+        'price': float(p.get('price', 0)) if p.get('price') is not None else None,
+        'rooms': p.get('rooms'),
+        'size': p.get('size'),
+        'phone': p.get('phone', ''),
+        'city': p.get('city', ''),
+        'url': p.get('url', ''),
+        'latitude': p.get('latitude'),
+        'longitude': p.get('longitude'),
+        'created_at': p.get('created_at', '')
+    }
+    if apartment['created_at']:
+        # Supabase timestamps may carry fractional seconds and an offset, both UTC
+        utc_dt = datetime.strptime(apartment['created_at'][:19], '%Y-%m-%dT%H:%M:%S')
+        israel_dt = utc_to_israel_time(utc_dt)
+        apartment['created_at'] = israel_dt.strftime('%d-%m-%Y %H:%M:%S')
+    return apartment
+
+def _finite_float(value):
+    # float() accepts "nan" and "inf", which no geo parameter can be
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{value!r} is not a finite number")
+    return number
+
+def _geo_filters(args):
+    max_price = args.get('max_price')
+    min_rooms = args.get('min_rooms')
+    return {
+        'max_price': _finite_float(max_price) if max_price not in (None, '') else None,
+        'min_rooms': _finite_float(min_rooms) if min_rooms not in (None, '') else None,
+        'limit': max(min(int(args.get('limit', 100)), 1000), 0)
+    }
+
+@bp.route('/api/apartments/near')
+@timed(ROUTE_LATENCY, route="/api/apartments/near")
+def apartments_near():
+    # e.g. /api/apartments/near?lat=32.7775&lon=35.0216&radius_km=2&max_price=5000 (2km around the Technion);
+    # only properties geocoded to a street (gazetteer street rows) are found, never city centroids
+    try:
+        lat = _finite_float(request.args['lat'])
+        lon = _finite_float(request.args['lon'])
+        radius_km = min(_finite_float(request.args.get('radius_km', 2)), 50)
+        filters = _geo_filters(request.args)
+    except (KeyError, ValueError):
+        return jsonify({"status": "error", "message": "lat and lon are required; numeric parameters must be numbers"}), 400
+    try:
+        check_point(lat, lon)
+    except ValueError:
+        return jsonify({"status": "error", "message": "lat must be within [-90, 90] and lon within [-180, 180]"}), 400
+    if radius_km < 0:
+        return jsonify({"status": "error", "message": "radius_km must not be negative"}), 400
+
+    results = geo_index.radius(lat, lon, radius_km, **filters)
+    return jsonify([{**to_apartment(row), 'distance_km': round(distance, 3)} for distance, row in results])
+
+@bp.route('/api/apartments/within', methods=['POST'])
+@timed(ROUTE_LATENCY, route="/api/apartments/within")
+def apartments_within():
+    # Body: {"polygon": [[lat, lon], ...], "max_price": 5000, "min_rooms": 3, "origin": [lat, lon]}
+    body = request.get_json(silent=True) or {}
+    try:
+        polygon = [(float(lat), float(lon)) for lat, lon in body.get('polygon') or []]
+        origin = tuple(float(value) for value in body['origin']) if body.get('origin') else None
+        filters = _geo_filters(body)
+        for lat, lon in polygon + ([origin] if origin else []):
+            check_point(lat, lon)
+    except (TypeError, ValueError):
+        return jsonify({"status": "error", "message": "polygon and origin must be [lat, lon] pairs with lat within "
+                                                     "[-90, 90] and lon within [-180, 180]"}), 400
+    if len(polygon) < 3:
+        return jsonify({"status": "error", "message": "polygon needs at least 3 vertices"}), 400
+
+    results = geo_index.polygon(polygon, origin=origin, **filters)
+    return jsonify([{**to_apartment(row), 'distance_km': round(distance, 3)} for distance, row in results])
+
+
+
+@bp.route('/api/stats')
+@timed(ROUTE_LATENCY, route="/api/stats")
+def stats():
+    # e.g. /api/stats?city=חיפה&rooms=3&weeks=4 -> weekly buckets + summary (median, percentiles, price per m²)
+    try:
+        weeks = min(int(request.args.get('weeks', 4)), 104)
+        # request.args.get(type=float) would silently drop a bad value and return every room count
+        rooms = _finite_float(request.args['rooms']) if request.args.get('rooms') else None
+        if rooms is not None and rooms < 0:
+            raise ValueError(f"{rooms} rooms")
+    except ValueError:
+        return jsonify({"status": "error", "message": "weeks and rooms must be numbers"}), 400
+    return jsonify(get_stats(city=request.args.get('city'), rooms=rooms, weeks=weeks))
 
+@bp.route('/metrics')
+def metrics():
+    payload, content_type = render_metrics()
+    return Response(payload, mimetype=content_type)
 
 def utc_to_israel_time(utc_dt):
     israel_tz = timezone('Asia/Jerusalem')
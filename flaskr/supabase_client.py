@@ -3,13 +3,16 @@ Supabase REST API Client for Flask App
 Replaces direct PostgreSQL connections with Supabase REST API
 """
 import os
-import requests
 from typing import List, Dict, Optional
-from dotenv import load_dotenv
 import logging
 from datetime import datetime
+from utils.env import load_env
+from utils.lazy import LazyObject
+from utils.metrics import DB_LATENCY, timed
+from utils.resilience import http
+from utils.supabase_bulk import BulkResult, bulk_upsert
 
-load_dotenv()
+load_env()
 
 class SupabaseClient:
     def __init__(self):
@@ -29,12 +32,13 @@ class SupabaseClient:
     def test_connection(self) -> bool:
         """Test if Supabase API is accessible"""
         try:
-            response = requests.get(f"{self.base_url}/rest/v1/", headers=self.headers, timeout=10)
+            response = http.get(f"{self.base_url}/rest/v1/", headers=self.headers, timeout=10)
             return response.status_code in [200, 404]  # 404 is OK for root endpoint
         except Exception as e:
             logging.error(f"Supabase connection test failed: {e}")
             return False
     
+    @timed(DB_LATENCY, backend="supabase", operation="get_properties")
     def get_properties(self, limit: int = 100, order_by: str = "created_at.desc") -> List[Dict]:
         """Get properties from the database"""
         try:
@@ -45,7 +49,7 @@ class SupabaseClient:
                 "limit": limit
             }
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
             response.raise_for_status()
             
             return response.json()
@@ -53,12 +57,13 @@ class SupabaseClient:
             logging.error(f"Failed to get properties: {e}")
             return []
     
+    @timed(DB_LATENCY, backend="supabase", operation="insert_property")
     def insert_property(self, property_data: Dict) -> bool:
         """Insert a new property"""
         try:
             url = f"{self.base_url}/rest/v1/properties"
             
-            response = requests.post(url, headers=self.headers, json=property_data, timeout=30)
+            response = http.post(url, headers=self.headers, json=property_data, timeout=30)
             response.raise_for_status()
             
             return True
@@ -66,18 +71,10 @@ class SupabaseClient:
             logging.error(f"Failed to insert property: {e}")
             return False
     
-    def insert_properties_bulk(self, properties: List[Dict]) -> bool:
-        """Insert multiple properties at once"""
-        try:
-            url = f"{self.base_url}/rest/v1/properties"
-            
-            response = requests.post(url, headers=self.headers, json=properties, timeout=60)
-            response.raise_for_status()
-            
-            return True
-        except Exception as e:
-            logging.error(f"Failed to insert properties bulk: {e}")
-            return False
+    @timed(DB_LATENCY, backend="supabase", operation="insert_properties_bulk")
+    def insert_properties_bulk(self, properties: List[Dict]) -> BulkResult:
+        """Insert multiple properties at once (listings already stored, by url, are updated)"""
+        return bulk_upsert(f"{self.base_url}/rest/v1/properties", self.headers, properties, on_conflict="url")
     
     def update_property(self, property_id: int, updates: Dict) -> bool:
         """Update a property by ID"""
@@ -85,7 +82,7 @@ class SupabaseClient:
             url = f"{self.base_url}/rest/v1/properties"
             params = {"id": f"eq.{property_id}"}
             
-            response = requests.patch(url, headers=self.headers, params=params, json=updates, timeout=30)
+            response = http.patch(url, headers=self.headers, params=params, json=updates, timeout=30)
             response.raise_for_status()
             
             return True
@@ -93,13 +90,14 @@ class SupabaseClient:
             logging.error(f"Failed to update property: {e}")
             return False
     
+    @timed(DB_LATENCY, backend="supabase", operation="get_property_by_id")
     def get_property_by_id(self, property_id: int) -> Optional[Dict]:
         """Get a single property by ID"""
         try:
             url = f"{self.base_url}/rest/v1/properties"
             params = {"id": f"eq.{property_id}", "select": "*"}
             
-            response = requests.get(url, headers=self.headers, params=params, timeout=30)
+            response = http.get(url, headers=self.headers, params=params, timeout=30)
             response.raise_for_status()
             
             results = response.json()
@@ -108,5 +106,5 @@ class SupabaseClient:
             logging.error(f"Failed to get property by ID: {e}")
             return None
 
-# Global instance
-supabase_client = SupabaseClient()
+# Global instance, created on first use (raises there if SUPABASE_ANON_KEY is missing)
+supabase_client = LazyObject(SupabaseClient)
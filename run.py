@@ -6,6 +6,7 @@ import os
 sys.path.append('C:\meshi\ApartmentHunterBot')
 
 from flaskr import create_app
+from flaskr.extensions import socketio
 
 
 app = create_app()
@@ -15,5 +16,5 @@ app = create_app()
 
 if __name__ == "__main__":
     
-    app.run(host='0.0.0.0', debug=False)
-    # socketio.run(app)
\ No newline at end of file
+    # Served through SocketIO so dashboards get new listings pushed in real time
+    socketio.run(app, host='0.0.0.0', debug=False, allow_unsafe_werkzeug=True)
\ No newline at end of file
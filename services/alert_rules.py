@@ -0,0 +1,192 @@
+"""
+User-defined alert rules evaluated against new posts.
+
+Rules are stored as a JSON list in the `alert_rules` user setting, e.g.
+    [{"subscriber": "a@b.com", "city": "חיפה", "max_price": 5000, "min_rooms": 3, "keywords": ["מרפסת"]}]
+A rule with "deals_only": true only matches posts scored as deals (see services.deal_scoring).
+
+They are compiled once into an index keyed by city, where each city holds its
+rules sorted by max_price. Evaluating a post only looks at the rules of its city
+(plus city-less rules) whose max_price is above the post price, found with a
+binary search, and all keywords are checked in one pass with a shared automaton.
+"""
+import bisect
+import json
+import logging
+import math
+import threading
+import time
+
+from services.config_cache import SETTINGS, config_cache
+from utils.keyword_matcher import AhoCorasick, normalize_hebrew
+from utils.regex_extractor import extract_city, extract_rental_info
+
+ALERT_RULES_SETTING_KEY = "alert_rules"
+REFRESH_SECONDS = 300
+ANY_CITY = "*"
+
+
+class AlertRule:
+    def __init__(self, rule_id, subscriber, city=None, max_price=None, min_rooms=None, keywords=(), deals_only=False):
+        self.rule_id = rule_id
+        self.subscriber = subscriber
+        self.city = city
+        self.max_price = float(max_price) if max_price not in (None, "") else None
+        self.min_rooms = float(min_rooms) if min_rooms not in (None, "") else None
+        self.keywords = [keyword for keyword in keywords or () if keyword]
+        self.deals_only = bool(deals_only)
+
+    @classmethod
+    def from_dict(cls, rule_id, data):
+        return cls(rule_id=rule_id,
+                   subscriber=data["subscriber"],
+                   city=data.get("city"),
+                   max_price=data.get("max_price"),
+                   min_rooms=data.get("min_rooms"),
+                   keywords=data.get("keywords"),
+                   deals_only=data.get("deals_only", False))
+
+    def to_dict(self):
+        return {
+            "subscriber": self.subscriber,
+            "city": self.city,
+            "max_price": self.max_price,
+            "min_rooms": self.min_rooms,
+            "keywords": self.keywords,
+            "deals_only": self.deals_only
+        }
+
+    def __repr__(self):
+        return f'<AlertRule {self.rule_id} - {self.subscriber}>'
+
+
+class AlertRuleEngine:
+    """Compiled, indexed set of alert rules"""
+
+    def __init__(self, client=None, refresh_seconds: int = REFRESH_SECONDS):
+        self.client = client or config_cache
+        self.refresh_seconds = refresh_seconds
+        self.rules = []
+        self._index = {}            # city -> (sorted max prices, rules in the same order)
+        self._keyword_matcher = None
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def load(self, rules_data):
+        """Compiles a list of rule dicts and swaps it in."""
+        rules = []
+        for rule_id, data in enumerate(rules_data or []):
+            try:
+                rules.append(AlertRule.from_dict(rule_id, data))
+            except (KeyError, TypeError, ValueError) as e:
+                logging.error(f"Skipping invalid alert rule {data}: {e}")
+
+        by_city = {}
+        for rule in rules:
+            city = normalize_hebrew(rule.city) if rule.city else ANY_CITY
+            by_city.setdefault(city, []).append(rule)
+
+        index = {}
+        for city, city_rules in by_city.items():
+            city_rules.sort(key=lambda rule: rule.max_price if rule.max_price is not None else math.inf)
+            prices = [rule.max_price if rule.max_price is not None else math.inf for rule in city_rules]
+            index[city] = (prices, city_rules)
+
+        keyword_matcher = AhoCorasick(
+            (normalize_hebrew(keyword), rule.rule_id) for rule in rules for keyword in rule.keywords)
+
+        with self._lock:
+            self.rules, self._index, self._keyword_matcher = rules, index, keyword_matcher
+            self._loaded_at = time.monotonic()
+        logging.info(f"Loaded {len(rules)} alert rules for {len(index)} cities")
+
+    def refresh(self, force: bool = False):
+        """Reloads the rules from the alert_rules setting if the cache expired."""
+        if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+        if force and hasattr(self.client, "invalidate"):
+            # Skip the configuration cache as well
+            self.client.invalidate(SETTINGS)
+        value = self.client.get_setting(ALERT_RULES_SETTING_KEY)
+        try:
+            self.load(json.loads(value) if value else [])
+        except ValueError as e:
+            logging.error(f"Invalid {ALERT_RULES_SETTING_KEY} setting: {e}")
+
+    def save(self, rules_data) -> bool:
+        """Stores a new rule list in user_settings and compiles it."""
+        self.load(rules_data)
+        return self.client.set_setting(ALERT_RULES_SETTING_KEY,
+                                       json.dumps([rule.to_dict() for rule in self.rules], ensure_ascii=False),
+                                       "JSON list of user alert rules")
+
+    def _candidates(self, city, price):
+        for key in (city, ANY_CITY):
+            if key is None or key not in self._index:
+                continue
+            prices, rules = self._index[key]
+            if price is None:
+                # Unknown price only satisfies rules without a price limit
+                start = bisect.bisect_left(prices, math.inf)
+            else:
+                start = bisect.bisect_left(prices, price)
+            yield from rules[start:]
+
+    def match(self, post) -> set:
+        """
+        Evaluates a post against the compiled rules.
+
+        Parameters:
+        - post: A post dict with 'content' and optionally 'city', 'price', 'rooms'.
+
+        Returns:
+        - The set of subscribers whose rules the post satisfies.
+        """
+        content = post.get("content") or ""
+        extracted = None
+        if post.get("price") is None or post.get("rooms") is None:
+            extracted = extract_rental_info(content)
+
+        price = post.get("price") if post.get("price") is not None else extracted["price"]
+        if post.get("price_flag"):
+            # A flagged price (sale price, deposit...) must not satisfy a price limit
+            price = None
+        rooms = post.get("rooms") if post.get("rooms") is not None else extracted["rooms"]
+        city = post.get("city") or extract_city(content)
+        city = normalize_hebrew(city) if city else None
+
+        subscribers = set()
+        keyword_hits = None
+        for rule in self._candidates(city, price):
+            if rule.subscriber in subscribers:
+                continue
+            if rule.min_rooms is not None and (rooms is None or rooms < rule.min_rooms):
+                continue
+            if rule.deals_only and not post.get("is_deal"):
+                continue
+            if rule.keywords:
+                if keyword_hits is None:
+                    keyword_hits = {rule_id for _, rule_id in
+                                    self._keyword_matcher.iter_matches(normalize_hebrew(content))}
+                if rule.rule_id not in keyword_hits:
+                    continue
+            subscribers.add(rule.subscriber)
+
+        return subscribers
+
+    def route(self, posts) -> dict:
+        """
+        Groups posts by the subscribers that should receive them.
+
+        Returns:
+        - A dict of subscriber -> list of posts.
+        """
+        self.refresh()
+        routed = {}
+        for post in posts:
+            for subscriber in self.match(post):
+                routed.setdefault(subscriber, []).append(post)
+        return routed
+
+
+alert_engine = AlertRuleEngine()
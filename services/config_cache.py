@@ -0,0 +1,160 @@
+"""
+In-process cache of the configuration tables (user_settings, schedules, facebook_groups).
+
+Settings are read on every scrape run and many requests; instead of one Supabase
+round trip per `get_setting`, all settings are fetched in one request and kept for
+CONFIG_CACHE_TTL seconds (the schedules and the groups likewise). Writes go to
+Supabase first and then update the cached copy (write-through), so this process
+sees its own changes immediately; changes made by other processes show up within
+the TTL. `init_app` prefetches everything in the background at startup.
+
+`ConfigCache` forwards every other attribute to the wrapped client, so it can be
+used wherever the client is.
+"""
+import logging
+import os
+import threading
+import time
+
+from flaskr.complete_supabase_client import supabase_client
+
+TTL_SECONDS = int(os.getenv("CONFIG_CACHE_TTL", 60))
+
+SETTINGS = "settings"
+SCHEDULES = "schedules"
+GROUPS = "groups"
+
+
+class ConfigCache:
+    """TTL cache over the settings, schedules and Facebook groups of a Supabase client"""
+
+    def __init__(self, client=None, ttl_seconds: int = TTL_SECONDS):
+        self.client = client or supabase_client
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}          # name -> (loaded at, value)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def _loaders(self):
+        return {
+            SETTINGS: self.client.get_settings,
+            SCHEDULES: lambda: self.client.get_schedules(active_only=False),
+            GROUPS: lambda: self.client.get_facebook_groups(active_only=False),
+        }
+
+    def _fresh(self, name):
+        entry = self._entries.get(name)
+        return entry is not None and time.monotonic() - entry[0] < self.ttl_seconds
+
+    def _get(self, name):
+        """Returns the cached value, reloading it once it expired (a failed reload keeps the old value)."""
+        if not self._fresh(name):
+            with self._lock:
+                if not self._fresh(name):
+                    value = self._loaders()[name]()
+                    if value is None:
+                        # Retry on the next TTL rather than on every call while Supabase is failing
+                        value = self._entries[name][1] if name in self._entries else None
+                    self._entries[name] = (time.monotonic(), value)
+        return self._entries[name][1]
+
+    def _put(self, name, value):
+        with self._lock:
+            loaded_at = self._entries[name][0] if name in self._entries else time.monotonic()
+            self._entries[name] = (loaded_at, value)
+
+    def invalidate(self, *names):
+        """Drops the given cached tables (all of them by default) so the next read reloads them."""
+        with self._lock:
+            for name in names or list(self._entries):
+                self._entries.pop(name, None)
+
+    def prefetch(self):
+        """Loads all settings, schedules and groups (one request each)."""
+        for name in (SETTINGS, SCHEDULES, GROUPS):
+            self.invalidate(name)
+            self._get(name)
+        settings = self._entries[SETTINGS][1]
+        logging.info(f"Config cache prefetched {len(settings or {})} settings, "
+                     f"{len(self._entries[SCHEDULES][1])} schedules and {len(self._entries[GROUPS][1])} groups")
+
+    # Settings
+
+    def get_setting(self, setting_key: str):
+        return (self._get(SETTINGS) or {}).get(setting_key)
+
+    def set_setting(self, setting_key: str, setting_value: str, description: str = None) -> bool:
+        settings = self._get(SETTINGS)
+        if description is None and settings is not None and setting_key not in settings:
+            description = f"Setting for {setting_key}"
+        success = self.client.set_setting(setting_key, setting_value, description)
+        if success and settings is not None:
+            self._put(SETTINGS, {**settings, setting_key: setting_value})
+        return success
+
+    # Schedules
+
+    def get_schedules(self, active_only: bool = True) -> list:
+        return [dict(row) for row in self._get(SCHEDULES) if not active_only or row.get("is_active")]
+
+    def save_schedule(self, schedule_data: dict) -> bool:
+        schedules = self._get(SCHEDULES)
+        schedule_id = schedules[0]["id"] if schedules else None
+        success = self.client.save_schedule(schedule_data, schedule_id=schedule_id)
+        if success:
+            if schedule_id is None:
+                # The new row's id and defaults are only known to the database
+                self.invalidate(SCHEDULES)
+            else:
+                self._patch(SCHEDULES, "id", schedule_id, schedule_data)
+        return success
+
+    def update_schedule(self, schedule_id: int, updates: dict) -> bool:
+        success = self.client.update_schedule(schedule_id, updates)
+        if success:
+            self._patch(SCHEDULES, "id", schedule_id, updates)
+        return success
+
+    # Facebook groups
+
+    def get_facebook_groups(self, active_only: bool = True) -> list:
+        return [dict(row) for row in self._get(GROUPS) if not active_only or row.get("is_active")]
+
+    def add_facebook_group(self, group_name: str, group_url: str) -> bool:
+        success = self.client.add_facebook_group(group_name, group_url)
+        if success:
+            self.invalidate(GROUPS)
+        return success
+
+    def update_facebook_group(self, group_id: int, updates: dict) -> bool:
+        success = self.client.update_facebook_group(group_id, updates)
+        if success:
+            self._patch(GROUPS, "id", group_id, updates)
+        return success
+
+    def upsert_facebook_groups(self, groups: list) -> bool:
+        success = self.client.upsert_facebook_groups(groups)
+        if success:
+            cached = {row.get("group_url") for row in self._entries.get(GROUPS, (None, []))[1]}
+            if all(group.get("group_url") in cached for group in groups):
+                for group in groups:
+                    self._patch(GROUPS, "group_url", group["group_url"], group)
+            else:
+                self.invalidate(GROUPS)
+        return success
+
+    def _patch(self, name, key, value, updates):
+        """Applies a successful update to the cached rows (copy on write)."""
+        if name not in self._entries:
+            return
+        rows = [{**row, **updates} if row.get(key) == value else row for row in self._entries[name][1]]
+        self._put(name, rows)
+
+    def init_app(self, app):
+        """Prefetches the configuration in the background so startup does not wait for Supabase."""
+        threading.Thread(target=self.prefetch, name="config-prefetch", daemon=True).start()
+
+
+config_cache = ConfigCache()
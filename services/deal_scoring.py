@@ -0,0 +1,128 @@
+"""
+Deal scoring of new listings at ingest time.
+
+The price distribution of every city x rooms bucket (and of every city as a
+fallback) over the last LOOKBACK_WEEKS weeks is rolled up from `price_stats`
+and cached in memory, refreshed every REFRESH_SECONDS. Scoring a post is then a
+dict lookup and a few comparisons, so it runs inline before the post is stored.
+
+Each scored post gets:
+- expected_price: the bucket median (or median price per m² x size when the size is known)
+- deal_score: how far below the expected price it is (0.2 = 20% cheaper, negative when pricier)
+- is_deal: at or below the bucket's 25th percentile and not flagged
+- price_flag: 'not_rent' / 'too_low' for prices outside the plausible monthly rent range
+  (sale prices, deposits, mis-extractions), 'suspect_high' / 'suspect_low' for prices far
+  outside the bucket, otherwise None
+"""
+import logging
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+from pymongo.errors import PyMongoError
+
+from flaskr.database import mongo
+from services.price_stats import rooms_bucket, week_of
+from utils.regex_extractor import extract_city
+from utils.tdigest import TDigest
+
+REFRESH_SECONDS = 600
+LOOKBACK_WEEKS = 8
+MIN_BUCKET_COUNT = 5
+MIN_MONTHLY_RENT = 800
+MAX_MONTHLY_RENT = 40000
+SUSPECT_LOW_RATIO = 0.4
+SUSPECT_HIGH_RATIO = 3.0
+ANY_ROOMS = "*"
+
+BucketStats = namedtuple("BucketStats", ["count", "p25", "median", "price_per_sqm_median"])
+
+
+class DealScorer:
+    """Scores posts against cached bucket statistics"""
+
+    def __init__(self, refresh_seconds: int = REFRESH_SECONDS):
+        self.refresh_seconds = refresh_seconds
+        self._stats = {}            # (city, rooms bucket or ANY_ROOMS) -> BucketStats
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def refresh(self, force: bool = False):
+        """Reloads the bucket statistics if the cache expired."""
+        if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+        # Only one thread reloads, the others keep scoring with the current statistics
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            now = datetime.now()
+            weeks = [week_of(now - timedelta(weeks=offset)) for offset in range(LOOKBACK_WEEKS)]
+            digests = {}
+            for document in mongo.db.price_stats.find({"week": {"$in": weeks}},
+                                                      {"city": 1, "rooms": 1, "count": 1, "price": 1,
+                                                       "price_per_sqm": 1}):
+                for key in ((document["city"], document["rooms"]), (document["city"], ANY_ROOMS)):
+                    count, price, price_per_sqm = digests.get(key, (0, TDigest(), TDigest()))
+                    price.merge(TDigest.from_list(document["price"]))
+                    price_per_sqm.merge(TDigest.from_list(document["price_per_sqm"]))
+                    digests[key] = (count + document["count"], price, price_per_sqm)
+
+            self._stats = {key: BucketStats(count, price.quantile(0.25), price.quantile(0.5),
+                                            price_per_sqm.quantile(0.5))
+                           for key, (count, price, price_per_sqm) in digests.items()}
+            logging.info(f"Loaded deal scoring statistics for {len(self._stats)} buckets")
+        except PyMongoError as e:
+            logging.error(f"Failed to load deal scoring statistics: {e}")
+        finally:
+            self._loaded_at = time.monotonic()
+            self._lock.release()
+
+    def bucket_stats(self, city, rooms):
+        """Returns the statistics of the city x rooms bucket, falling back to the whole city."""
+        for key in ((city, rooms_bucket(rooms) if rooms is not None else None), (city, ANY_ROOMS)):
+            stats = self._stats.get(key)
+            if stats and stats.count >= MIN_BUCKET_COUNT:
+                return stats
+        return None
+
+    def score(self, post) -> dict:
+        """
+        Scores a post. O(1): one cache lookup (the cache is reloaded at most every refresh_seconds).
+
+        Returns:
+        - The fields to add to the post (empty if it has no price).
+        """
+        price = post.get("price")
+        if price is None or not price > 0:
+            return {}
+        price = float(price)
+        self.refresh()
+
+        result = {"expected_price": None, "deal_score": None, "is_deal": False, "price_flag": None}
+        if price > MAX_MONTHLY_RENT:
+            result["price_flag"] = "not_rent"
+        elif price < MIN_MONTHLY_RENT:
+            result["price_flag"] = "too_low"
+
+        city = post.get("city") or extract_city(post.get("content") or "")
+        stats = self.bucket_stats(city, post.get("rooms")) if city else None
+        if stats is None or not stats.median:
+            return result
+
+        expected = stats.median
+        if post.get("size") and stats.price_per_sqm_median:
+            expected = stats.price_per_sqm_median * float(post["size"])
+        result["expected_price"] = round(expected, 2)
+        result["deal_score"] = round((expected - price) / expected, 3)
+
+        if result["price_flag"] is None:
+            if price < stats.median * SUSPECT_LOW_RATIO:
+                result["price_flag"] = "suspect_low"
+            elif price > stats.median * SUSPECT_HIGH_RATIO:
+                result["price_flag"] = "suspect_high"
+        result["is_deal"] = result["price_flag"] is None and stats.p25 is not None and price <= stats.p25
+        return result
+
+
+deal_scorer = DealScorer()
@@ -3,47 +3,34 @@ import json
 import logging
 import re
 import traceback
-from playwright.sync_api import sync_playwright
-from dotenv import load_dotenv
 import os, time, random
 # from etc import email_functions
 from utils import email_functions
 # from utils.openai_model import extract_info
-from flaskr.data_access.post_repository import  save_post_on_db
+from flaskr.data_access.post_repository import  save_new_properties, save_post_on_db
 from flaskr.database import mongo
 from flask import current_app
 from datetime import datetime, timezone
 
-from flaskr.models.post import check_exists, get_posts_by_filter, insert_post, update_posts_by_filter
-# from flaskr.extensions import socketio  # Import socketio
-
-group_links = [
-    # טירת כרמל
-    "https://www.facebook.com/groups/150903262296830/?sorting_setting=CHRONOLOGICAL",   # דירות להשכרה בטירת כרמל
-    "https://www.facebook.com/groups/171730669920083/?sorting_setting=CHRONOLOGICAL",   # דירות להשכרה בין חברים טירת כרמל
-
-    # חיפה
-    "https://www.facebook.com/groups/haifa.apartments.for.rent/",   # דירות להשכרה בחיפה
-    "https://www.facebook.com/groups/HaifaRentals/",                 # דירות להשכרה בחיפה - קבוצה נוספת
-]
-
-filters = ["להשכרה","3 חדרים","4 חדרים"]
-
-def get_env_path() -> str:
-    # Get the directory of the current script
-    current_directory = os.path.dirname(__file__)
-
-    # Navigate to the parent directory (ApartmentHunterBot)
-    parent_directory = os.path.dirname(current_directory)
-
-    # Create the full path to the .env file
-    env_path = os.path.join(parent_directory, '.env')
-
-    return env_path
-
+from flaskr.data_access.repository import get_repository
+from flaskr.models.post import (check_exists, content_exists, content_hash, existing_content_hashes,
+                                existing_post_ids, iter_post_batches, post_id_from_link, update_posts_by_filter)
+from flaskr.models.outbox import build_notification, insert_notifications
+from pymongo.errors import OperationFailure
+from services.group_policy import group_policy
+from services.group_registry import group_registry
+from services.alert_rules import alert_engine
+from services.notification_dispatcher import dispatcher
+from services.live_feed import live_feed
+from services.price_stats import price_stats
+from services.deal_scoring import deal_scorer
+from services.run_telemetry import RunTelemetry
+from utils.env import load_env
+from utils.profiling import enable_profiling, profiled
+from utils.regex_extractor import extract_city, extract_rental_info
 
 # Load the .env file
-load_dotenv(dotenv_path=get_env_path())
+load_env()
 
 def login_to_facebook(page, username, password, max_attempts=5):
     attempt = 0
@@ -86,6 +73,8 @@ def login_to_facebook(page, username, password, max_attempts=5):
 
 
 def run_multiple_logins(times, username, password):
+    from playwright.sync_api import sync_playwright  # Imported on first use, the web app never needs it
+
     # Create a Playwright session
     with sync_playwright() as p:
         for i in range(times):
@@ -142,12 +131,10 @@ def click_on_see_more_button(page, post):
         logging.error(f" |Error clicking on 'See more' button: {e}| ")
  
 def post_contain_unwanted_words(post_content):
-    for word in filters:
-        if word in post_content:
-            # print(f"\n------The word [{word}] is in [{post_content}]-------\n")
-            return True
-        
-    return False
+    result = group_registry.get_post_filter().check(post_content)
+    if not result.accepted:
+        logging.info(f"Post filtered out by {result.kind} rule [{result.rule}]")
+    return not result.accepted
     
 def get_post_link(post):
     link_elements = post.query_selector_all("a[href]")    
@@ -190,8 +177,7 @@ def scrape_group_posts(page, group_url, max_posts=10):
             # Extract text content from the post
             post_text = post.inner_text()
             post_link = get_post_link(post)
-            post_url_id = post_link.split("/")[-1]
-            post_link_exists = mongo.db.collection.find_one({"link": {"$regex": post_url_id}})
+            post_link_exists = check_exists(post_id_from_link(post_link))
             
             
             if len(post_text) > 0 and not post_link_exists:    
@@ -200,7 +186,7 @@ def scrape_group_posts(page, group_url, max_posts=10):
                     post_content = post_content_element.inner_text()
                     print(f"---\npost_text[:10]= {post_text[:10]}")
                     print(f"---\npost_text[:10]= {post_content[:10]}")
-                    post_content_exists = mongo.db.collection.find_one({"content": post_content})
+                    post_content_exists = content_exists(content_hash(post_content))
                     if (not post_contain_unwanted_words(post_content)) and not post_content_exists:
                         _post = {
                             "link": post_link,
@@ -208,7 +194,6 @@ def scrape_group_posts(page, group_url, max_posts=10):
                             "hasBeenSent": False
                         }
                         posts.append(_post)
-                        # socketio.emit("new_post", _post)
                     
                     print(":: END OF post_content ::")
                     # posts.append(post_text)
@@ -221,12 +206,9 @@ def scrape_group_posts(page, group_url, max_posts=10):
 
     return posts
 
-def mark_posts_as_sent():
-    filter_criteria = {'hasBeenSent': False}
-    update_values = {'hasBeenSent': True}
-    return update_posts_by_filter(filter_criteria, update_values)
-
 def make_login_and_get_new_posts():
+    from playwright.sync_api import sync_playwright  # Imported on first use, the web app never needs it
+
     posts = []
     with sync_playwright() as p:
         browser = p.chromium.launch(headless=True)
@@ -238,7 +220,7 @@ def make_login_and_get_new_posts():
         login_to_facebook(page, username, password)
 
         posts = []
-        for link in group_links:
+        for link in group_registry.get_group_urls():
             group_posts = scrape_group_posts(page, link)
             posts.extend(group_posts)
             pass
@@ -248,25 +230,69 @@ def make_login_and_get_new_posts():
     
     return posts
 
-def send_email_with_new_posts():
-    # Read new posts from DB ("hasBeenSend:'false'")
-    filter = {"hasBeenSent": False}
-    
-    new_posts = get_posts_by_filter(filter_criteria=filter)
+def enqueue_new_posts_email():
+    """
+    Enqueues email notifications for the posts that were not sent yet.
+
+    Each outbox document holds the exact post IDs it covers, so posts inserted
+    after this query are left for the next call. Delivery happens in the
+    background (`services.notification_dispatcher`).
+
+    Returns:
+    - The number of posts that were queued.
+    """
+    # Read new posts from DB ("hasBeenSend:'false'") that are not queued yet
+    filter = {"hasBeenSent": False, "queued": {"$ne": True}}
     
     subject = "פוסטים לדירות בפייסבוק"
-    
-    if not new_posts:
+
+    # Route posts to the subscribers whose alert rules they match.
+    # Without any alert rule, everything goes to EMAIL_RECIPIENTS as before.
+    # Posts are streamed in batches with only the routed fields, and only their _ids are kept.
+    alert_engine.refresh()
+    projection = ({"content": 1, "price": 1, "rooms": 1, "city": 1, "is_deal": 1, "price_flag": 1}
+                  if alert_engine.rules else {"_id": 1})
+    post_ids = []
+    subscriber_post_ids = {}
+    for batch in iter_post_batches(filter, projection=projection, sort=[("_id", 1)]):
+        post_ids.extend(post["_id"] for post in batch)
+        if alert_engine.rules:
+            for subscriber, posts in alert_engine.route(batch).items():
+                subscriber_post_ids.setdefault(subscriber, []).extend(post["_id"] for post in posts)
+
+    if not post_ids:
         print("No new posts found")
-        
+        return 0
+
+    print(f"\n--------- Queueing email with the new posts ({len(post_ids)} found) --------- \n")
+
+    if alert_engine.rules:
+        notifications = [build_notification([subscriber], subject, ids)
+                         for subscriber, ids in subscriber_post_ids.items()]
     else:
-        print(f"\n--------- Sending email with the new posts ({len(new_posts)} found) --------- \n")
-        msg = email_functions.format_posts_for_email(posts=new_posts)
-        
-        email_functions.send_email(subject=subject, body=msg)
-    
-        # Marking the nre posts as sent
-        mark_posts_as_sent()
+        notifications = [build_notification(email_functions.RECIPIENTS, subject, post_ids)]
+
+    routed_ids = {post_id for notification in notifications for post_id in notification["post_ids"]}
+
+    def write(session=None):
+        insert_notifications(notifications, session=session)
+        update_posts_by_filter({"_id": {"$in": post_ids}}, {"queued": True}, session=session)
+        # Posts that matched no alert rule have nothing to deliver
+        unrouted_ids = [post_id for post_id in post_ids if post_id not in routed_ids]
+        if unrouted_ids:
+            update_posts_by_filter({"_id": {"$in": unrouted_ids}}, {"hasBeenSent": True}, session=session)
+
+    try:
+        with mongo.cx.start_session() as session:
+            session.with_transaction(lambda s: write(session=s))
+    except OperationFailure as e:
+        # Standalone servers do not support transactions. The outbox is written first,
+        # a duplicate enqueue is harmless since delivery skips posts already sent.
+        logging.warning(f"Mongo transactions unavailable ({e}), enqueueing without a transaction")
+        write()
+
+    dispatcher.wake()
+    return len(post_ids)
         
     
 def run_scraper():
@@ -279,7 +305,37 @@ def run_scraper():
     
     return new_posts
 
-def scrape_and_store_posts():
+def get_groups_to_scrape(only_due=False):
+    """
+    Returns the groups to visit in this run.
+
+    Parameters:
+    - only_due: If True, only groups whose adaptive interval elapsed are returned,
+      busiest first. Otherwise every active group is returned.
+    """
+    group_urls = group_registry.get_group_urls()
+    if not only_due:
+        return group_urls
+
+    if not group_policy.seeded:
+        group_policy.seed_from_groups(group_registry.get_groups())
+
+    return group_policy.due_groups(group_urls)
+
+@profiled("scrape_and_store_posts")
+def scrape_and_store_posts(max_posts=None, spread_seconds=None, only_due_groups=False):
+    """
+    Logs in, scrapes the groups of `group_registry` and stores the new posts.
+
+    Parameters:
+    - max_posts: Stop visiting groups once this many new posts were stored (None = no limit).
+    - spread_seconds: Time window to spread the group visits over, instead of hitting
+      all groups in a burst.
+    - only_due_groups: Visit only the groups that are due according to `group_policy`.
+
+    Returns:
+    - The total number of new posts stored.
+    """
     print(f"\n---------\nscrape_and_store_posts()\n---------\n")
     start_time = time.time()
     
@@ -288,82 +344,170 @@ def scrape_and_store_posts():
     run_id = str(uuid.uuid4())
     total_posts_scraped = 0
 
-    with sync_playwright() as p:
-        print("Starting browser...")
-        browser = p.chromium.launch(headless=True)
-        page = browser.new_page()
-        
-        # Login:
-        username = os.getenv("FB_USERNAME")
-        password = os.getenv("FB_PASSWORD")
-        
-        print("Logging in...")
-        login_to_facebook(page, username, password)
-        
-        # Save posts on db
-        print("Scraping posts...")
-        for link in group_links:
-            print("------------")
-            print(f'link= {link}')
-            try:
-                posts_scraped = collect_group_posts_to_sql_db(page, link, run_id=run_id)
-                print(f"Total posts scraped from {link}: {posts_scraped}")
-                total_posts_scraped += posts_scraped
-            except Exception as e:
-                logging.error(f"Error scraping posts from {link}: {e}")
-                time.sleep(random.randint(10, 30))
-                continue
-    
+    links_to_scrape = get_groups_to_scrape(only_due=only_due_groups)
+    if not links_to_scrape:
+        print("No group is due for scraping")
+        return 0
+    group_spacing = spread_seconds / max(len(links_to_scrape) - 1, 1) if spread_seconds else None
+
+    telemetry = RunTelemetry(run_id)
+    status, error_message = "completed", None
+
+    try:
+        from playwright.sync_api import sync_playwright  # Imported on first use, the web app never needs it
+
+        with sync_playwright() as p:
+            print("Starting browser...")
+            browser = p.chromium.launch(headless=True)
+            page = browser.new_page()
+            telemetry.attach_to_page(page)
+            
+            # Login:
+            username = os.getenv("FB_USERNAME")
+            password = os.getenv("FB_PASSWORD")
+            
+            print("Logging in...")
+            with telemetry.phase("login"):
+                login_to_facebook(page, username, password)
+            
+            # Save posts on db
+            print("Scraping posts...")
+            for index, link in enumerate(links_to_scrape):
+                if max_posts is not None and total_posts_scraped >= max_posts:
+                    print(f"Reached max_posts ({max_posts}), skipping the remaining groups")
+                    break
+
+                if group_spacing and index > 0:
+                    time.sleep(random.uniform(0.5, 1.5) * group_spacing)
+
+                print("------------")
+                print(f'link= {link}')
+                with telemetry.group(link):
+                    try:
+                        posts_scraped = collect_group_posts_to_sql_db(page, link, run_id=run_id, telemetry=telemetry)
+                        print(f"Total posts scraped from {link}: {posts_scraped}")
+                        group_policy.record(link, posts_scraped)
+                        group_registry.record_run(link, posts_scraped)
+                        total_posts_scraped += posts_scraped
+                    except Exception as e:
+                        logging.error(f"Error scraping posts from {link}: {e}")
+                        telemetry.record_error(e)
+                        time.sleep(random.randint(10, 30))
+                        continue
+    except Exception as e:
+        status, error_message = "failed", str(e)
+        raise
+    finally:
+        group_registry.flush_run_stats()
+        price_stats.flush()
+        telemetry.flush(status=status, error_message=error_message)
+
     print(f"Scraping complete. Total posts scraped: {total_posts_scraped}")
+    return total_posts_scraped
 
-def collect_group_posts_to_sql_db(page, group_url, max_posts=10, run_id=None):
+def collect_group_posts_to_sql_db(page, group_url, max_posts=10, run_id=None, telemetry=None):
+    telemetry = telemetry or RunTelemetry(run_id)
     logging.info(f"Collecting posts from {group_url}")
     print(f"Collecting posts from {group_url}")
-    page.goto(group_url, wait_until="networkidle")
-    time.sleep(random.randint(5, 10))  # Wait for the page to load
-    
-    post_elements = page.query_selector_all("div[role='article']")
-    
-    # Scroll down to load more posts
-    if len(post_elements) < 5:
-        page.evaluate("window.scrollBy(0, document.body.scrollHeight)")
-        time.sleep(random.randint(2, 4))  # Give some time for posts to load
+    with telemetry.phase("navigation", group_url):
+        page.goto(group_url, wait_until="networkidle")
+        time.sleep(random.randint(5, 10))  # Wait for the page to load
+        
         post_elements = page.query_selector_all("div[role='article']")
+        
+        # Scroll down to load more posts
+        if len(post_elements) < 5:
+            page.evaluate("window.scrollBy(0, document.body.scrollHeight)")
+            time.sleep(random.randint(2, 4))  # Give some time for posts to load
+            post_elements = page.query_selector_all("div[role='article']")
             
+    with telemetry.phase("extraction", group_url):
+        return _store_group_posts(page, group_url, post_elements, run_id, telemetry)
+
+def _store_group_posts(page, group_url, post_elements, run_id, telemetry):
     # Clear empty posts
     post_elements = [post for post in post_elements if len(post.inner_text()) > 0]
     
     logging.info(f"Collected {len(post_elements)} posts from {group_url}")
+    telemetry.incr("posts_seen", len(post_elements), group_url=group_url)
     
-    scraped_post_count = 0
+    # Read the link and content of every post first, so the group is deduplicated
+    # with one batched lookup instead of one per post
+    collected = []
     for post in post_elements:
         logging.info(f"Collecting post from {group_url}")
         try:
             click_on_see_more_button(page=page, post=post)
             post_text = post.inner_text()
             post_link = get_post_link(post)
-            post_url_id = post_link.split("/")[-1]
             
             if len(post_text) > 0:   
                 post_content_element = post.query_selector("div[data-ad-preview='message']")
-                check_if_post_exists_in_db = check_exists(f'posts/{post_url_id}')
-                if post_content_element and not check_if_post_exists_in_db:  
-                    post_content = post_content_element.inner_text()
-                    post_content_exists = mongo.db.collection.find_one({"content": post_content})
-                    _post = {
-                        "link": post_link,
-                        "content": post_content,
-                        "hasBeenSent": False,
-                        "date_posted": datetime.now(),
-                        "run_id": run_id
-                    }
-                    insert_post(_post)
-                    scraped_post_count += 1
-
+                post_content = post_content_element.inner_text() if post_content_element else None
+                collected.append((post_link, post_id_from_link(post_link), post_content))
                     
         except Exception as e:
             print(f"Error extracting post: {e}")
             traceback.print_exc()
+            telemetry.record_error(e, group_url=group_url)
+
+    # Posts with a link are deduplicated by post ID, posts without one by their content
+    known_post_ids = existing_post_ids(post_id for _, post_id, _ in collected)
+    known_hashes = existing_content_hashes(content_hash(post_content) for _, post_id, post_content in collected
+                                           if not post_id and post_content)
+
+    new_posts = {}
+    for post_link, post_id, post_content in collected:
+        post_content_hash = content_hash(post_content) if post_content else None
+        key = post_id or post_content_hash
+        if post_id in known_post_ids or (not post_id and post_content_hash in known_hashes) or key in new_posts:
+            telemetry.incr("dedup_hits", group_url=group_url)
+            continue
+        if not post_content or post_contain_unwanted_words(post_content):
+            continue
+        try:
+            _post = {
+                "link": post_link,
+                "post_id": post_id,
+                "content": post_content,
+                "content_hash": post_content_hash,
+                "hasBeenSent": False,
+                "date_posted": datetime.now(),
+                "group_url": group_url,
+                "run_id": run_id
+            }
+            # Extract the fields alert rules are evaluated on
+            _post.update(extract_rental_info(post_content))
+            _post["city"] = extract_city(post_content)
+            _post.update(deal_scorer.score(_post))
+            new_posts[key] = _post
+        except Exception as e:
+            print(f"Error extracting post: {e}")
+            traceback.print_exc()
+            telemetry.record_error(e, group_url=group_url)
+
+    # Store the group's new posts in one batch (posts without a link are keyed by their content).
+    # Posts inserted by a concurrent run since the lookup above are left untouched.
+    posts = list(new_posts.values())
+    repository = get_repository("posts")
+    inserted_posts = []
+    for key in ("post_id", "content_hash"):
+        batch = [_post for _post in posts if (key == "post_id") == bool(_post["post_id"])]
+        if batch:
+            inserted_posts += repository.insert_new("posts", batch, key=key)
+    scraped_post_count = len(inserted_posts)
+    telemetry.incr("dedup_hits", len(posts) - scraped_post_count, group_url=group_url)
+    telemetry.incr("inserts", scraped_post_count, group_url=group_url)
+    # Only the rows that were actually inserted are new listings (and new price samples)
+    for _post in inserted_posts:
+        price_stats.add(_post)
+    # The dashboard lists the properties table: push exactly the property rows that were saved there
+    try:
+        for property_row in save_new_properties(inserted_posts):
+            live_feed.publish(property_row)
+    except Exception as e:
+        logging.error(f"Failed to save the new properties of {group_url}: {e}")
+        telemetry.record_error(e, group_url=group_url)
             
     print(f"Number of posts collected and inserted: {scraped_post_count}")
     return scraped_post_count
@@ -379,4 +523,11 @@ def main():
 
 if __name__ == "__main__":
     # main()
+    import argparse
+    parser = argparse.ArgumentParser(description="Scrape the configured Facebook groups and store the new posts.")
+    parser.add_argument("--profile", action="store_true", help="Profile the run (same as APP_PROFILE=1).")
+    parser.add_argument("--profile-memory", action="store_true", help="Also trace memory allocations.")
+    args = parser.parse_args()
+    if args.profile or args.profile_memory:
+        enable_profiling(memory=args.profile_memory)
     scrape_and_store_posts()
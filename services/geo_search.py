@@ -0,0 +1,169 @@
+"""
+In-process spatial index for geo search over the geocoded properties.
+
+Properties geocoded to a street are loaded from Supabase (only the columns the
+API returns) into a uniform lat/lon grid of CELL_DEGREES cells, rebuilt every REFRESH_SECONDS.
+A radius query only visits the cells overlapping the circle's bounding box and
+a polygon query the cells overlapping the polygon's bounding box, then filters
+exactly (haversine / ray casting) and sorts by distance. Properties located only
+by their city centroid (location_precision 'city') are left out: every listing of
+the city would share one point, inside or outside any circle as a block.
+
+The same queries can run in Postgres with the optional earthdistance index in
+complete_supabase_schema.sql.
+"""
+import logging
+import math
+import threading
+import time
+
+from flaskr.complete_supabase_client import supabase_client
+
+CELL_DEGREES = 0.01         # ~1.1 km of latitude
+REFRESH_SECONDS = 300
+EARTH_RADIUS_KM = 6371.0088
+PAGE_SIZE = 1000
+
+
+def haversine_km(lat1, lon1, lat2, lon2) -> float:
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def point_in_polygon(lat, lon, polygon) -> bool:
+    """Ray casting; polygon is a list of (lat, lon) vertices."""
+    inside = False
+    j = len(polygon) - 1
+    for i in range(len(polygon)):
+        lat_i, lon_i = polygon[i]
+        lat_j, lon_j = polygon[j]
+        if (lon_i > lon) != (lon_j > lon) and lat < (lat_j - lat_i) * (lon - lon_i) / (lon_j - lon_i) + lat_i:
+            inside = not inside
+        j = i
+    return inside
+
+
+def check_point(lat, lon):
+    """Raises ValueError unless lat is within [-90, 90] and lon within [-180, 180] (NaN/inf included)."""
+    if not (math.isfinite(lat) and math.isfinite(lon)) or not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"Invalid coordinates ({lat}, {lon})")
+
+
+def _cell(lat, lon):
+    return int(math.floor(lat / CELL_DEGREES)), int(math.floor(lon / CELL_DEGREES))
+
+
+class GeoIndex:
+    """Grid index of located properties, reloaded periodically"""
+
+    def __init__(self, client=None, refresh_seconds: int = REFRESH_SECONDS):
+        self.client = client or supabase_client
+        self.refresh_seconds = refresh_seconds
+        self._cells = {}            # (lat cell, lon cell) -> list of properties
+        self.size = 0
+        self._loaded_at = None
+        self._lock = threading.Lock()
+
+    def build(self, properties):
+        cells = {}
+        size = 0
+        for row in properties:
+            if row.get("latitude") is None or row.get("longitude") is None or row.get("location_precision") != "street":
+                continue
+            cells.setdefault(_cell(row["latitude"], row["longitude"]), []).append(row)
+            size += 1
+        self._cells, self.size = cells, size
+        self._loaded_at = time.monotonic()
+        logging.info(f"Geo index built with {size} properties in {len(cells)} cells")
+
+    def refresh(self, force: bool = False):
+        """Reloads the located properties if the index expired."""
+        if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_seconds:
+            return
+        with self._lock:
+            if not force and self._loaded_at is not None and time.monotonic() - self._loaded_at < self.refresh_seconds:
+                return
+            properties = []
+            after_id = 0
+            while True:
+                page = self.client.get_located_properties(limit=PAGE_SIZE, after_id=after_id)
+                properties.extend(page)
+                if len(page) < PAGE_SIZE:
+                    break
+                after_id = page[-1]["id"]
+            self.build(properties)
+
+    def _candidates(self, min_lat, min_lon, max_lat, max_lon):
+        min_cell_lat, min_cell_lon = _cell(min_lat, min_lon)
+        max_cell_lat, max_cell_lon = _cell(max_lat, max_lon)
+        if (max_cell_lat - min_cell_lat + 1) * (max_cell_lon - min_cell_lon + 1) > len(self._cells):
+            # A large box has more cells than the index holds: walk the occupied cells instead
+            for (cell_lat, cell_lon), rows in list(self._cells.items()):
+                if min_cell_lat <= cell_lat <= max_cell_lat and min_cell_lon <= cell_lon <= max_cell_lon:
+                    yield from rows
+            return
+        for cell_lat in range(min_cell_lat, max_cell_lat + 1):
+            for cell_lon in range(min_cell_lon, max_cell_lon + 1):
+                yield from self._cells.get((cell_lat, cell_lon), ())
+
+    @staticmethod
+    def _matches(row, max_price, min_rooms):
+        if max_price is not None and (row.get("price") is None or float(row["price"]) > max_price):
+            return False
+        if min_rooms is not None and (row.get("rooms") is None or float(row["rooms"]) < min_rooms):
+            return False
+        return True
+
+    def radius(self, lat, lon, radius_km, max_price=None, min_rooms=None, limit=100):
+        """
+        Properties within radius_km of a point, nearest first.
+
+        Returns:
+        - A list of (distance in km, property) pairs.
+
+        Raises:
+        - ValueError: When the point is not a valid coordinate or the radius is negative or not finite.
+        """
+        check_point(lat, lon)
+        if not math.isfinite(radius_km) or radius_km < 0:
+            raise ValueError(f"Invalid radius {radius_km}")
+        self.refresh()
+        delta_lat = math.degrees(radius_km / EARTH_RADIUS_KM)
+        delta_lon = delta_lat / max(math.cos(math.radians(lat)), 1e-6)
+        results = []
+        for row in self._candidates(lat - delta_lat, lon - delta_lon, lat + delta_lat, lon + delta_lon):
+            if not self._matches(row, max_price, min_rooms):
+                continue
+            distance = haversine_km(lat, lon, row["latitude"], row["longitude"])
+            if distance <= radius_km:
+                results.append((distance, row))
+        results.sort(key=lambda result: result[0])
+        return results[:limit]
+
+    def polygon(self, polygon, max_price=None, min_rooms=None, limit=100, origin=None):
+        """
+        Properties inside a polygon of (lat, lon) vertices, sorted by distance from
+        origin (default: the polygon's vertex centroid).
+
+        Returns:
+        - A list of (distance in km, property) pairs.
+
+        Raises:
+        - ValueError: When a vertex or the origin is not a valid coordinate.
+        """
+        for lat, lon in list(polygon) + ([origin] if origin else []):
+            check_point(lat, lon)
+        self.refresh()
+        lats = [vertex[0] for vertex in polygon]
+        lons = [vertex[1] for vertex in polygon]
+        origin_lat, origin_lon = origin or (sum(lats) / len(lats), sum(lons) / len(lons))
+        results = []
+        for row in self._candidates(min(lats), min(lons), max(lats), max(lons)):
+            if self._matches(row, max_price, min_rooms) and point_in_polygon(row["latitude"], row["longitude"], polygon):
+                results.append((haversine_km(origin_lat, origin_lon, row["latitude"], row["longitude"]), row))
+        results.sort(key=lambda result: result[0])
+        return results[:limit]
+
+
+geo_index = GeoIndex()
@@ -0,0 +1,48 @@
+"""
+Backfill of property coordinates.
+
+New properties are geocoded when they are inserted; `flask geocode-properties`
+pages through the properties that have no coordinates (or no location precision)
+yet, geocodes each page
+in one batch (see utils.geocoder) and writes the page back in one request.
+"""
+import logging
+
+from flaskr.complete_supabase_client import supabase_client
+from utils.geocoder import geocoder
+
+PAGE_SIZE = 500
+
+
+def geocode_properties(client=None) -> int:
+    """
+    Geocodes every property without coordinates.
+
+    Returns:
+    - The number of properties that got coordinates.
+    """
+    client = client or supabase_client
+    located = 0
+    after_id = 0
+    while True:
+        rows = client.get_properties_without_location(limit=PAGE_SIZE, after_id=after_id)
+        if not rows:
+            break
+        after_id = rows[-1]["id"]
+
+        updates = [{"id": row["id"], "latitude": row["latitude"], "longitude": row["longitude"],
+                    "location_precision": row["location_precision"]}
+                   for row in geocoder.enrich(rows) if "latitude" in row]
+        if updates:
+            located += len(client.update_property_locations(updates).succeeded)
+
+    logging.info(f"Geocoded {located} properties")
+    return located
+
+
+def init_app(app):
+    """Registers `flask geocode-properties`."""
+
+    @app.cli.command("geocode-properties")
+    def geocode_properties_command():
+        print(f"Geocoded {geocode_properties()} properties")
@@ -0,0 +1,157 @@
+"""
+Adaptive per-group scrape frequency.
+
+Each group gets its own polling interval derived from its observed posting rate:
+busy groups are visited often, quiet groups rarely, always within
+[min_interval, max_interval]. When a run has to choose, groups with the most
+expected unseen posts (rate * time since the last visit) go first.
+"""
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+from dateutil.parser import isoparse
+
+MIN_INTERVAL_MINUTES = int(os.getenv("GROUP_MIN_INTERVAL_MINUTES", 20))
+MAX_INTERVAL_MINUTES = int(os.getenv("GROUP_MAX_INTERVAL_MINUTES", 360))
+TARGET_POSTS_PER_VISIT = 3      # Visit a group roughly every time this many new posts are expected
+SMOOTHING = 0.3                 # Weight of the newest observation in the rate EWMA
+DEFAULT_RATE_PER_HOUR = 0.5     # Prior for groups we know nothing about
+
+
+def _parse_timestamp(value):
+    """
+    Parses timestamps of the facebook_groups table. Postgres prints as many fractional
+    digits as are significant (e.g. '12:00:01.12345+00:00'), which datetime.fromisoformat
+    rejects before Python 3.11, so isoparse is used. Unparseable values count as unknown.
+    """
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        parsed = value
+    else:
+        try:
+            parsed = isoparse(str(value))
+        except (ValueError, OverflowError):
+            logging.warning(f"Ignoring unparseable timestamp {value!r}")
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class GroupState:
+    def __init__(self, url, rate_per_hour=DEFAULT_RATE_PER_HOUR, last_scraped=None):
+        self.url = url
+        self.rate_per_hour = rate_per_hour
+        self.last_scraped = last_scraped
+
+    def __repr__(self):
+        return f'<GroupState {self.url} - {self.rate_per_hour:.2f}/h>'
+
+
+class AdaptiveGroupPolicy:
+    """Tracks per-group posting rates and decides which groups are due for a visit"""
+
+    def __init__(self, min_interval_minutes=MIN_INTERVAL_MINUTES, max_interval_minutes=MAX_INTERVAL_MINUTES,
+                 target_posts_per_visit=TARGET_POSTS_PER_VISIT, smoothing=SMOOTHING):
+        self.min_interval_minutes = min_interval_minutes
+        self.max_interval_minutes = max_interval_minutes
+        self.target_posts_per_visit = target_posts_per_visit
+        self.smoothing = smoothing
+        self._states = {}
+        self._lock = threading.Lock()
+        self.seeded = False
+
+    def _state(self, url):
+        state = self._states.get(url)
+        if state is None:
+            state = self._states[url] = GroupState(url)
+        return state
+
+    def seed_from_groups(self, groups):
+        """
+        Seeds the rate estimates from rows of the facebook_groups table.
+
+        Parameters:
+        - groups: A list of dicts with 'group_url', 'posts_count', 'last_scraped' and 'created_at'.
+        """
+        with self._lock:
+            for group in groups:
+                url = group.get("group_url")
+                if not url:
+                    continue
+                state = self._state(url)
+                last_scraped = _parse_timestamp(group.get("last_scraped"))
+                created_at = _parse_timestamp(group.get("created_at"))
+                state.last_scraped = state.last_scraped or last_scraped
+
+                posts_count = group.get("posts_count") or 0
+                if posts_count and last_scraped and created_at and last_scraped > created_at:
+                    hours = (last_scraped - created_at).total_seconds() / 3600
+                    state.rate_per_hour = posts_count / max(hours, 1)
+            self.seeded = True
+
+    def interval_minutes(self, url) -> float:
+        """Returns the polling interval of a group, clamped to the configured bounds."""
+        rate = self._state(url).rate_per_hour
+        if rate <= 0:
+            return self.max_interval_minutes
+        interval = self.target_posts_per_visit / rate * 60
+        return min(self.max_interval_minutes, max(self.min_interval_minutes, interval))
+
+    def expected_new_posts(self, url, now) -> float:
+        state = self._state(url)
+        if state.last_scraped is None:
+            return float("inf")
+        hours = (now - state.last_scraped).total_seconds() / 3600
+        return state.rate_per_hour * hours
+
+    def due_groups(self, urls, now=None):
+        """
+        Returns the groups that are due for a visit, busiest first.
+
+        Parameters:
+        - urls: Candidate group URLs.
+        - now: Timezone-aware current time (defaults to utcnow).
+
+        Returns:
+        - A list of group URLs ordered by expected number of unseen posts.
+        """
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            due = []
+            for url in urls:
+                state = self._state(url)
+                if state.last_scraped is not None:
+                    elapsed_minutes = (now - state.last_scraped).total_seconds() / 60
+                    if elapsed_minutes < self.interval_minutes(url):
+                        continue
+                due.append((self.expected_new_posts(url, now), url))
+
+        due.sort(key=lambda item: item[0], reverse=True)
+        return [url for _, url in due]
+
+    def record(self, url, new_posts, now=None):
+        """
+        Updates a group's rate estimate after a visit.
+
+        Parameters:
+        - url: The group URL.
+        - new_posts: Number of new posts found during the visit.
+        - now: Timezone-aware time of the visit (defaults to utcnow).
+        """
+        now = now or datetime.now(timezone.utc)
+        with self._lock:
+            state = self._state(url)
+            if state.last_scraped is not None:
+                hours = max((now - state.last_scraped).total_seconds() / 3600, 1 / 60)
+                observed_rate = new_posts / hours
+                state.rate_per_hour = (self.smoothing * observed_rate
+                                       + (1 - self.smoothing) * state.rate_per_hour)
+            state.last_scraped = now
+
+        logging.info(f"Group {url}: {new_posts} new posts, rate {state.rate_per_hour:.2f}/h, "
+                     f"next visit in {self.interval_minutes(url):.0f} minutes")
+
+
+group_policy = AdaptiveGroupPolicy()
@@ -0,0 +1,170 @@
+"""
+DB-backed registry of the Facebook groups to scrape and of the post filters.
+
+Groups come from the `facebook_groups` table and filters from the `post_filters`
+user setting (a JSON list). Both are cached in memory and refreshed at most every
+`refresh_seconds`, so the scraper picks up new groups without a redeploy while
+the per-post lookups never leave the process. Per-group run statistics are
+buffered and written back in a single upsert at the end of a run.
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+
+from services.config_cache import GROUPS, SETTINGS, config_cache
+from utils.keyword_matcher import KeywordFilter
+
+REFRESH_SECONDS = 300
+FILTERS_SETTING_KEY = "post_filters"
+INCLUDE_FILTERS_SETTING_KEY = "post_include_filters"
+
+# Used until the facebook_groups table / post_filters setting are populated.
+# The first run upserts these groups into the table.
+DEFAULT_GROUP_LINKS = [
+    # טירת כרמל
+    "https://www.facebook.com/groups/150903262296830/?sorting_setting=CHRONOLOGICAL",   # דירות להשכרה בטירת כרמל
+    "https://www.facebook.com/groups/171730669920083/?sorting_setting=CHRONOLOGICAL",   # דירות להשכרה בין חברים טירת כרמל
+
+    # חיפה
+    "https://www.facebook.com/groups/haifa.apartments.for.rent/",   # דירות להשכרה בחיפה
+    "https://www.facebook.com/groups/HaifaRentals/",                 # דירות להשכרה בחיפה - קבוצה נוספת
+]
+
+DEFAULT_FILTERS = ["להשכרה","3 חדרים","4 חדרים"]
+
+
+class GroupRegistry:
+    """Cached view over the facebook_groups table"""
+
+    def __init__(self, client=None, refresh_seconds: int = REFRESH_SECONDS,
+                 default_links=None, default_filters=None):
+        self.client = client or config_cache
+        self.refresh_seconds = refresh_seconds
+        self.default_links = list(default_links or [])
+        self.default_filters = list(default_filters or [])
+
+        self._groups = {}           # group_url -> row of facebook_groups
+        self._filters = list(self.default_filters)
+        self._include_filters = []
+        self._post_filter = KeywordFilter(exclude=self._filters)
+        self._loaded_at = None
+        self._pending_stats = {}    # group_url -> {"posts": int, "last_scraped": datetime}
+        self._lock = threading.Lock()
+
+    def _is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at > self.refresh_seconds
+
+    def refresh(self, force: bool = False):
+        """Reloads groups and filters from the database if the cache expired."""
+        if not force and not self._is_stale():
+            return
+
+        with self._lock:
+            if not force and not self._is_stale():
+                return
+            if force and hasattr(self.client, "invalidate"):
+                # Skip the configuration cache as well
+                self.client.invalidate(GROUPS, SETTINGS)
+
+            rows = self.client.get_facebook_groups(active_only=True)
+            if rows:
+                self._groups = {row["group_url"]: row for row in rows if row.get("group_url")}
+            elif not self._groups:
+                # Empty table or Supabase unreachable on first load: fall back to the defaults
+                logging.warning("No Facebook groups in the database, using the default group list")
+                self._groups = {url: {"group_url": url, "group_name": url, "posts_count": 0}
+                                for url in self.default_links}
+
+            self._filters = self._load_word_list(FILTERS_SETTING_KEY, self._filters)
+            self._include_filters = self._load_word_list(INCLUDE_FILTERS_SETTING_KEY, self._include_filters)
+            # Recompiles only when the rules changed
+            self._post_filter.load(exclude=self._filters, include=self._include_filters)
+
+            self._loaded_at = time.monotonic()
+            logging.info(f"Group registry loaded {len(self._groups)} groups and {len(self._filters)} filters")
+
+    def _load_word_list(self, setting_key, current):
+        value = self.client.get_setting(setting_key)
+        if not value:
+            return current
+        try:
+            return [word for word in json.loads(value) if word]
+        except (TypeError, ValueError) as e:
+            logging.error(f"Invalid {setting_key} setting, keeping current filters: {e}")
+            return current
+
+    def get_groups(self) -> list:
+        """Returns the cached rows of the active groups."""
+        self.refresh()
+        return list(self._groups.values())
+
+    def get_group_urls(self) -> list:
+        """Returns the URLs of the active groups."""
+        self.refresh()
+        return list(self._groups)
+
+    def get_filters(self) -> list:
+        """Returns the cached post filter words."""
+        self.refresh()
+        return self._filters
+
+    def get_post_filter(self) -> KeywordFilter:
+        """Returns the compiled include/exclude keyword filter."""
+        self.refresh()
+        return self._post_filter
+
+    def record_run(self, group_url, new_posts, scraped_at=None):
+        """Buffers the result of scraping one group until `flush_run_stats`."""
+        scraped_at = scraped_at or datetime.now(timezone.utc)
+        with self._lock:
+            stats = self._pending_stats.setdefault(group_url, {"posts": 0, "last_scraped": scraped_at})
+            stats["posts"] += new_posts
+            stats["last_scraped"] = max(stats["last_scraped"], scraped_at)
+
+    def flush_run_stats(self) -> bool:
+        """
+        Writes last_scraped / posts_count of every group visited in this run in one request.
+
+        Returns:
+        - True if the update succeeded (or there was nothing to write).
+        """
+        with self._lock:
+            pending, self._pending_stats = self._pending_stats, {}
+            rows = []
+            for group_url, stats in pending.items():
+                group = self._groups.get(group_url) or {"group_url": group_url, "group_name": group_url}
+                rows.append({
+                    "group_url": group_url,
+                    "group_name": group.get("group_name") or group_url,
+                    "posts_count": (group.get("posts_count") or 0) + stats["posts"],
+                    "last_scraped": stats["last_scraped"].isoformat(),
+                    "updated_at": datetime.now(timezone.utc).isoformat()
+                })
+
+        if not rows:
+            return True
+
+        success = self.client.upsert_facebook_groups(rows)
+        with self._lock:
+            if success:
+                # The cached groups are replaced by updated copies, never changed in place
+                for row in rows:
+                    group = self._groups.get(row["group_url"])
+                    if group is not None:
+                        self._groups[row["group_url"]] = {**group, "posts_count": row["posts_count"],
+                                                          "last_scraped": row["last_scraped"]}
+            else:
+                # Keep the stats for the next flush, merged with what was recorded meanwhile
+                for group_url, stats in pending.items():
+                    merged = self._pending_stats.setdefault(
+                        group_url, {"posts": 0, "last_scraped": stats["last_scraped"]})
+                    merged["posts"] += stats["posts"]
+                    merged["last_scraped"] = max(merged["last_scraped"], stats["last_scraped"])
+        if not success:
+            logging.error(f"Failed to record run stats for {len(rows)} groups, keeping them for the next flush")
+        return success
+
+
+group_registry = GroupRegistry(default_links=DEFAULT_GROUP_LINKS, default_filters=DEFAULT_FILTERS)
@@ -0,0 +1,94 @@
+"""
+Real-time push of newly saved listings to the dashboards.
+
+After the scraper saves the properties of its new posts it calls
+`live_feed.publish(property_row)` with each saved row, which only puts it on a
+bounded in-memory queue and never blocks. A SocketIO background task, started by
+`init_app`, drains the queue and broadcasts each listing as a `new_post` event to
+every connected `apartments.html` viewer, in the row shape of /api/apartments so
+a pushed row is the same row the table shows after a refresh. Without a running
+drain (the CLI scraper has no Flask app) `publish` does nothing.
+
+Broadcasts only reach the viewers connected to the same process unless
+SOCKETIO_MESSAGE_QUEUE points SocketIO at a shared message queue (Redis), so a
+multi-worker deployment needs it; otherwise run the app as a single process.
+"""
+import logging
+import queue
+from datetime import datetime
+
+from pytz import timezone
+
+from flaskr.extensions import socketio
+
+MAX_QUEUE_SIZE = 1000
+ISRAEL_TZ = timezone('Asia/Jerusalem')
+
+
+def to_apartment_row(property_row) -> dict:
+    """Converts a saved properties row into the row shape returned by /api/apartments."""
+    created_at = property_row.get('created_at')
+    if isinstance(created_at, datetime):
+        if created_at.tzinfo is None:
+            created_at = created_at.replace(tzinfo=timezone('UTC'))
+        created_at = created_at.astimezone(ISRAEL_TZ).strftime('%d-%m-%Y %H:%M:%S')
+
+    return {
+        'description': property_row.get('description') or '',
+        'address': property_row.get('address') or '',
+        'price': float(property_row['price']) if property_row.get('price') is not None else None,
+        'rooms': property_row.get('rooms'),
+        'size': property_row.get('size'),
+        'phone': property_row.get('phone') or '',
+        'city': property_row.get('city') or '',
+        'url': property_row.get('url') or '',
+        'latitude': property_row.get('latitude'),
+        'longitude': property_row.get('longitude'),
+        'created_at': created_at or ''
+    }
+
+
+class LiveFeed:
+    """Non-blocking fan-out of new listings over SocketIO"""
+
+    def __init__(self, max_queue_size: int = MAX_QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize=max_queue_size)
+        self._started = False
+        self.dropped = 0
+
+    def init_app(self, app):
+        if self._started:
+            return
+        socketio.start_background_task(self._drain)
+        self._started = True
+
+    def publish(self, property_row):
+        """
+        Queues a saved listing for broadcast. Does nothing when no drain is running and
+        drops the listing if the queue is full instead of blocking.
+        """
+        if not self._started:
+            return
+        try:
+            self._queue.put_nowait(to_apartment_row(property_row))
+        except queue.Full:
+            self.dropped += 1
+            logging.warning(f"Live feed queue is full, dropped {self.dropped} listings so far")
+
+    def queue_size(self) -> int:
+        return self._queue.qsize()
+
+    def _drain(self):
+        while True:
+            try:
+                row = self._queue.get(timeout=1)
+            except queue.Empty:
+                socketio.sleep(0)
+                continue
+            try:
+                socketio.emit("new_post", row)
+            except Exception as e:
+                logging.error(f"Failed to broadcast new listing: {e}")
+
+
+live_feed = LiveFeed()
@@ -0,0 +1,169 @@
+"""
+Background delivery of queued email notifications (transactional outbox).
+
+The scraper path only enqueues outbox documents holding the exact post IDs to
+send. This dispatcher claims them one at a time, sends each recipient a digest
+through `email_functions.send_digests` over the pooled SMTP connection, marks
+exactly those posts as sent to the recipients that got them and logs the result
+to the email_notifications table. Notifications with failed recipients are
+retried with exponential backoff until MAX_ATTEMPTS; the retry only emails the
+recipients that are still missing posts.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from pymongo.errors import PyMongoError
+
+from flaskr.complete_supabase_client import supabase_client
+from flaskr.models.outbox import (claim_next_notification, mark_notification_retry,
+                                  mark_notification_sent)
+from flaskr.models.post import get_posts_by_ids, mark_posts_as_sent
+from utils import email_functions
+
+POLL_SECONDS = 30
+MAX_ATTEMPTS = 6
+BASE_BACKOFF_SECONDS = 30
+MAX_BACKOFF_SECONDS = 3600
+
+
+def backoff_seconds(attempts: int) -> float:
+    """Exponential backoff with full jitter."""
+    return random.uniform(0, min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * 2 ** attempts))
+
+
+class NotificationDispatcher:
+    """Daemon thread that drains the outbox collection"""
+
+    def __init__(self, poll_seconds: int = POLL_SECONDS):
+        self.poll_seconds = poll_seconds
+        self.app = None
+        self._thread = None
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+
+    def init_app(self, app):
+        """Binds the dispatcher to a Flask app and starts it unless OUTBOX_DISPATCHER_ENABLED=false."""
+        self.app = app
+        if os.getenv("OUTBOX_DISPATCHER_ENABLED", "true").lower() in ("1", "true", "yes"):
+            self.start()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="notification-dispatcher", daemon=True)
+        self._thread.start()
+        logging.info("Notification dispatcher started")
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def wake(self):
+        """Asks the dispatcher to look at the outbox now instead of at the next poll."""
+        self._wake_event.set()
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            try:
+                with self.app.app_context():
+                    self.dispatch_pending()
+            except Exception as e:
+                logging.error(f"Notification dispatch failed: {e}")
+            self._wake_event.wait(self.poll_seconds)
+
+    def dispatch_pending(self) -> int:
+        """
+        Delivers every notification that is due and logs the run's email throughput.
+
+        Returns:
+        - The number of notifications delivered.
+        """
+        delivered = 0
+        run_stats = {"sent": 0, "failed": 0}
+        start_time = time.perf_counter()
+        while not self._stop_event.is_set():
+            notification = claim_next_notification()
+            if notification is None:
+                break
+            if self.deliver(notification, run_stats=run_stats):
+                delivered += 1
+
+        if run_stats["sent"] or run_stats["failed"]:
+            seconds = time.perf_counter() - start_time
+            emails_per_second = run_stats["sent"] / seconds if seconds > 0 else 0.0
+            logging.info(f"Dispatched {delivered} notifications: {run_stats['sent']} emails sent, "
+                         f"{run_stats['failed']} failed in {seconds:.2f}s ({emails_per_second:.1f} emails/s)")
+        return delivered
+
+    def deliver(self, notification, run_stats=None) -> bool:
+        """
+        Sends one outbox notification as a digest per recipient over the pooled SMTP connection.
+
+        Parameters:
+        - notification: The claimed outbox document.
+        - run_stats: Optional dict whose 'sent' and 'failed' email counts are incremented.
+
+        Returns:
+        - True when every recipient got their posts, False when the notification was rescheduled.
+        """
+        recipients = notification["recipients"]
+        subject = notification["subject"]
+        posts = get_posts_by_ids(notification["post_ids"], projection={"link": 1, "content": 1, "sent_to": 1})
+
+        # Each recipient only gets the posts they did not get yet (e.g. a retry after a partial send)
+        digests = {}
+        for recipient in recipients:
+            unsent = [post for post in posts if recipient not in (post.get("sent_to") or [])]
+            if unsent:
+                digests[recipient] = unsent
+
+        try:
+            failed = email_functions.send_digests(digests, subject=subject)["failed"] if digests else {}
+        except Exception as e:
+            failed = {recipient: str(e) for recipient in digests}
+        delivered = [recipient for recipient in digests if recipient not in failed]
+        if run_stats is not None:
+            run_stats["sent"] += len(delivered)
+            run_stats["failed"] += len(failed)
+
+        try:
+            for recipient in delivered:
+                mark_posts_as_sent([post["_id"] for post in digests[recipient]], [recipient])
+            if not failed:
+                mark_notification_sent(notification["_id"])
+        except PyMongoError as e:
+            # The emails went out but the claim stays 'sending' until its lease expires.
+            # Recipients whose `sent_to` was already updated are skipped by the retry.
+            logging.error(f"Notification {notification['_id']} sent but not marked: {e}")
+            return not failed
+
+        for recipient in delivered:
+            supabase_client.log_email_notification(recipient, subject, len(digests[recipient]))
+
+        if failed:
+            attempts = notification.get("attempts", 0) + 1
+            give_up = attempts >= MAX_ATTEMPTS
+            next_attempt_at = datetime.now(timezone.utc) + timedelta(seconds=backoff_seconds(attempts))
+            error = "; ".join(f"{recipient}: {reason}" for recipient, reason in failed.items())
+            mark_notification_retry(notification["_id"], attempts, error, next_attempt_at, give_up=give_up)
+            logging.error(f"Notification {notification['_id']} failed for {len(failed)} of {len(digests)} "
+                          f"recipients (attempt {attempts}): {error}")
+            if give_up:
+                for recipient in failed:
+                    supabase_client.log_email_notification(recipient, subject, len(digests[recipient]),
+                                                           status="failed")
+            return False
+
+        logging.info(f"Notification {notification['_id']} sent {len(posts)} posts to {len(digests)} recipients")
+        return True
+
+
+dispatcher = NotificationDispatcher()
@@ -0,0 +1,264 @@
+"""
+Precomputed price statistics per city x rooms x week.
+
+Every post with an extracted price is added to an in-memory rollup while the
+scraper runs; `flush()` merges the rollup into the Mongo `price_stats`
+collection (one small document per bucket holding the count, sums and t-digests
+of the price and of the price per m²). `/api/stats` answers percentile queries
+from these documents, merging weekly digests when a range is requested, so no
+query ever scans the posts.
+"""
+import logging
+from datetime import datetime, timedelta, timezone
+
+import click
+from pymongo.errors import DuplicateKeyError
+
+from flaskr.database import mongo
+from flaskr.models.indexes import REQUIRED_INDEXES
+from flaskr.models.post import find_posts
+from services.retention import ArchiveError, archived_months, iter_archive, retention_days
+from utils.regex_extractor import extract_city
+from utils.tdigest import TDigest
+
+QUANTILES = (0.1, 0.25, 0.5, 0.75, 0.9)
+MAX_UPDATE_ATTEMPTS = 5
+REBUILD_COLLECTION = "price_stats_rebuild"
+COPY_BATCH_SIZE = 1000
+
+
+def week_of(date) -> str:
+    """ISO week of a date, e.g. '2024-W19'."""
+    return date.strftime("%G-W%V")
+
+
+def rooms_bucket(rooms):
+    """Rounds rooms down to the half room (3.5 rooms stay 3.5, 3.7 becomes 3.5)."""
+    if rooms is None:
+        return None
+    return f"{int(float(rooms) * 2) / 2:g}"
+
+
+def bucket_key(city, rooms, week) -> str:
+    return f"{city}|{rooms}|{week}"
+
+
+def _new_bucket(city, rooms, week) -> dict:
+    return {"city": city, "rooms": rooms, "week": week, "count": 0, "price_sum": 0.0,
+            "price": TDigest(), "price_per_sqm": TDigest()}
+
+
+def post_bucket(post):
+    """Returns (city, rooms bucket, week) of a post, or None when it can not be bucketed."""
+    price = post.get("price")
+    # Prices flagged by deal scoring (sale prices, mis-extractions) would skew the distribution
+    if price is None or not price > 0 or post.get("price_flag"):
+        return None
+    city = post.get("city") or extract_city(post.get("content") or "")
+    rooms = rooms_bucket(post.get("rooms"))
+    if not city or rooms is None:
+        return None
+    date_posted = post.get("date_posted")
+    if not isinstance(date_posted, datetime):
+        date_posted = post["_id"].generation_time if post.get("_id") else datetime.now()
+    return city, rooms, week_of(date_posted)
+
+
+class PriceStats:
+    """Buffers per-bucket aggregates in memory and merges them into Mongo"""
+
+    def __init__(self):
+        self._pending = {}
+
+    def add(self, post) -> bool:
+        """Adds a post to its bucket. Returns False when the post has no price/city/rooms."""
+        bucket = post_bucket(post)
+        if bucket is None:
+            return False
+        key = bucket_key(*bucket)
+        pending = self._pending.get(key)
+        if pending is None:
+            pending = self._pending[key] = _new_bucket(*bucket)
+
+        price = float(post["price"])
+        pending["count"] += 1
+        pending["price_sum"] += price
+        pending["price"].add(price)
+        if post.get("size"):
+            pending["price_per_sqm"].add(price / float(post["size"]))
+        return True
+
+    def flush(self, collection=None) -> int:
+        """
+        Merges the buffered aggregates into `price_stats`.
+
+        Each bucket document carries a version; concurrent writers retry the merge
+        instead of overwriting each other.
+
+        Parameters:
+        - collection: The collection to merge into (default `price_stats`).
+
+        Returns:
+        - The number of buckets written.
+        """
+        collection = mongo.db.price_stats if collection is None else collection
+        pending, self._pending = self._pending, {}
+        written = 0
+        for key, bucket in pending.items():
+            for _ in range(MAX_UPDATE_ATTEMPTS):
+                if self._merge_bucket(collection, key, bucket):
+                    written += 1
+                    break
+            else:
+                logging.error(f"Could not update price stats bucket {key}")
+        return written
+
+    def _merge_bucket(self, collection, key, bucket) -> bool:
+        existing = collection.find_one({"_id": key})
+        version = existing["version"] if existing else 0
+        price = bucket["price"]
+        price_per_sqm = bucket["price_per_sqm"]
+        if existing:
+            price = TDigest.from_list(existing["price"]).merge(price)
+            price_per_sqm = TDigest.from_list(existing["price_per_sqm"]).merge(price_per_sqm)
+
+        document = {
+            "city": bucket["city"],
+            "rooms": bucket["rooms"],
+            "week": bucket["week"],
+            "count": bucket["count"] + (existing["count"] if existing else 0),
+            "price_sum": bucket["price_sum"] + (existing["price_sum"] if existing else 0.0),
+            "price": price.to_list(),
+            "price_per_sqm": price_per_sqm.to_list(),
+            "version": version + 1,
+            "updated_at": datetime.now(timezone.utc)
+        }
+        try:
+            result = collection.replace_one({"_id": key, "version": version}, document, upsert=True)
+        except DuplicateKeyError:
+            # Another writer created or bumped the bucket first
+            return False
+        return result.matched_count == 1 or result.upserted_id is not None
+
+
+def summarize(documents) -> dict:
+    """Merges bucket documents into one summary (count, mean and percentiles)."""
+    count = sum(document["count"] for document in documents)
+    price = TDigest()
+    price_per_sqm = TDigest()
+    for document in documents:
+        price.merge(TDigest.from_list(document["price"]))
+        price_per_sqm.merge(TDigest.from_list(document["price_per_sqm"]))
+
+    summary = {
+        "count": count,
+        "mean_price": round(sum(document["price_sum"] for document in documents) / count, 2) if count else None,
+        "price_per_sqm_median": _round(price_per_sqm.quantile(0.5))
+    }
+    for q in QUANTILES:
+        summary[f"p{int(q * 100)}"] = _round(price.quantile(q))
+    summary["median_price"] = summary["p50"]
+    return summary
+
+
+def _round(value):
+    return round(value, 2) if value is not None else None
+
+
+def get_stats(city=None, rooms=None, weeks=4, now=None) -> dict:
+    """
+    Returns the weekly buckets of the last `weeks` weeks and a summary over all of them.
+
+    Parameters:
+    - city: Optional city name.
+    - rooms: Optional number of rooms (bucketed to the half room).
+    - weeks: How many weeks back to include (the current week included).
+    """
+    now = now or datetime.now()
+    week_list = sorted({week_of(now - timedelta(weeks=offset)) for offset in range(max(weeks, 1))})
+    filter = {"week": {"$in": week_list}}
+    if city:
+        filter["city"] = city
+    if rooms is not None:
+        filter["rooms"] = rooms_bucket(rooms)
+
+    documents = list(mongo.db.price_stats.find(filter).sort([("week", 1), ("city", 1), ("rooms", 1)]))
+    return {
+        "weeks": week_list,
+        "summary": summarize(documents),
+        "buckets": [{"city": document["city"], "rooms": document["rooms"], "week": document["week"],
+                     **summarize([document])} for document in documents]
+    }
+
+
+def rebuild_price_stats(include_archives: bool = False) -> int:
+    """
+    Recomputes the buckets from the posts.
+
+    Posts older than the retention window only exist in the monthly archives, so
+    by default only the weeks after the retention cutoff week (whose posts are all
+    still in the posts collection) are rebuilt and the older buckets are kept as
+    they are. With include_archives every bucket is rebuilt from the posts
+    collection plus the archives.
+
+    The buckets are built in a scratch collection (the kept buckets copied over
+    first) that is then renamed over `price_stats` in one step, so readers never
+    see a partly rebuilt collection and a failed rebuild leaves it untouched.
+    Buckets flushed by a scraper run during the rebuild are replaced by the rebuilt ones.
+
+    Returns:
+    - The number of posts counted.
+    """
+    stats = PriceStats()
+    # Weeks up to this one may have archived posts; None rebuilds every week
+    kept_until_week = None if include_archives else week_of(datetime.now() - timedelta(days=retention_days()))
+
+    counted = 0
+    hot_ids = set()
+    for post in find_posts({"price": {"$gt": 0}},
+                           projection={"price": 1, "rooms": 1, "size": 1, "city": 1, "content": 1, "date_posted": 1,
+                                       "price_flag": 1}):
+        hot_ids.add(post["_id"])
+        bucket = post_bucket(post)
+        if bucket is not None and (kept_until_week is None or bucket[2] > kept_until_week):
+            counted += stats.add(post)
+
+    if include_archives:
+        for month in archived_months("posts"):
+            for post in iter_archive("posts", month):
+                # Rehydrated posts are in both the archive and the posts collection
+                if post["_id"] not in hot_ids:
+                    counted += stats.add(post)
+
+    scratch = mongo.db[REBUILD_COLLECTION]
+    scratch.drop()
+    for keys, options in REQUIRED_INDEXES["price_stats"]:
+        scratch.create_index(keys, **options)
+    if kept_until_week is not None:
+        batch = []
+        for document in mongo.db.price_stats.find({"week": {"$lte": kept_until_week}}):
+            batch.append(document)
+            if len(batch) >= COPY_BATCH_SIZE:
+                scratch.insert_many(batch)
+                batch = []
+        if batch:
+            scratch.insert_many(batch)
+    stats.flush(collection=scratch)
+    scratch.rename("price_stats", dropTarget=True)
+    return counted
+
+
+def init_app(app):
+    """Registers `flask rebuild-price-stats`."""
+
+    @app.cli.command("rebuild-price-stats")
+    @click.option("--include-archives", is_flag=True,
+                  help="Also read the archived posts and rebuild the weeks older than RETENTION_DAYS.")
+    def rebuild_price_stats_command(include_archives):
+        try:
+            print(f"Rebuilt price stats from {rebuild_price_stats(include_archives)} posts")
+        except ArchiveError as e:
+            raise click.ClickException(str(e))
+
+
+price_stats = PriceStats()
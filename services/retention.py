@@ -0,0 +1,280 @@
+"""
+Retention tiering for old posts.
+
+Posts older than RETENTION_DAYS (default 90) that were already sent are moved
+out of the hot Mongo `collection` into monthly gzip-compressed JSONL files in
+ARCHIVE_DIR, e.g. `/var/lib/apartments/archive/posts-2024-05.jsonl.gz`. Only
+their dedup keys stay in Mongo, in the small `post_fingerprints` collection, so
+`check_exists`/`content_exists` still recognise them. Supabase `posts` and
+`properties` rows are archived the same way into `<table>-YYYY-MM.jsonl.gz`
+when `flask archive-posts --supabase` is given.
+
+The archives are the only copy of the archived data, so ARCHIVE_DIR must be an
+absolute path to an existing (persistent) directory, and every batch is read back
+from disk and checked before it is deleted from Mongo/Supabase.
+
+Archived data can be rehydrated for a month (optionally only some post IDs)
+with `flask rehydrate-posts` / `flask rehydrate-table`.
+"""
+import glob
+import gzip
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+import click
+from bson import ObjectId, json_util
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from flaskr.complete_supabase_client import supabase_client
+from flaskr.database import mongo
+from flaskr.models.post import content_hash, iter_post_batches, post_id_from_link
+
+DEFAULT_RETENTION_DAYS = 90
+BATCH_SIZE = 1000
+SUPABASE_TABLES = ("posts", "properties")
+
+
+def retention_days() -> int:
+    return int(os.getenv("RETENTION_DAYS", DEFAULT_RETENTION_DAYS))
+
+
+class ArchiveError(RuntimeError):
+    """Raised when the archive cannot be written or does not read back intact"""
+
+
+def archive_dir() -> str:
+    """Returns ARCHIVE_DIR, which must be an absolute path to an existing directory."""
+    path = os.getenv("ARCHIVE_DIR")
+    if not path:
+        raise ArchiveError("ARCHIVE_DIR is not set")
+    if not os.path.isabs(path):
+        raise ArchiveError(f"ARCHIVE_DIR must be an absolute path, got {path!r}")
+    if not os.path.isdir(path):
+        raise ArchiveError(f"ARCHIVE_DIR {path} does not exist")
+    return path
+
+
+def archive_path(name, month) -> str:
+    return os.path.join(archive_dir(), f"{name}-{month}.jsonl.gz")
+
+
+def _document_id(document):
+    return document.get("_id", document.get("id"))
+
+
+def _append_to_archive(name, month, documents):
+    """
+    Appends documents to a monthly archive. Each call adds a gzip member, which
+    gzip readers concatenate transparently. The file is synced and the new member
+    is read back before returning, so the documents are never deleted before they
+    are durable.
+    """
+    path = archive_path(name, month)
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    with open(path, "ab") as raw:
+        # The gzip trailer is only written on close, so the member is closed before the sync
+        with gzip.GzipFile(fileobj=raw, mode="wb") as archive:
+            for document in documents:
+                archive.write((json_util.dumps(document, ensure_ascii=False) + "\n").encode("utf-8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+    _verify_archive(path, offset, documents)
+
+
+def _verify_archive(path, offset, documents):
+    """Reads the archive back from `offset` and checks it holds exactly the given documents."""
+    try:
+        with open(path, "rb") as raw:
+            raw.seek(offset)
+            with gzip.open(raw, "rt", encoding="utf-8") as archive:
+                written = [_document_id(json_util.loads(line)) for line in archive if line.strip()]
+    except (OSError, EOFError, ValueError) as e:
+        raise ArchiveError(f"{path} cannot be read back: {e}")
+    if written != [_document_id(document) for document in documents]:
+        raise ArchiveError(f"{path} holds {len(written)} of the {len(documents)} documents just archived")
+
+
+def iter_archive(name, month):
+    """Yields the documents of a monthly archive (the last copy of each _id/id wins)."""
+    path = archive_path(name, month)
+    if not os.path.exists(path):
+        return
+    documents = {}
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        for line in archive:
+            if line.strip():
+                document = json_util.loads(line)
+                documents[_document_id(document)] = document
+    yield from documents.values()
+
+
+def archived_months(name):
+    """Lists the months (YYYY-MM) that have an archive file."""
+    prefix = f"{name}-"
+    return sorted(os.path.basename(path)[len(prefix):-len(".jsonl.gz")]
+                  for path in glob.glob(archive_path(name, "*")))
+
+
+def _post_month(post) -> str:
+    date_posted = post.get("date_posted")
+    if not isinstance(date_posted, datetime):
+        date_posted = post["_id"].generation_time
+    return date_posted.strftime("%Y-%m")
+
+
+def _fingerprint(post, archived_at) -> dict:
+    return {
+        "_id": post["_id"],
+        "post_id": post.get("post_id") or post_id_from_link(post.get("link")),
+        "content_hash": post.get("content_hash") or content_hash(post.get("content")),
+        "month": _post_month(post),
+        "archived_at": archived_at
+    }
+
+
+def archive_old_posts(days=None) -> int:
+    """
+    Moves sent posts older than `days` from the hot collection to the monthly archives.
+
+    Returns:
+    - The number of posts archived.
+    """
+    days = retention_days() if days is None else days
+    cutoff = datetime.now() - timedelta(days=days)
+    filter = {
+        "hasBeenSent": True,
+        "$or": [
+            {"date_posted": {"$lt": cutoff}},
+            # Legacy posts without date_posted: use the insertion time in the ObjectId
+            {"date_posted": {"$exists": False}, "_id": {"$lt": ObjectId.from_datetime(cutoff)}}
+        ]
+    }
+
+    archived = 0
+    for batch in iter_post_batches(filter, sort=[("_id", 1)], batch_size=BATCH_SIZE):
+        by_month = {}
+        for post in batch:
+            by_month.setdefault(_post_month(post), []).append(post)
+        for month, posts in by_month.items():
+            _append_to_archive("posts", month, posts)
+
+        archived_at = datetime.now(timezone.utc)
+        mongo.db.post_fingerprints.bulk_write(
+            [UpdateOne({"_id": post["_id"]}, {"$set": _fingerprint(post, archived_at)}, upsert=True) for post in batch],
+            ordered=False)
+        mongo.db.collection.delete_many({"_id": {"$in": [post["_id"] for post in batch]}})
+        archived += len(batch)
+
+    logging.info(f"Archived {archived} posts older than {days} days")
+    return archived
+
+
+def rehydrate_posts(month, post_ids=None) -> int:
+    """
+    Restores archived posts of a month into the hot collection and drops their fingerprints.
+
+    Parameters:
+    - month: The archive month (YYYY-MM).
+    - post_ids: Optional Facebook post IDs to restore; all posts of the month by default.
+
+    Returns:
+    - The number of posts restored.
+    """
+    wanted = set(post_ids or [])
+    posts = [post for post in iter_archive("posts", month)
+             if not wanted or (post.get("post_id") or post_id_from_link(post.get("link"))) in wanted]
+    if not posts:
+        return 0
+
+    restored = 0
+    for start in range(0, len(posts), BATCH_SIZE):
+        batch = posts[start:start + BATCH_SIZE]
+        try:
+            restored += len(mongo.db.collection.insert_many(batch, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            # Posts that were already rehydrated are skipped
+            restored += e.details.get("nInserted", 0)
+        mongo.db.post_fingerprints.delete_many({"_id": {"$in": [post["_id"] for post in batch]}})
+
+    logging.info(f"Rehydrated {restored} posts from {archive_path('posts', month)}")
+    return restored
+
+
+def archive_supabase_table(table, days=None, client=None) -> int:
+    """
+    Moves rows of a Supabase table created more than `days` ago to the monthly archives.
+
+    Returns:
+    - The number of rows archived.
+    """
+    client = client or supabase_client
+    days = retention_days() if days is None else days
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+
+    archived = 0
+    after_id = 0
+    while True:
+        rows = client.get_rows_created_before(table, cutoff, limit=BATCH_SIZE, after_id=after_id)
+        if not rows:
+            break
+        after_id = rows[-1]["id"]
+
+        by_month = {}
+        for row in rows:
+            by_month.setdefault((row.get("created_at") or "")[:7] or "unknown", []).append(row)
+        for month, month_rows in by_month.items():
+            _append_to_archive(table, month, month_rows)
+
+        if not client.delete_rows(table, [row["id"] for row in rows]):
+            break
+        archived += len(rows)
+
+    logging.info(f"Archived {archived} rows of {table} older than {days} days")
+    return archived
+
+
+def rehydrate_supabase_table(table, month, client=None) -> int:
+    """Restores the archived rows of a Supabase table for one month."""
+    client = client or supabase_client
+    rows = list(iter_archive(table, month))
+    restored = 0
+    for start in range(0, len(rows), BATCH_SIZE):
+        restored += len(client.restore_rows(table, rows[start:start + BATCH_SIZE]).succeeded)
+    logging.info(f"Rehydrated {restored} rows of {table} from {archive_path(table, month)}")
+    return restored
+
+
+def init_app(app):
+    """Registers the retention commands on the Flask CLI."""
+
+    @app.cli.command("archive-posts")
+    @click.option("--days", type=int, default=None, help="Archive posts older than this (default: RETENTION_DAYS).")
+    @click.option("--supabase/--no-supabase", default=False, help="Also archive the Supabase posts/properties tables.")
+    def archive_posts_command(days, supabase):
+        try:
+            print(f"Archived {archive_old_posts(days)} Mongo posts")
+            if supabase:
+                for table in SUPABASE_TABLES:
+                    print(f"Archived {archive_supabase_table(table, days)} rows of {table}")
+        except ArchiveError as e:
+            raise click.ClickException(f"Archiving stopped, nothing more was deleted: {e}")
+
+    @app.cli.command("rehydrate-posts")
+    @click.argument("month")
+    @click.option("--post-id", "post_ids", multiple=True, help="Only restore these Facebook post IDs.")
+    def rehydrate_posts_command(month, post_ids):
+        try:
+            print(f"Rehydrated {rehydrate_posts(month, post_ids)} posts")
+        except ArchiveError as e:
+            raise click.ClickException(str(e))
+
+    @app.cli.command("rehydrate-table")
+    @click.argument("table", type=click.Choice(SUPABASE_TABLES))
+    @click.argument("month")
+    def rehydrate_table_command(table, month):
+        try:
+            print(f"Rehydrated {rehydrate_supabase_table(table, month)} rows of {table}")
+        except ArchiveError as e:
+            raise click.ClickException(str(e))
@@ -0,0 +1,110 @@
+"""
+Per-run scraper telemetry.
+
+Everything is kept in memory while the run is in progress (phase timings,
+per-group counters, bytes received by the browser) and written to the
+`scraping_logs` table in a single request when the run finishes.
+"""
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from flaskr.complete_supabase_client import supabase_client
+from utils.metrics import SCRAPER_PHASE
+
+GROUP_COUNTERS = ("posts_seen", "dedup_hits", "inserts", "errors", "bytes")
+
+
+class RunTelemetry:
+    """Collects timings and counters of one scrape run"""
+
+    def __init__(self, run_id, client=None):
+        self.run_id = run_id
+        self.client = client or supabase_client
+        self.start_time = datetime.now(timezone.utc)
+        self.phases = {}            # run-level phase -> seconds (e.g. login)
+        self.groups = {}            # group url -> {"phases": {...}, counters...}
+        self.current_group = None
+        self.errors = []
+
+    def _group(self, group_url):
+        group = self.groups.get(group_url)
+        if group is None:
+            group = self.groups[group_url] = {"phases": {}, **{counter: 0 for counter in GROUP_COUNTERS}}
+        return group
+
+    @contextmanager
+    def phase(self, name, group_url=None):
+        """Times a block and adds the duration to the run (or to a group when given)."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            phases = self._group(group_url)["phases"] if group_url else self.phases
+            phases[name] = phases.get(name, 0.0) + elapsed
+            SCRAPER_PHASE.labels(phase=name).observe(elapsed)
+
+    @contextmanager
+    def group(self, group_url):
+        """Attributes the counters and traffic of the block to a group."""
+        self.current_group = group_url
+        self._group(group_url)
+        try:
+            yield
+        finally:
+            self.current_group = None
+
+    def incr(self, counter, amount=1, group_url=None):
+        group_url = group_url or self.current_group
+        if group_url is None:
+            return
+        self._group(group_url)[counter] += amount
+
+    def record_error(self, error, group_url=None):
+        self.incr("errors", group_url=group_url)
+        self.errors.append(f"{group_url or self.current_group or 'run'}: {error}")
+
+    def attach_to_page(self, page):
+        """Counts the bytes of every response the page receives."""
+        def on_response(response):
+            try:
+                length = response.headers.get("content-length")
+                if length:
+                    self.incr("bytes", int(length))
+            except Exception:
+                pass
+
+        page.on("response", on_response)
+
+    def totals(self) -> dict:
+        return {counter: sum(group[counter] for group in self.groups.values()) for counter in GROUP_COUNTERS}
+
+    def to_log_row(self, status="completed", error_message=None) -> dict:
+        totals = self.totals()
+        end_time = datetime.now(timezone.utc)
+        return {
+            "run_id": self.run_id,
+            "start_time": self.start_time.isoformat(),
+            "end_time": end_time.isoformat(),
+            "posts_found": totals["posts_seen"],
+            "posts_processed": totals["posts_seen"] - totals["dedup_hits"],
+            "posts_saved": totals["inserts"],
+            "status": status,
+            "error_message": error_message or ("\n".join(self.errors[-20:]) or None),
+            "metrics": {
+                "duration_seconds": (end_time - self.start_time).total_seconds(),
+                "phases": self.phases,
+                "groups": self.groups,
+                "totals": totals
+            }
+        }
+
+    def flush(self, status="completed", error_message=None) -> bool:
+        """Writes the whole run to scraping_logs in one request."""
+        row = self.to_log_row(status=status, error_message=error_message)
+        metrics = row["metrics"]
+        logging.info(f"Run {self.run_id}: {metrics['duration_seconds']:.1f}s, phases={metrics['phases']}, "
+                     f"totals={metrics['totals']}")
+        return self.client.insert_scraping_log(row)
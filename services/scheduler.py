@@ -0,0 +1,279 @@
+"""
+In-process scrape scheduler driven by the `schedules` table.
+
+Replaces the external cron + `utils/run_scraper.py` -> `/get_posts` hop: a daemon
+thread polls the active schedules, computes the next fire time of each one and
+runs the scraper directly inside the Flask app context.
+"""
+import logging
+import os
+import random
+import threading
+from datetime import datetime, timedelta, time as dt_time
+
+from dateutil.parser import isoparse
+from pytz import timezone
+
+from services.config_cache import config_cache
+from services.fb_scraper import scrape_and_store_posts
+
+ISRAEL_TZ = timezone('Asia/Jerusalem')
+
+DEFAULT_INTERVAL_MINUTES = 20
+POLL_SECONDS = 30
+JITTER_RATIO = 0.2   # Up to 20% of the interval is added as random delay
+SPREAD_RATIO = 0.5   # Group visits are spread over half of the interval
+
+# Shared by the scheduler and the `/get_posts` route so two scrapes never overlap
+scrape_lock = threading.Lock()
+
+
+def parse_time(value):
+    """Parses 'HH:MM' / 'HH:MM:SS' strings coming from the schedules table."""
+    if not value:
+        return None
+    parts = [int(part) for part in str(value).split(":")[:3]]
+    return dt_time(*parts)
+
+
+def parse_date(value):
+    """Parses 'YYYY-MM-DD' strings coming from the schedules table."""
+    if not value:
+        return None
+    return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+
+
+def parse_timestamp(value):
+    """Parses ISO timestamps (e.g. last_run_at, any number of fractional digits) into aware datetimes."""
+    if not value:
+        return None
+    try:
+        moment = isoparse(str(value))
+    except (ValueError, OverflowError):
+        logging.warning(f"Ignoring unparseable schedule timestamp {value!r}")
+        return None
+    return moment if moment.tzinfo else ISRAEL_TZ.localize(moment)
+
+
+def _in_window(moment, start_time, end_time):
+    if not start_time or not end_time:
+        return True
+    current = moment.time()
+    if start_time <= end_time:
+        return start_time <= current <= end_time
+    # Window that crosses midnight (e.g. 22:00 - 06:00)
+    return current >= start_time or current <= end_time
+
+
+def _next_window_start(moment, start_time):
+    candidate = ISRAEL_TZ.localize(datetime.combine(moment.date(), start_time))
+    if candidate < moment:
+        candidate = ISRAEL_TZ.localize(datetime.combine(moment.date() + timedelta(days=1), start_time))
+    return candidate
+
+
+def is_schedule_finished(schedule, now):
+    """
+    Checks whether a schedule reached its end condition.
+
+    Parameters:
+    - schedule: A row of the schedules table.
+    - now: Timezone-aware current time.
+
+    Returns:
+    - True if the schedule should not fire anymore.
+    """
+    end_option = schedule.get("end_option") or "never"
+
+    if end_option == "on-date":
+        end_date = parse_date(schedule.get("end_date"))
+        return end_date is not None and now.astimezone(ISRAEL_TZ).date() > end_date
+
+    if end_option == "after-count":
+        max_posts = schedule.get("max_posts")
+        return max_posts is not None and (schedule.get("posts_scraped") or 0) >= max_posts
+
+    return False
+
+
+def compute_next_run(schedule, now, interval_minutes, last_run=None, jitter_ratio=JITTER_RATIO):
+    """
+    Computes the next fire time of a schedule.
+
+    Parameters:
+    - schedule: A row of the schedules table.
+    - now: Timezone-aware current time.
+    - interval_minutes: Minutes between two runs.
+    - last_run: Timezone-aware time of the previous run, if any.
+    - jitter_ratio: Fraction of the interval used as random extra delay.
+
+    Returns:
+    - A timezone-aware datetime, or None if the schedule will never fire again.
+    """
+    if is_schedule_finished(schedule, now):
+        return None
+
+    now = now.astimezone(ISRAEL_TZ)
+    start_time = parse_time(schedule.get("start_time"))
+    end_time = parse_time(schedule.get("end_time"))
+    start_option = schedule.get("start_option") or "immediately"
+
+    earliest = now
+    if start_option == "on-date":
+        start_date = parse_date(schedule.get("start_date"))
+        if start_date:
+            start_at = ISRAEL_TZ.localize(datetime.combine(start_date, start_time or dt_time(0, 0)))
+            earliest = max(earliest, start_at)
+
+    candidate = earliest
+    if last_run is not None:
+        candidate = max(candidate, last_run.astimezone(ISRAEL_TZ) + timedelta(minutes=interval_minutes))
+
+    if jitter_ratio:
+        candidate += timedelta(seconds=random.uniform(0, interval_minutes * 60 * jitter_ratio))
+
+    if start_time and not _in_window(candidate, start_time, end_time):
+        candidate = _next_window_start(candidate, start_time)
+
+    if (schedule.get("end_option") == "on-date"
+            and parse_date(schedule.get("end_date"))
+            and candidate.date() > parse_date(schedule.get("end_date"))):
+        return None
+
+    return candidate
+
+
+class ScrapeScheduler:
+    """Runs scrapes according to the active rows of the schedules table"""
+
+    def __init__(self, client=None, poll_seconds: int = POLL_SECONDS):
+        self.client = client or config_cache
+        self.poll_seconds = poll_seconds
+        self.app = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        # schedule id -> (updated_at, next run time)
+        self._next_runs = {}
+        self._last_runs = {}
+
+    def init_app(self, app):
+        """Binds the scheduler to a Flask app and starts it when SCHEDULER_ENABLED is set."""
+        self.app = app
+        if os.getenv("SCHEDULER_ENABLED", "false").lower() in ("1", "true", "yes"):
+            self.start()
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._loop, name="scrape-scheduler", daemon=True)
+        self._thread.start()
+        logging.info("Scrape scheduler started")
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def get_interval_minutes(self) -> int:
+        value = self.client.get_setting("scraping_interval")
+        try:
+            return max(1, int(value))
+        except (TypeError, ValueError):
+            return DEFAULT_INTERVAL_MINUTES
+
+    def _loop(self):
+        while not self._stop_event.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error(f"Scheduler tick failed: {e}")
+            self._stop_event.wait(self.poll_seconds)
+
+    def tick(self, now=None):
+        """Fires every schedule whose next run time has passed."""
+        now = now or datetime.now(ISRAEL_TZ)
+        interval_minutes = self.get_interval_minutes()
+        schedules = self.client.get_schedules(active_only=True)
+        active_ids = set()
+
+        for schedule in schedules:
+            schedule_id = schedule.get("id")
+            active_ids.add(schedule_id)
+            updated_at = schedule.get("updated_at")
+            if schedule_id not in self._last_runs:
+                # Continue from the last run recorded before a restart instead of firing at once
+                last_run_at = parse_timestamp(schedule.get("last_run_at"))
+                if last_run_at is not None:
+                    self._last_runs[schedule_id] = last_run_at
+
+            cached = self._next_runs.get(schedule_id)
+            if cached is None or cached[0] != updated_at:
+                next_run = compute_next_run(schedule, now, interval_minutes,
+                                            last_run=self._last_runs.get(schedule_id))
+                self._next_runs[schedule_id] = (updated_at, next_run)
+            else:
+                next_run = cached[1]
+
+            if next_run is None:
+                if is_schedule_finished(schedule, now):
+                    logging.info(f"Schedule {schedule_id} reached its end condition, deactivating")
+                    self.client.update_schedule(schedule_id, {"is_active": False})
+                continue
+
+            if now >= next_run:
+                # A skipped run (another scrape held the lock) is retried instead of counting as a run
+                if self.run_schedule(schedule, interval_minutes) is not None:
+                    self._last_runs[schedule_id] = now
+                next_run = compute_next_run(schedule, datetime.now(ISRAEL_TZ), interval_minutes,
+                                            last_run=self._last_runs.get(schedule_id))
+                self._next_runs[schedule_id] = (schedule.get("updated_at"), next_run)
+
+        # Forget schedules that were deleted or deactivated
+        for schedule_id in list(self._next_runs):
+            if schedule_id not in active_ids:
+                self._next_runs.pop(schedule_id, None)
+                self._last_runs.pop(schedule_id, None)
+
+    def run_schedule(self, schedule, interval_minutes):
+        """
+        Runs a single scrape for the given schedule, unless another scrape is running.
+
+        Returns:
+        - The number of new posts stored, or None if the run was skipped.
+        """
+        schedule_id = schedule.get("id")
+        remaining = None
+        if schedule.get("end_option") == "after-count" and schedule.get("max_posts") is not None:
+            remaining = schedule["max_posts"] - (schedule.get("posts_scraped") or 0)
+            if remaining <= 0:
+                return None
+
+        if not scrape_lock.acquire(blocking=False):
+            logging.warning(f"Schedule {schedule_id}: a scrape is already running, skipping this run")
+            return None
+
+        try:
+            logging.info(f"Schedule {schedule_id}: starting scrape")
+            with self.app.app_context():
+                new_posts = scrape_and_store_posts(max_posts=remaining,
+                                                   spread_seconds=interval_minutes * 60 * SPREAD_RATIO,
+                                                   only_due_groups=True)
+        finally:
+            scrape_lock.release()
+
+        posts_scraped = (schedule.get("posts_scraped") or 0) + (new_posts or 0)
+        updates = {
+            "posts_scraped": posts_scraped,
+            "last_run_at": datetime.now(ISRAEL_TZ).isoformat()
+        }
+        schedule.update(updates)
+        if is_schedule_finished(schedule, datetime.now(ISRAEL_TZ)):
+            updates["is_active"] = False
+        self.client.update_schedule(schedule_id, updates)
+
+        logging.info(f"Schedule {schedule_id}: scrape finished with {new_posts} new posts")
+        return new_posts or 0
+
+
+scheduler = ScrapeScheduler()
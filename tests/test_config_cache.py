@@ -0,0 +1,114 @@
+import unittest
+
+from services.config_cache import GROUPS, SETTINGS, ConfigCache
+
+
+class FakeSupabaseClient:
+    """Counts the requests of the configuration tables"""
+
+    def __init__(self):
+        self.settings = {"scraping_interval": "20", "email_recipients": "a@example.com"}
+        self.schedules = [{"id": 1, "is_active": True, "posts_scraped": 0}, {"id": 2, "is_active": False}]
+        self.groups = [{"id": 1, "group_url": "https://www.facebook.com/groups/1", "is_active": True}]
+        self.requests = []
+        self.fail = False
+
+    def get_settings(self):
+        self.requests.append("settings")
+        return None if self.fail else dict(self.settings)
+
+    def get_schedules(self, active_only=True):
+        self.requests.append("schedules")
+        return [dict(row) for row in self.schedules]
+
+    def get_facebook_groups(self, active_only=True):
+        self.requests.append("groups")
+        return [dict(row) for row in self.groups]
+
+    def set_setting(self, setting_key, setting_value, description=None):
+        self.requests.append("set_setting")
+        if self.fail:
+            return False
+        self.settings[setting_key] = setting_value
+        return True
+
+    def update_schedule(self, schedule_id, updates):
+        self.requests.append("update_schedule")
+        return not self.fail
+
+    def add_facebook_group(self, group_name, group_url):
+        self.requests.append("add_facebook_group")
+        self.groups.append({"id": 2, "group_url": group_url, "is_active": True})
+        return True
+
+    def log_email_notification(self, *args, **kwargs):
+        return "forwarded"
+
+
+class ConfigCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeSupabaseClient()
+        self.cache = ConfigCache(client=self.client, ttl_seconds=60)
+
+    def expire(self, name):
+        loaded_at, value = self.cache._entries[name]
+        self.cache._entries[name] = (loaded_at - 61, value)
+
+    def test_settings_are_read_in_one_request_per_ttl(self):
+        for _ in range(3):
+            self.assertEqual(self.cache.get_setting("scraping_interval"), "20")
+        self.assertIsNone(self.cache.get_setting("missing"))
+        self.assertEqual(self.client.requests, ["settings"])
+
+        self.client.settings["scraping_interval"] = "30"
+        self.expire(SETTINGS)
+        self.assertEqual(self.cache.get_setting("scraping_interval"), "30")
+        self.assertEqual(self.client.requests, ["settings", "settings"])
+
+    def test_failed_reload_keeps_the_cached_settings(self):
+        self.cache.get_setting("scraping_interval")
+        self.client.fail = True
+        self.expire(SETTINGS)
+        self.assertEqual(self.cache.get_setting("scraping_interval"), "20")
+        # The failed reload counts as a load, Supabase is not asked again until the next TTL
+        self.cache.get_setting("scraping_interval")
+        self.assertEqual(self.client.requests, ["settings", "settings"])
+
+    def test_writes_go_through_to_the_cached_copy(self):
+        self.cache.get_schedules()
+        self.assertTrue(self.cache.set_setting("scraping_interval", "45"))
+        self.assertTrue(self.cache.update_schedule(1, {"posts_scraped": 7}))
+
+        self.assertEqual(self.cache.get_setting("scraping_interval"), "45")
+        self.assertEqual(self.cache.get_schedules()[0]["posts_scraped"], 7)
+        self.assertEqual(self.client.requests.count("settings"), 1)
+        self.assertEqual(self.client.requests.count("schedules"), 1)
+
+    def test_failed_writes_leave_the_cache_unchanged(self):
+        self.cache.get_schedules()
+        self.client.fail = True
+        self.assertFalse(self.cache.update_schedule(1, {"posts_scraped": 7}))
+        self.assertEqual(self.cache.get_schedules()[0]["posts_scraped"], 0)
+
+    def test_active_filter_and_copies(self):
+        schedules = self.cache.get_schedules()
+        self.assertEqual([row["id"] for row in schedules], [1])
+        self.assertEqual(len(self.cache.get_schedules(active_only=False)), 2)
+
+        schedules[0]["posts_scraped"] = 99
+        self.assertEqual(self.cache.get_schedules()[0]["posts_scraped"], 0)
+
+    def test_new_group_reloads_the_groups(self):
+        self.assertEqual(len(self.cache.get_facebook_groups()), 1)
+        self.cache.add_facebook_group("Haifa", "https://www.facebook.com/groups/2")
+        self.assertNotIn(GROUPS, self.cache._entries)
+        self.assertEqual(len(self.cache.get_facebook_groups()), 2)
+        self.assertEqual(self.client.requests.count("groups"), 2)
+
+    def test_other_calls_are_forwarded_to_the_client(self):
+        self.assertEqual(self.cache.log_email_notification("a@example.com", "subject", 1), "forwarded")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,152 @@
+import smtplib
+import unittest
+from email import message_from_string
+from unittest import mock
+
+from utils import email_functions
+from utils.email_functions import SMTPConnection, build_message, send_digests
+
+
+class FakeSMTP:
+    """Stands in for smtplib.SMTP: records logins and messages, raises the queued errors"""
+
+    instances = []
+    send_errors = []            # raised (in order) by the next sendmail calls, across connections
+    noop_code = 250
+
+    def __init__(self, host, port, timeout=None):
+        self.host, self.port = host, port
+        self.logins = []
+        self.sent = []
+        self.noops = 0
+        self.closed = False
+        FakeSMTP.instances.append(self)
+
+    def login(self, username, password):
+        self.logins.append((username, password))
+
+    def noop(self):
+        self.noops += 1
+        return FakeSMTP.noop_code, b"OK"
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        if FakeSMTP.send_errors:
+            raise FakeSMTP.send_errors.pop(0)
+        self.sent.append((from_addr, list(to_addrs), msg))
+        return {}
+
+    def quit(self):
+        self.closed = True
+
+
+class SMTPTestCase(unittest.TestCase):
+
+    def setUp(self):
+        FakeSMTP.instances = []
+        FakeSMTP.send_errors = []
+        FakeSMTP.noop_code = 250
+        patcher = mock.patch.object(smtplib, "SMTP", FakeSMTP)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.connection = SMTPConnection(host="localhost", port=2525, use_ssl=False,
+                                         username="bot@example.com", password="secret")
+        self.addCleanup(self.connection.close)
+
+    def send(self, recipient="a@example.com"):
+        self.connection.send(build_message("subject", "body", [recipient]), to_addrs=[recipient])
+
+    def sent(self):
+        return [message for server in FakeSMTP.instances for message in server.sent]
+
+
+class SMTPConnectionTest(SMTPTestCase):
+
+    def test_reuses_one_connection(self):
+        self.send("a@example.com")
+        self.send("b@example.com")
+
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        server = FakeSMTP.instances[0]
+        self.assertEqual(server.logins, [("bot@example.com", "secret")])
+        self.assertEqual([to_addrs for _, to_addrs, _ in server.sent], [["a@example.com"], ["b@example.com"]])
+
+    def test_checks_idle_connection_with_noop(self):
+        self.send()
+        self.connection._last_used -= email_functions.SMTP_IDLE_CHECK_SECONDS + 1
+        FakeSMTP.noop_code = 421
+        self.send()
+
+        first, second = FakeSMTP.instances
+        self.assertEqual(first.noops, 1)
+        self.assertTrue(first.closed)
+        self.assertEqual(len(second.sent), 1)
+
+    def test_reconnects_once_when_disconnected(self):
+        FakeSMTP.send_errors = [smtplib.SMTPServerDisconnected("Connection unexpectedly closed")]
+        self.send()
+
+        self.assertEqual(len(FakeSMTP.instances), 2)
+        self.assertTrue(FakeSMTP.instances[0].closed)
+        self.assertEqual(len(self.sent()), 1)
+
+    def test_reconnects_on_socket_errors(self):
+        FakeSMTP.send_errors = [ConnectionResetError("reset by peer")]
+        self.send()
+
+        self.assertEqual(len(FakeSMTP.instances), 2)
+        self.assertEqual(len(self.sent()), 1)
+
+    def test_gives_up_after_second_disconnect(self):
+        FakeSMTP.send_errors = [smtplib.SMTPServerDisconnected("closed"), smtplib.SMTPServerDisconnected("closed")]
+        with self.assertRaises(smtplib.SMTPServerDisconnected):
+            self.send()
+        self.assertEqual(len(FakeSMTP.instances), 2)
+
+    def test_does_not_retry_smtp_errors(self):
+        for error in (smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"No such user")}),
+                      smtplib.SMTPDataError(554, b"Message rejected")):
+            with self.subTest(error=type(error).__name__):
+                FakeSMTP.send_errors = [error]
+                with self.assertRaises(type(error)):
+                    self.send()
+                # The connection is kept and the message was not sent again
+                self.assertEqual(len(FakeSMTP.instances), 1)
+                self.assertFalse(FakeSMTP.instances[0].closed)
+                self.assertEqual(FakeSMTP.send_errors, [])
+
+
+class SendDigestsTest(SMTPTestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.object(email_functions, "smtp_connection", self.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sends_one_digest_per_recipient_over_one_connection(self):
+        posts = [{"link": "https://facebook.com/groups/1/posts/2", "content": "3 rooms <b>cheap</b>"}]
+        stats = send_digests({"a@example.com": posts, "b@example.com": [], "c@example.com": posts * 2})
+
+        self.assertEqual(stats["sent"], 2)
+        self.assertEqual(stats["failed"], {})
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        recipients = [to_addrs for _, to_addrs, _ in self.sent()]
+        self.assertEqual(recipients, [["a@example.com"], ["c@example.com"]])
+
+        body = message_from_string(self.sent()[0][2]).get_payload(decode=True).decode("utf-8")
+        self.assertIn("https://facebook.com/groups/1/posts/2", body)
+        self.assertIn("&lt;b&gt;cheap&lt;/b&gt;", body)
+
+    def test_reports_rejected_recipients_and_continues(self):
+        posts = [{"link": "https://facebook.com/groups/1/posts/2", "content": "post"}]
+        FakeSMTP.send_errors = [smtplib.SMTPRecipientsRefused({"a@example.com": (550, b"No such user")})]
+        stats = send_digests({"a@example.com": posts, "b@example.com": posts})
+
+        self.assertEqual(stats["sent"], 1)
+        self.assertEqual(list(stats["failed"]), ["a@example.com"])
+        self.assertEqual([to_addrs for _, to_addrs, _ in self.sent()], [["b@example.com"]])
+        self.assertEqual(len(FakeSMTP.instances), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
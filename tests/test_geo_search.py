@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from services.geo_search import GeoIndex
+from utils.geocoder import Geocoder
+
+# The example of the /api/apartments/near route: 2 km around the Technion
+TECHNION = (32.7775, 35.0216)
+
+
+class FakeClient:
+    """Serves properties like get_located_properties: street-level rows only, by ascending id"""
+
+    def __init__(self, properties):
+        self.properties = properties
+
+    def get_located_properties(self, limit=1000, after_id=0):
+        rows = [row for row in self.properties if row.get("location_precision") == "street" and row["id"] > after_id]
+        return rows[:limit]
+
+
+class GeoSearchTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.geocoder = Geocoder(cache_path=os.path.join(directory, "geocode.sqlite3"))
+
+    def index(self, properties):
+        properties = self.geocoder.enrich([{"id": index + 1, **row} for index, row in enumerate(properties)])
+        return GeoIndex(client=FakeClient(properties))
+
+    def test_geocodes_street_address(self):
+        result = self.geocoder.geocode("חיפה", "רחוב שמחה גולן 54")
+        self.assertEqual(result.precision, "street")
+
+        fallback = self.geocoder.geocode("חיפה", "רחוב שאינו קיים 3")
+        self.assertEqual(fallback.precision, "city")
+
+    def test_radius_finds_street_geocoded_property(self):
+        index = self.index([
+            {"city": "חיפה", "address": "רחוב שמחה גולן 54", "price": 4200, "rooms": 3},
+            {"city": "חיפה", "address": "שד' הנשיא 120", "price": 6000, "rooms": 4},
+            # Only the city centroid is known: never part of a radius search
+            {"city": "חיפה", "address": "רחוב שאינו קיים 3", "price": 3000, "rooms": 2},
+        ])
+
+        results = index.radius(*TECHNION, radius_km=2)
+        self.assertEqual([row["address"] for _, row in results], ["רחוב שמחה גולן 54"])
+        self.assertLess(results[0][0], 2)
+
+        nearest_first = index.radius(*TECHNION, radius_km=5)
+        self.assertEqual([row["address"] for _, row in nearest_first], ["רחוב שמחה גולן 54", "שד' הנשיא 120"])
+        self.assertEqual(index.radius(*TECHNION, radius_km=5, max_price=5000)[0][1]["price"], 4200)
+
+    def test_polygon(self):
+        index = self.index([
+            {"city": "חיפה", "address": "שמחה גולן 54"},
+            {"city": "תל אביב", "address": "דיזנגוף 100"},
+        ])
+        around_haifa = [(32.70, 34.90), (32.70, 35.10), (32.85, 35.10), (32.85, 34.90)]
+        self.assertEqual([row["city"] for _, row in index.polygon(around_haifa)], ["חיפה"])
+
+    def test_large_box_walks_occupied_cells(self):
+        index = self.index([{"city": "חיפה", "address": "הרצל 10"}, {"city": "ירושלים", "address": "יפו 1"}])
+        index.refresh()
+        self.assertEqual(len(list(index._candidates(-89, -179, 89, 179))), 2)
+
+    def test_rejects_invalid_coordinates(self):
+        index = self.index([])
+        for lat, lon in ((float("nan"), 35.0), (91, 35.0), (32.0, -181), (32.0, float("inf"))):
+            with self.assertRaises(ValueError):
+                index.radius(lat, lon, radius_km=1)
+        with self.assertRaises(ValueError):
+            index.radius(*TECHNION, radius_km=-1)
+        with self.assertRaises(ValueError):
+            index.polygon([(0, 0), (0, 1), (100, 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
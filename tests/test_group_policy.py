@@ -0,0 +1,40 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+
+from services.group_policy import AdaptiveGroupPolicy, _parse_timestamp
+
+
+class ParseTimestampTest(unittest.TestCase):
+
+    def test_postgres_fractions(self):
+        expected = datetime(2024, 5, 1, 10, 0, 12, 123450, tzinfo=timezone.utc)
+        for value in ("2024-05-01T10:00:12.12345+00:00", "2024-05-01T10:00:12.12345Z",
+                      "2024-05-01 10:00:12.12345+00", "2024-05-01T13:00:12.12345+03:00"):
+            with self.subTest(value=value):
+                self.assertEqual(_parse_timestamp(value), expected)
+
+    def test_naive_is_utc(self):
+        self.assertEqual(_parse_timestamp("2024-05-01T10:00:00"), datetime(2024, 5, 1, 10, tzinfo=timezone.utc))
+
+    def test_unparseable_is_unknown(self):
+        self.assertIsNone(_parse_timestamp("yesterday"))
+        self.assertIsNone(_parse_timestamp(None))
+
+
+class SeedFromGroupsTest(unittest.TestCase):
+
+    def test_bad_timestamp_does_not_abort_seeding(self):
+        last_scraped = datetime.now(timezone.utc) - timedelta(hours=1)
+        policy = AdaptiveGroupPolicy()
+        policy.seed_from_groups([
+            {"group_url": "https://facebook.com/groups/1", "last_scraped": "not a date", "posts_count": 5},
+            {"group_url": "https://facebook.com/groups/2", "last_scraped": last_scraped.isoformat(),
+             "created_at": "2024-01-01T00:00:00.1+00:00", "posts_count": 5},
+        ])
+
+        self.assertIsNone(policy._states["https://facebook.com/groups/1"].last_scraped)
+        self.assertEqual(policy._states["https://facebook.com/groups/2"].last_scraped, last_scraped)
+
+
+if __name__ == "__main__":
+    unittest.main()
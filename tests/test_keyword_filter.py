@@ -0,0 +1,72 @@
+import unittest
+from unittest import mock
+
+from flaskr.data_access.repository import SQLiteRepository
+from services import fb_scraper
+from services.run_telemetry import RunTelemetry
+from utils.keyword_matcher import EXCLUDE, INCLUDE, KeywordFilter
+
+
+class KeywordFilterTest(unittest.TestCase):
+
+    def test_exclude_rule_rejects(self):
+        result = KeywordFilter(exclude=["שותף"]).check("מחפשים שותף לדירה")
+        self.assertEqual(result, (False, "שותף", EXCLUDE))
+
+    def test_include_rules_are_required_when_present(self):
+        post_filter = KeywordFilter(exclude=["מחסן"], include=["חיפה"])
+        self.assertEqual(post_filter.check("דירה בחיפה"), (True, "חיפה", INCLUDE))
+        self.assertEqual(post_filter.check("דירה בתל אביב"), (False, None, INCLUDE))
+        self.assertEqual(post_filter.check("מחסן בחיפה"), (False, "מחסן", EXCLUDE))
+
+    def test_load_swaps_the_automaton_and_include_flag_together(self):
+        post_filter = KeywordFilter(include=["חיפה"])
+        post_filter.load(exclude=["מחסן"])
+        self.assertEqual(post_filter.check("דירה בתל אביב"), (True, None, None))
+        self.assertEqual(post_filter.rules, (("מחסן",), ()))
+
+
+class FakeElement:
+
+    def __init__(self, text, link):
+        self.text, self.link = text, link
+
+    def inner_text(self):
+        return self.text
+
+    def query_selector(self, selector):
+        return self
+
+
+class StoreGroupPostsFilterTest(unittest.TestCase):
+
+    def test_filtered_posts_are_not_stored(self):
+        repository = SQLiteRepository()
+        patches = {
+            "click_on_see_more_button": lambda page, post: None,
+            "get_post_link": lambda post: post.link,
+            "existing_post_ids": lambda post_ids: set(),
+            "existing_content_hashes": lambda hashes: set(),
+            "get_repository": lambda kind: repository,
+            "save_new_properties": lambda posts: [],
+        }
+        for name, replacement in patches.items():
+            patcher = mock.patch.object(fb_scraper, name, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for target in (mock.patch.object(fb_scraper.price_stats, "add"),
+                       mock.patch.object(fb_scraper.group_registry, "get_post_filter",
+                                         return_value=KeywordFilter(exclude=["שותף"]))):
+            target.start()
+            self.addCleanup(target.stop)
+
+        posts = [FakeElement("דירת 3 חדרים בחיפה", "https://www.facebook.com/groups/1/posts/101/"),
+                 FakeElement("מחפשים שותף לדירה", "https://www.facebook.com/groups/1/posts/102/")]
+        stored = fb_scraper._store_group_posts(None, "https://www.facebook.com/groups/1", posts, "run", RunTelemetry("run"))
+
+        self.assertEqual(stored, 1)
+        self.assertEqual([post["content"] for post in repository.find("posts")], ["דירת 3 חדרים בחיפה"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from datetime import datetime, timezone
+from unittest import mock
+
+from flaskr.data_access import post_repository
+from flaskr.data_access.repository import SQLiteRepository
+from services import live_feed as live_feed_module
+from services.live_feed import LiveFeed, to_apartment_row
+
+
+class SaveNewPropertiesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = SQLiteRepository()
+        patchers = [mock.patch.object(post_repository, "get_repository", lambda kind: self.repository),
+                    mock.patch.object(post_repository.geocoder, "enrich", lambda rows: rows)]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_returns_only_the_properties_it_inserted(self):
+        posts = [{"link": "https://facebook.com/groups/1/posts/1", "content": "3 rooms in Haifa", "price": 4500,
+                  "rooms": 3, "city": "חיפה"},
+                 {"link": "https://facebook.com/groups/1/posts/2", "content": "2.5 rooms", "rooms": 2.5},
+                 {"link": None, "content": "no link"}]
+        saved = post_repository.save_new_properties(posts)
+
+        self.assertEqual([row["url"] for row in saved],
+                         ["https://facebook.com/groups/1/posts/1", "https://facebook.com/groups/1/posts/2"])
+        self.assertEqual((saved[0]["description"], saved[0]["rooms"], saved[1]["rooms"]), ("3 rooms in Haifa", 3, None))
+        # A second scrape of the same posts saves (and so publishes) nothing
+        self.assertEqual(post_repository.save_new_properties(posts), [])
+        self.assertEqual(len(self.repository.find("properties")), 2)
+
+
+class LiveFeedTest(unittest.TestCase):
+
+    def property_row(self):
+        return {"description": "3 rooms", "price": 4500, "rooms": 3, "city": "חיפה", "url": "https://example.com/1",
+                "latitude": 32.78, "longitude": 35.01, "created_at": datetime(2024, 1, 1, 10, 0, tzinfo=timezone.utc)}
+
+    def test_row_matches_the_api_apartments_shape(self):
+        row = to_apartment_row(self.property_row())
+        self.assertEqual(row["description"], "3 rooms")
+        self.assertEqual(row["url"], "https://example.com/1")
+        self.assertEqual(row["price"], 4500.0)
+        self.assertEqual(row["created_at"], "01-01-2024 12:00:00")   # Israel time, like /api/apartments
+
+    def test_publish_is_a_no_op_without_a_drain(self):
+        feed = LiveFeed(max_queue_size=1)
+        for _ in range(3):
+            feed.publish(self.property_row())
+        self.assertEqual((feed.queue_size(), feed.dropped), (0, 0))
+
+    def test_publish_queues_once_the_drain_runs(self):
+        feed = LiveFeed(max_queue_size=1)
+        with mock.patch.object(live_feed_module.socketio, "start_background_task") as start:
+            feed.init_app(app=None)
+        start.assert_called_once_with(feed._drain)
+        feed.publish(self.property_row())
+        feed.publish(self.property_row())
+        self.assertEqual((feed.queue_size(), feed.dropped), (1, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()
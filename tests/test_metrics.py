@@ -0,0 +1,61 @@
+import os
+import subprocess
+import sys
+import tempfile
+import textwrap
+import unittest
+
+from prometheus_client import generate_latest
+
+from utils.metrics import QUEUE_DEPTH, SHARED_QUEUE_DEPTH, register_queue
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class QueueDepthTest(unittest.TestCase):
+
+    def test_single_process_evaluates_queues_on_scrape(self):
+        sizes = [3]
+        register_queue("test_queue", lambda: sizes[0])
+        register_queue("test_shared_queue", lambda: 7, shared=True)
+        sizes[0] = 4
+
+        payload = generate_latest().decode()
+        self.assertIn('queue_depth{queue="test_queue"} 4.0', payload)
+        self.assertIn('shared_queue_depth{queue="test_shared_queue"} 7.0', payload)
+        self.assertEqual((QUEUE_DEPTH._multiprocess_mode, SHARED_QUEUE_DEPTH._multiprocess_mode),
+                         ("livesum", "livemostrecent"))
+
+
+class MultiprocessQueueDepthTest(unittest.TestCase):
+    """Runs workers as subprocesses: prometheus_client picks its storage at import time"""
+
+    def run_worker(self, directory, code):
+        env = dict(os.environ, PROMETHEUS_MULTIPROC_DIR=directory,
+                   PYTHONPATH=os.pathsep.join([REPO_ROOT] + [path for path in sys.path if path]))
+        result = subprocess.run([sys.executable, "-c", textwrap.dedent(code)], env=env, cwd=REPO_ROOT,
+                                capture_output=True, text=True, timeout=60)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        return result.stdout
+
+    def test_depths_of_exited_workers_are_dropped(self):
+        with tempfile.TemporaryDirectory() as directory:
+            # A worker that exits with 5 listings queued, without mark_process_dead being called
+            self.run_worker(directory, """
+                from utils.metrics import QUEUE_DEPTH, SHARED_QUEUE_DEPTH
+                QUEUE_DEPTH.labels(queue="live_feed").set(5)
+                SHARED_QUEUE_DEPTH.labels(queue="email_outbox").set(9)
+            """)
+            payload = self.run_worker(directory, """
+                from utils.metrics import register_queue, render_metrics
+                register_queue("live_feed", lambda: 2)
+                register_queue("email_outbox", lambda: 7, shared=True)
+                print(render_metrics()[0].decode())
+            """)
+
+        self.assertIn('queue_depth{queue="live_feed"} 2.0', payload)
+        self.assertIn('shared_queue_depth{queue="email_outbox"} 7.0', payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import smtplib
+import unittest
+from unittest import mock
+
+from services import notification_dispatcher
+from services.notification_dispatcher import MAX_ATTEMPTS, NotificationDispatcher
+from tests.test_email_functions import SMTPTestCase, FakeSMTP
+from utils import email_functions
+
+
+class NotificationDispatcherTest(SMTPTestCase):
+    """The outbox delivery path with in-memory posts and outbox instead of Mongo"""
+
+    def setUp(self):
+        super().setUp()
+        self.posts = {
+            1: {"_id": 1, "link": "https://facebook.com/groups/1/posts/1", "content": "post 1", "sent_to": []},
+            2: {"_id": 2, "link": "https://facebook.com/groups/1/posts/2", "content": "post 2", "sent_to": []},
+        }
+        self.outbox = []
+        self.retries = []
+        self.sent_notifications = []
+
+        def get_posts_by_ids(post_ids, projection=None):
+            return [dict(self.posts[post_id]) for post_id in post_ids]
+
+        def mark_posts_as_sent(post_ids, recipients, session=None):
+            for post_id in post_ids:
+                self.posts[post_id]["sent_to"] = self.posts[post_id]["sent_to"] + list(recipients)
+            return len(post_ids)
+
+        def claim_next_notification():
+            return self.outbox.pop(0) if self.outbox else None
+
+        patches = {
+            "get_posts_by_ids": get_posts_by_ids,
+            "mark_posts_as_sent": mark_posts_as_sent,
+            "claim_next_notification": claim_next_notification,
+            "mark_notification_sent": self.sent_notifications.append,
+            "mark_notification_retry": lambda *args, **kwargs: self.retries.append((args, kwargs)),
+            "supabase_client": mock.Mock(),
+        }
+        for name, replacement in patches.items():
+            patcher = mock.patch.object(notification_dispatcher, name, replacement)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(email_functions, "smtp_connection", self.connection)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dispatcher = NotificationDispatcher()
+
+    def notification(self, recipients=("a@example.com", "b@example.com"), attempts=0):
+        return {"_id": "n1", "recipients": list(recipients), "subject": "New apartments",
+                "post_ids": [1, 2], "attempts": attempts}
+
+    def test_sends_one_digest_per_recipient_over_the_pooled_connection(self):
+        self.outbox = [self.notification()]
+        self.assertEqual(self.dispatcher.dispatch_pending(), 1)
+
+        self.assertEqual(len(FakeSMTP.instances), 1)
+        self.assertEqual([to_addrs for _, to_addrs, _ in self.sent()], [["a@example.com"], ["b@example.com"]])
+        self.assertEqual(self.sent_notifications, ["n1"])
+        self.assertEqual(self.posts[1]["sent_to"], ["a@example.com", "b@example.com"])
+        self.assertEqual(self.retries, [])
+
+    def test_retries_only_the_failed_recipient(self):
+        FakeSMTP.send_errors = [smtplib.SMTPRecipientsRefused({"a@example.com": (450, b"Mailbox busy")})]
+        self.assertFalse(self.dispatcher.deliver(self.notification()))
+
+        self.assertEqual([to_addrs for _, to_addrs, _ in self.sent()], [["b@example.com"]])
+        self.assertEqual(self.posts[1]["sent_to"], ["b@example.com"])
+        self.assertEqual(self.sent_notifications, [])
+        (notification_id, attempts, error, _), kwargs = self.retries[0]
+        self.assertEqual((notification_id, attempts, kwargs["give_up"]), ("n1", 1, False))
+        self.assertIn("a@example.com", error)
+
+        # The retry emails the recipient that is still missing the posts, and nobody twice
+        self.assertTrue(self.dispatcher.deliver(self.notification(attempts=1)))
+        self.assertEqual([to_addrs for _, to_addrs, _ in self.sent()], [["b@example.com"], ["a@example.com"]])
+        self.assertEqual(self.sent_notifications, ["n1"])
+
+    def test_gives_up_after_max_attempts(self):
+        FakeSMTP.send_errors = [smtplib.SMTPDataError(554, b"Message rejected")]
+        self.assertFalse(self.dispatcher.deliver(self.notification(["a@example.com"], attempts=MAX_ATTEMPTS - 1)))
+
+        _, kwargs = self.retries[0]
+        self.assertTrue(kwargs["give_up"])
+        notification_dispatcher.supabase_client.log_email_notification.assert_called_once_with(
+            "a@example.com", "New apartments", 2, status="failed")
+
+    def test_already_sent_notification_is_marked_without_email(self):
+        for post in self.posts.values():
+            post["sent_to"] = ["a@example.com", "b@example.com"]
+        self.assertTrue(self.dispatcher.deliver(self.notification()))
+
+        self.assertEqual(self.sent(), [])
+        self.assertEqual(self.sent_notifications, ["n1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,191 @@
+import random
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+from flask import Flask
+
+from flaskr import routes
+from services import price_stats as price_stats_module
+from services.price_stats import PriceStats, get_stats, rebuild_price_stats, week_of
+from utils.tdigest import TDigest
+
+
+def _matches(document, filter):
+    for field, condition in filter.items():
+        value = document.get(field)
+        if isinstance(condition, dict):
+            if "$in" in condition and value not in condition["$in"]:
+                return False
+            if "$lte" in condition and not value <= condition["$lte"]:
+                return False
+        elif value != condition:
+            return False
+    return True
+
+
+class FakeCursor(list):
+
+    def sort(self, keys):
+        for field, direction in reversed(keys):
+            super().sort(key=lambda document: document[field], reverse=direction < 0)
+        return self
+
+
+class FakeCollection:
+    """The part of a pymongo collection the price stats use, keyed by _id"""
+
+    def __init__(self, database, name):
+        self.database, self.name = database, name
+        self.documents = {}
+
+    def find_one(self, filter):
+        return next(iter(self.find(filter)), None)
+
+    def find(self, filter=None, projection=None):
+        return FakeCursor(dict(document) for document in self.documents.values() if _matches(document, filter or {}))
+
+    def replace_one(self, filter, document, upsert=False):
+        existing = self.documents.get(filter["_id"])
+        if existing is not None and existing.get("version") != filter["version"]:
+            return SimpleNamespace(matched_count=0, upserted_id=None)
+        self.documents[filter["_id"]] = {"_id": filter["_id"], **document}
+        return SimpleNamespace(matched_count=int(existing is not None),
+                               upserted_id=None if existing is not None else filter["_id"])
+
+    def insert_many(self, documents):
+        for document in documents:
+            self.documents[document["_id"]] = dict(document)
+
+    def create_index(self, keys, **options):
+        self.database.collections.setdefault(self.name, self)
+
+    def drop(self):
+        self.database.collections.pop(self.name, None)
+        self.documents = {}
+
+    def rename(self, name, dropTarget=False):
+        self.database.collections.pop(self.name)
+        self.name = name
+        self.database.collections[name] = self
+
+
+class FakeDatabase:
+
+    def __init__(self):
+        self.collections = {}
+
+    def __getitem__(self, name):
+        return self.collections.setdefault(name, FakeCollection(self, name))
+
+    def __getattr__(self, name):
+        return self[name]
+
+
+class TDigestTest(unittest.TestCase):
+
+    def test_quantiles_are_close_to_the_exact_ones(self):
+        rng = random.Random(7)
+        values = [rng.uniform(2000, 12000) for _ in range(5000)]
+        digest = TDigest()
+        for value in values:
+            digest.add(value)
+
+        exact = sorted(values)
+        for q in (0.1, 0.5, 0.9):
+            self.assertAlmostEqual(digest.quantile(q), exact[int(q * len(exact))], delta=100)
+
+    def test_merge_and_serialization_keep_the_distribution(self):
+        first, second = TDigest(), TDigest()
+        for value in range(1, 501):
+            first.add(value)
+        for value in range(501, 1001):
+            second.add(value)
+        merged = TDigest.from_list(first.to_list()).merge(TDigest.from_list(second.to_list()))
+
+        self.assertEqual(merged.count, 1000)
+        self.assertAlmostEqual(merged.quantile(0.5), 500, delta=10)
+
+    def test_empty_digest_has_no_quantile(self):
+        self.assertIsNone(TDigest().quantile(0.5))
+
+
+class PriceStatsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.db = FakeDatabase()
+        patcher = mock.patch.object(price_stats_module, "mongo", SimpleNamespace(db=self.db))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.now = datetime.now()
+
+    def post(self, price, rooms=3, size=None):
+        return {"_id": f"post-{price}", "price": price, "rooms": rooms, "size": size, "city": "חיפה", "date_posted": self.now}
+
+    def test_flush_merges_into_the_stored_buckets(self):
+        for batch in ([4000, 5000], [6000]):
+            stats = PriceStats()
+            for price in batch:
+                stats.add(self.post(price, size=50))
+            stats.flush()
+
+        result = get_stats(city="חיפה", rooms=3, weeks=1, now=self.now)
+        self.assertEqual(result["summary"]["count"], 3)
+        self.assertEqual(result["summary"]["mean_price"], 5000)
+        self.assertEqual(result["summary"]["median_price"], 5000)
+        self.assertEqual(result["summary"]["price_per_sqm_median"], 100)
+
+    def test_rebuild_replaces_recent_weeks_and_keeps_archived_ones(self):
+        old_bucket = {"_id": "חיפה|3|2000-W01", "city": "חיפה", "rooms": "3", "week": "2000-W01", "count": 2,
+                      "price_sum": 8000.0, "price": [[4000, 2]], "price_per_sqm": [], "version": 1}
+        stale_bucket = {"_id": f"חיפה|3|{week_of(self.now)}", "city": "חיפה", "rooms": "3", "week": week_of(self.now),
+                        "count": 99, "price_sum": 1.0, "price": [[1, 99]], "price_per_sqm": [], "version": 7}
+        self.db.price_stats.insert_many([old_bucket, stale_bucket])
+
+        posts = [self.post(4500), self.post(5500)]
+        with mock.patch.object(price_stats_module, "find_posts", return_value=posts), \
+                mock.patch.object(price_stats_module, "retention_days", return_value=30):
+            self.assertEqual(rebuild_price_stats(), 2)
+
+        live = self.db.price_stats.documents
+        self.assertEqual(live[old_bucket["_id"]], old_bucket)
+        self.assertEqual((live[stale_bucket["_id"]]["count"], live[stale_bucket["_id"]]["price_sum"]), (2, 10000.0))
+        self.assertNotIn(price_stats_module.REBUILD_COLLECTION, self.db.collections)
+
+    def test_failed_rebuild_leaves_the_stats_untouched(self):
+        bucket = {"_id": f"חיפה|3|{week_of(self.now)}", "city": "חיפה", "rooms": "3", "week": week_of(self.now),
+                  "count": 1, "price_sum": 4000.0, "price": [[4000, 1]], "price_per_sqm": [], "version": 1}
+        self.db.price_stats.insert_many([bucket])
+
+        with mock.patch.object(price_stats_module, "find_posts", side_effect=RuntimeError("cursor killed")), \
+                mock.patch.object(price_stats_module, "retention_days", return_value=30):
+            with self.assertRaises(RuntimeError):
+                rebuild_price_stats()
+        self.assertEqual(self.db.price_stats.documents, {bucket["_id"]: bucket})
+
+
+class StatsRouteTest(unittest.TestCase):
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(routes.bp)
+        self.client = app.test_client()
+
+    def test_invalid_rooms_is_rejected(self):
+        with mock.patch.object(routes, "get_stats") as get_stats_mock:
+            for rooms in ("three", "nan", "-1"):
+                with self.subTest(rooms=rooms):
+                    self.assertEqual(self.client.get(f"/api/stats?rooms={rooms}").status_code, 400)
+            get_stats_mock.assert_not_called()
+
+    def test_rooms_is_passed_as_a_number(self):
+        with mock.patch.object(routes, "get_stats", return_value={}) as get_stats_mock:
+            self.assertEqual(self.client.get("/api/stats?city=חיפה&rooms=3.5").status_code, 200)
+            self.assertEqual(self.client.get("/api/stats").status_code, 200)
+        self.assertEqual(get_stats_mock.call_args_list[0], mock.call(city="חיפה", rooms=3.5, weeks=4))
+        self.assertEqual(get_stats_mock.call_args_list[1], mock.call(city=None, rooms=None, weeks=4))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from flask import Flask
+
+from flaskr.database import mySQL_db
+from flaskr.models.SQL import schema
+
+# The properties table as created before latitude/longitude/location_precision and the unique url
+LEGACY_TABLE = ("CREATE TABLE properties (id INTEGER PRIMARY KEY, description TEXT, price NUMERIC, size NUMERIC, "
+                "rooms INTEGER, city TEXT, address TEXT, phone TEXT, url TEXT, sent BOOLEAN, created_at DATETIME)")
+
+
+class MigratePropertiesTest(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, "properties.db")
+        with sqlite3.connect(self.path) as connection:
+            connection.execute(LEGACY_TABLE)
+            connection.executemany("INSERT INTO properties (id, url, price) VALUES (?, ?, ?)",
+                                   [(1, "a", 1000), (2, "a", 1100), (3, "b", 2000), (4, None, 1), (5, None, 2)])
+
+        self.app = Flask(__name__)
+        self.app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{self.path}"
+        mySQL_db.init_app(self.app)
+        schema.init_app(self.app)
+        context = self.app.app_context()
+        context.push()
+        self.addCleanup(context.pop)
+        self.addCleanup(mySQL_db.engine.dispose)
+
+    def rows(self):
+        with sqlite3.connect(self.path) as connection:
+            return connection.execute("SELECT id, url, price FROM properties ORDER BY id").fetchall()
+
+    def test_check_is_read_only(self):
+        problems = schema.check_property_schema(mySQL_db.engine)
+        self.assertIn("column location_precision is missing", problems)
+        self.assertIn("url is not unique", problems)
+        self.assertEqual(len(self.rows()), 5)
+
+    def test_migration_keeps_newest_row_of_each_url(self):
+        changes = schema.migrate_properties(mySQL_db.engine)
+
+        self.assertIn("deleted 1 older rows of duplicate urls", changes)
+        # Rows without a url are never duplicates of each other
+        self.assertEqual(self.rows(), [(2, "a", 1100), (3, "b", 2000), (4, None, 1), (5, None, 2)])
+        self.assertEqual(schema.check_property_schema(mySQL_db.engine), [])
+        self.assertEqual(schema.migrate_properties(mySQL_db.engine), [])
+        with self.assertRaises(sqlite3.IntegrityError), sqlite3.connect(self.path) as connection:
+            connection.execute("INSERT INTO properties (url) VALUES ('b')")
+
+    def test_without_dedupe_nothing_is_deleted(self):
+        changes = schema.migrate_properties(mySQL_db.engine, dedupe=False)
+
+        self.assertEqual(len(self.rows()), 5)
+        self.assertEqual(schema.check_property_schema(mySQL_db.engine), ["url is not unique"])
+        self.assertIn(f"kept 1 duplicate urls, {schema.URL_INDEX_NAME} not created", changes)
+
+    def test_command_asks_before_deleting(self):
+        runner = self.app.test_cli_runner()
+
+        result = runner.invoke(args=["migrate-properties"], input="n\n")
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(len(self.rows()), 5)
+
+        result = runner.invoke(args=["migrate-properties", "--yes"])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertEqual(len(self.rows()), 4)
+        self.assertIn("up to date", runner.invoke(args=["migrate-properties"]).output)
+
+
+if __name__ == "__main__":
+    unittest.main()
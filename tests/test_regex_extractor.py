@@ -0,0 +1,35 @@
+import unittest
+
+from utils.regex_extractor import extract_city, extract_rental_info
+
+
+class ExtractCityTest(unittest.TestCase):
+
+    def test_finds_the_city_with_or_without_prefix_letters(self):
+        for text, city in (("דירת 3 חדרים בחיפה, 4500 ש\"ח", "חיפה"),
+                           ("חיפה - דירה להשכרה", "חיפה"),
+                           ("עוברים לתל אביב", "תל אביב"),
+                           ("ומחיפה עד קריית ביאליק", "חיפה"),
+                           ("דירה בת\"א", "תל אביב"),
+                           ("(נשר) 2 חדרים", "נשר")):
+            with self.subTest(text=text):
+                self.assertEqual(extract_city(text), city)
+
+    def test_ignores_city_names_inside_other_words(self):
+        for text in ("הבית נשרף לגמרי", "מנשרים ועד היום", "דירה יפה ומרווחת", "חיפהלנד"):
+            with self.subTest(text=text):
+                self.assertIsNone(extract_city(text))
+
+    def test_skips_a_partial_hit_and_finds_the_next_city(self):
+        self.assertEqual(extract_city("נשרף המטבח, הדירה בנתניה"), "נתניה")
+
+
+class ExtractRentalInfoTest(unittest.TestCase):
+
+    def test_extracts_price_rooms_and_size(self):
+        info = extract_rental_info("להשכרה 3.5 חדרים, 85 מ\"ר, מחיר: 5,200 ש\"ח")
+        self.assertEqual(info, {"price": 5200, "rooms": 3.5, "size": 85.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
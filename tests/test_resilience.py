@@ -0,0 +1,95 @@
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+from utils import resilience
+from utils.resilience import CLOSED, HALF_OPEN, OPEN, CircuitOpenError, ResilientHTTP
+
+URL = "https://example.supabase.co/rest/v1/properties"
+
+
+def response(status_code):
+    fake = requests.Response()
+    fake.status_code = status_code
+    return fake
+
+
+class CircuitBreakerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.http = ResilientHTTP(hedge_after=0)
+        self.breaker = self.http.breaker("POST", URL)
+        self.breaker.failure_threshold = 2
+        self.breaker.reset_seconds = 0
+
+    def post(self, outcome):
+        def request(*args, **kwargs):
+            if isinstance(outcome, Exception):
+                raise outcome
+            return response(outcome)
+
+        with mock.patch.object(resilience.requests, "request", side_effect=request):
+            return self.http.post(URL, json={})
+
+    def open_breaker(self):
+        for _ in range(2):
+            self.post(503)
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_opens_after_consecutive_failures_and_rejects_calls(self):
+        self.breaker.reset_seconds = 60
+        self.open_breaker()
+        with self.assertRaises(CircuitOpenError):
+            self.post(201)
+
+    def test_client_errors_keep_the_breaker_closed(self):
+        for _ in range(3):
+            self.assertEqual(self.post(400).status_code, 400)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_successful_trial_closes_the_breaker(self):
+        self.open_breaker()
+        self.post(201)
+        self.assertEqual((self.breaker.state, self.breaker.failures), (CLOSED, 0))
+
+    def test_failed_trial_reopens_the_breaker(self):
+        self.open_breaker()
+        with self.assertRaises(requests.ConnectionError):
+            self.post(requests.ConnectionError("refused"))
+        self.assertEqual(self.breaker.state, OPEN)
+
+    def test_trial_raising_any_error_releases_the_half_open_slot(self):
+        self.open_breaker()
+        with self.assertRaises(ValueError):
+            self.post(ValueError("bad response body"))
+        self.assertNotEqual(self.breaker.state, HALF_OPEN)
+        # The next trial goes through instead of being rejected forever
+        self.assertEqual(self.post(201).status_code, 201)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+
+class HedgedGetTest(unittest.TestCase):
+
+    def test_second_request_answers_when_the_first_is_slow(self):
+        http = ResilientHTTP(hedge_after=0.01)
+        release = threading.Event()
+        calls = []
+
+        def get(url, **kwargs):
+            calls.append(url)
+            if len(calls) == 1:
+                release.wait(1)
+                return response(200)
+            return response(204)
+
+        with mock.patch.object(resilience.requests, "get", side_effect=get):
+            self.assertEqual(http.get(URL).status_code, 204)
+        release.set()
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(http.breaker("GET", URL).state, CLOSED)
+
+
+if __name__ == "__main__":
+    unittest.main()
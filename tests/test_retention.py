@@ -0,0 +1,121 @@
+import gzip
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from types import SimpleNamespace
+from unittest import mock
+
+from bson import ObjectId
+
+from services import retention
+from services.retention import (ArchiveError, _append_to_archive, _verify_archive, archive_old_posts,
+                                archive_path, archive_supabase_table, iter_archive)
+
+
+class FakeSupabaseClient:
+    """Pages and deletes rows of one table in memory"""
+
+    def __init__(self, rows):
+        self.rows = {row["id"]: row for row in rows}
+        self.deleted = []
+
+    def get_rows_created_before(self, table, cutoff, limit=1000, after_id=0):
+        return [self.rows[row_id] for row_id in sorted(self.rows)
+                if row_id > after_id and self.rows[row_id]["created_at"] < cutoff][:limit]
+
+    def delete_rows(self, table, ids):
+        self.deleted += ids
+        for row_id in ids:
+            del self.rows[row_id]
+        return True
+
+
+class RetentionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        patcher = mock.patch.dict(os.environ, {"ARCHIVE_DIR": directory.name})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class ArchiveFileTest(RetentionTestCase):
+
+    def test_archive_dir_must_be_an_existing_absolute_path(self):
+        for value in ("", "relative/archive", "/does/not/exist"):
+            with self.subTest(value=value), mock.patch.dict(os.environ, {"ARCHIVE_DIR": value}):
+                with self.assertRaises(ArchiveError):
+                    archive_path("posts", "2024-05")
+
+    def test_every_append_is_a_complete_gzip_member(self):
+        _append_to_archive("posts", "2024-05", [{"_id": 1, "content": "דירה"}])
+        _append_to_archive("posts", "2024-05", [{"_id": 2, "content": "second"}, {"_id": 1, "content": "again"}])
+
+        with open(archive_path("posts", "2024-05"), "rb") as raw:
+            # Decompressing succeeds only when every member has its trailer
+            self.assertEqual(gzip.decompress(raw.read()).count(b"\n"), 3)
+        self.assertEqual(sorted((document["_id"], document["content"]) for document in iter_archive("posts", "2024-05")),
+                         [(1, "again"), (2, "second")])
+
+    def test_truncated_member_fails_verification(self):
+        documents = [{"_id": index, "content": "x" * 100} for index in range(50)]
+        _append_to_archive("posts", "2024-05", documents)
+        path = archive_path("posts", "2024-05")
+        with open(path, "r+b") as raw:
+            raw.truncate(os.path.getsize(path) - 4)
+
+        with self.assertRaises(ArchiveError):
+            _verify_archive(path, 0, documents)
+
+
+class ArchiveOldPostsTest(RetentionTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.posts = [{"_id": ObjectId(), "link": f"https://www.facebook.com/groups/1/posts/{index}/",
+                       "content": f"post {index}", "hasBeenSent": True, "date_posted": datetime(2024, 5, index + 1)}
+                      for index in range(3)]
+        self.db = SimpleNamespace(post_fingerprints=mock.Mock(), collection=mock.Mock())
+        for patcher in (mock.patch.object(retention, "mongo", SimpleNamespace(db=self.db)),
+                        mock.patch.object(retention, "iter_post_batches", return_value=iter([self.posts]))):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_posts_are_deleted_after_they_are_archived(self):
+        self.assertEqual(archive_old_posts(days=30), 3)
+
+        self.assertEqual([post["_id"] for post in iter_archive("posts", "2024-05")],
+                         [post["_id"] for post in self.posts])
+        fingerprints = self.db.post_fingerprints.bulk_write.call_args[0][0]
+        self.assertEqual(len(fingerprints), 3)
+        self.db.collection.delete_many.assert_called_once_with({"_id": {"$in": [post["_id"] for post in self.posts]}})
+
+    def test_posts_are_kept_when_the_archive_does_not_read_back(self):
+        with mock.patch.object(retention, "_verify_archive", side_effect=ArchiveError("short read")):
+            with self.assertRaises(ArchiveError):
+                archive_old_posts(days=30)
+        self.db.post_fingerprints.bulk_write.assert_not_called()
+        self.db.collection.delete_many.assert_not_called()
+
+
+class ArchiveSupabaseTableTest(RetentionTestCase):
+
+    def test_old_rows_are_archived_by_month_then_deleted(self):
+        client = FakeSupabaseClient([
+            {"id": 1, "created_at": "2024-04-30T10:00:00+00:00", "url": "a"},
+            {"id": 2, "created_at": "2024-05-01T10:00:00+00:00", "url": "b"},
+            {"id": 3, "created_at": "2999-01-01T00:00:00+00:00", "url": "recent"},
+        ])
+        with mock.patch.object(retention, "BATCH_SIZE", 1):
+            self.assertEqual(archive_supabase_table("properties", days=30, client=client), 2)
+
+        self.assertEqual(client.deleted, [1, 2])
+        self.assertEqual(list(client.rows), [3])
+        self.assertEqual([row["url"] for row in iter_archive("properties", "2024-04")], ["a"])
+        self.assertEqual([row["url"] for row in iter_archive("properties", "2024-05")], ["b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+import unittest
+from datetime import datetime, timedelta
+from unittest import mock
+
+from flask import Flask
+
+from services import scheduler as scheduler_module
+from services.scheduler import ISRAEL_TZ, ScrapeScheduler, compute_next_run, is_schedule_finished, scrape_lock
+
+
+class FakeConfigClient:
+
+    def __init__(self, schedules, interval="20"):
+        self.schedules = schedules
+        self.interval = interval
+        self.updates = []
+
+    def get_setting(self, key):
+        return self.interval
+
+    def get_schedules(self, active_only=True):
+        return [schedule for schedule in self.schedules if schedule.get("is_active", True) or not active_only]
+
+    def update_schedule(self, schedule_id, updates):
+        self.updates.append((schedule_id, updates))
+
+
+def israel_time(*args):
+    return ISRAEL_TZ.localize(datetime(*args))
+
+
+class ComputeNextRunTest(unittest.TestCase):
+
+    def test_waits_an_interval_after_the_last_run(self):
+        now = israel_time(2024, 5, 1, 12, 0)
+        next_run = compute_next_run({}, now, 20, last_run=now - timedelta(minutes=5), jitter_ratio=0)
+        self.assertEqual(next_run, now + timedelta(minutes=15))
+
+    def test_moves_to_the_start_of_a_window_crossing_midnight(self):
+        schedule = {"start_time": "22:00", "end_time": "06:00"}
+        self.assertEqual(compute_next_run(schedule, israel_time(2024, 5, 1, 12, 0), 20, jitter_ratio=0),
+                         israel_time(2024, 5, 1, 22, 0))
+        self.assertEqual(compute_next_run(schedule, israel_time(2024, 5, 2, 3, 0), 20, jitter_ratio=0),
+                         israel_time(2024, 5, 2, 3, 0))
+
+    def test_starts_on_the_start_date(self):
+        schedule = {"start_option": "on-date", "start_date": "2024-06-01", "start_time": "08:00", "end_time": "20:00"}
+        self.assertEqual(compute_next_run(schedule, israel_time(2024, 5, 1, 12, 0), 20, jitter_ratio=0),
+                         israel_time(2024, 6, 1, 8, 0))
+
+    def test_never_fires_after_the_end_date_or_count(self):
+        now = israel_time(2024, 5, 1, 23, 50)
+        self.assertIsNone(compute_next_run({"end_option": "on-date", "end_date": "2024-05-01"}, now, 20,
+                                           last_run=now, jitter_ratio=0))
+        finished = {"end_option": "after-count", "max_posts": 10, "posts_scraped": 10}
+        self.assertTrue(is_schedule_finished(finished, now))
+        self.assertIsNone(compute_next_run(finished, now, 20))
+
+
+class SchedulerTickTest(unittest.TestCase):
+
+    def setUp(self):
+        self.now = datetime.now(ISRAEL_TZ)
+        self.scrape = mock.Mock(return_value=4)
+        patcher = mock.patch.object(scheduler_module, "scrape_and_store_posts", self.scrape)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        jitter = mock.patch.object(scheduler_module.random, "uniform", return_value=0)
+        jitter.start()
+        self.addCleanup(jitter.stop)
+
+    def scheduler(self, *schedules):
+        self.client = FakeConfigClient(list(schedules))
+        scheduler = ScrapeScheduler(client=self.client)
+        scheduler.app = Flask(__name__)
+        return scheduler
+
+    def test_fires_a_new_schedule_and_records_the_run(self):
+        scheduler = self.scheduler({"id": 1, "updated_at": "v1", "posts_scraped": 2})
+        scheduler.tick(now=self.now)
+
+        self.scrape.assert_called_once()
+        schedule_id, updates = self.client.updates[0]
+        self.assertEqual((schedule_id, updates["posts_scraped"]), (1, 6))
+        self.assertIn("last_run_at", updates)
+
+    def test_continues_from_last_run_at_after_a_restart(self):
+        last_run_at = (self.now - timedelta(minutes=5)).isoformat()
+        scheduler = self.scheduler({"id": 1, "updated_at": "v1", "last_run_at": last_run_at})
+        scheduler.tick(now=self.now)
+        self.scrape.assert_not_called()
+
+        scheduler.tick(now=self.now + timedelta(minutes=16))
+        self.scrape.assert_called_once()
+
+    def test_skipped_run_is_retried_on_the_next_tick(self):
+        scheduler = self.scheduler({"id": 1, "updated_at": "v1"})
+        with scrape_lock:
+            scheduler.tick(now=self.now)
+        self.scrape.assert_not_called()
+        self.assertEqual(self.client.updates, [])
+
+        scheduler.tick(now=self.now + timedelta(seconds=30))
+        self.scrape.assert_called_once()
+
+    def test_run_limited_to_the_remaining_posts_and_deactivated_when_reached(self):
+        scheduler = self.scheduler({"id": 1, "updated_at": "v1", "end_option": "after-count", "max_posts": 5,
+                                    "posts_scraped": 1})
+        scheduler.tick(now=self.now)
+
+        self.assertEqual(self.scrape.call_args.kwargs["max_posts"], 4)
+        _, updates = self.client.updates[0]
+        self.assertEqual((updates["posts_scraped"], updates["is_active"]), (5, False))
+
+
+if __name__ == "__main__":
+    unittest.main()
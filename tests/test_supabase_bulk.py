@@ -0,0 +1,118 @@
+import json
+import threading
+import unittest
+from unittest import mock
+
+import requests
+
+from utils import supabase_bulk
+from utils.supabase_bulk import bulk_upsert, chunk_rows
+
+URL = "https://example.supabase.co/rest/v1/properties"
+
+
+def response(status_code, text=""):
+    fake = requests.Response()
+    fake.status_code = status_code
+    fake._content = text.encode("utf-8")
+    fake.url = URL
+    return fake
+
+
+class FakePostgREST:
+    """Writes a chunk in one statement: one bad row fails it with 400, like PostgREST"""
+
+    def __init__(self, status_sequence=()):
+        self.status_sequence = list(status_sequence)     # statuses answered before the rows are looked at
+        self.stored = []
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def post(self, url, headers=None, params=None, data=None, timeout=None):
+        rows = json.loads(data)
+        with self._lock:
+            self.requests.append({"headers": headers, "params": params, "rows": rows})
+            if self.status_sequence:
+                status = self.status_sequence.pop(0)
+                if status != 201:
+                    return response(status, f"status {status}")
+            if any(row.get("price") == "bad" for row in rows):
+                return response(400, 'invalid input syntax for type numeric: "bad"')
+            self.stored += rows
+            return response(201)
+
+
+class BulkUpsertTest(unittest.TestCase):
+
+    def upsert(self, server, rows, **kwargs):
+        with mock.patch.object(supabase_bulk, "http", server):
+            return bulk_upsert(URL, {"apikey": "key"}, rows, **kwargs)
+
+    def rows(self, count, bad=()):
+        return [{"url": f"https://example.com/{index}", "price": "bad" if index in bad else 4000 + index}
+                for index in range(count)]
+
+    def test_writes_every_row_as_an_upsert(self):
+        server = FakePostgREST()
+        result = self.upsert(server, self.rows(3), on_conflict="url")
+
+        self.assertTrue(result)
+        self.assertEqual(len(server.stored), 3)
+        request = server.requests[0]
+        self.assertEqual(request["params"], {"columns": "price,url", "on_conflict": "url"})
+        self.assertTrue(request["headers"]["Prefer"].startswith("resolution=merge-duplicates"))
+        self.assertEqual(request["headers"]["apikey"], "key")
+
+    def test_bisects_a_rejected_chunk_down_to_the_bad_rows(self):
+        server = FakePostgREST()
+        result = self.upsert(server, self.rows(8, bad={2, 5}))
+
+        self.assertFalse(result)
+        self.assertEqual(result.failed, [2, 5])
+        self.assertIn("400", result.errors[2])
+        self.assertEqual(sorted(row["url"] for row in server.stored),
+                         sorted(f"https://example.com/{index}" for index in (0, 1, 3, 4, 6, 7)))
+
+    def test_forbidden_fails_the_whole_chunk_without_bisecting(self):
+        server = FakePostgREST(status_sequence=[403])
+        result = self.upsert(server, self.rows(8))
+
+        self.assertEqual(result.failed, list(range(8)))
+        self.assertEqual(len(server.requests), 1)
+        self.assertEqual(server.stored, [])
+
+    def test_retries_a_transient_failure_once(self):
+        server = FakePostgREST(status_sequence=[503])
+        self.assertTrue(self.upsert(server, self.rows(4)))
+        self.assertEqual(len(server.requests), 2)
+
+        server = FakePostgREST(status_sequence=[503, 503])
+        result = self.upsert(server, self.rows(4))
+        self.assertEqual(result.failed, [0, 1, 2, 3])
+        self.assertEqual(len(server.requests), 2)
+
+    def test_chunks_are_written_independently(self):
+        server = FakePostgREST()
+        with mock.patch.object(supabase_bulk, "chunk_rows", lambda rows: chunk_rows(rows, max_rows=3)):
+            result = self.upsert(server, self.rows(7, bad={4}), max_workers=2)
+
+        self.assertEqual(result.failed, [4])
+        self.assertEqual(len(server.stored), 6)
+        self.assertEqual(repr(result), "<BulkResult 6/7 rows written>")
+
+
+class ChunkRowsTest(unittest.TestCase):
+
+    def test_splits_by_row_count_and_size(self):
+        rows = [{"description": "x" * 100} for _ in range(5)]
+        self.assertEqual(chunk_rows(rows, max_rows=2), [(0, 2), (2, 4), (4, 5)])
+        self.assertEqual(chunk_rows(rows, max_bytes=250), [(0, 2), (2, 4), (4, 5)])
+
+    def test_oversized_row_gets_its_own_chunk(self):
+        rows = [{"a": 1}, {"description": "x" * 500}, {"a": 2}]
+        self.assertEqual(chunk_rows(rows, max_bytes=100), [(0, 1), (1, 2), (2, 3)])
+        self.assertEqual(chunk_rows([]), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -12,13 +12,12 @@ Pseudocode (with ETL stages)
 
 '''
 from datetime import time
-import logging, time, os, sys
+import argparse, logging, time, os, sys
 from dotenv import load_dotenv
 import pandas as pd
 from pymongo import MongoClient
 from sqlalchemy import create_engine
-from sqlmodel import SQLModel, Session
-from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import SQLModel
 
 # Load the .env file
 load_dotenv()
@@ -27,11 +26,13 @@ load_dotenv()
 sys.path.append(os.getcwd())
 
 from utils.regex_extractor import extract_rental_info
+from utils.profiling import enable_profiling, profiled
 from ETL.models.Post import Post
 
 
-def extract_data(limit=20):
-    """Extract data from MongoDB and return a list of dictionaries."""
+def extract_data(limit=20, batch_size=500):
+    """Extract data from MongoDB and yield it as lists of at most batch_size dictionaries."""
+    client = None
     try:
         # Connect to MongoDB
         logging.info("Connecting to MongoDB.")
@@ -40,20 +41,30 @@ def extract_data(limit=20):
         collection = db["collection"]
         logging.info("Connected to MongoDB successfully.")
 
-        # Fetch data (limit to 20 records by default)
-        logging.debug(f"Fetching data from MongoDB with limit={limit}.")
-        data = list(collection.find().limit(limit))
-        logging.info(f"Fetched {len(data)} documents from MongoDB.")
-        
-        return data
+        # Stream only the fields the transform uses (limit to 20 records by default, 0 means all)
+        logging.debug(f"Fetching data from MongoDB with limit={limit}, batch_size={batch_size}.")
+        cursor = collection.find({}, {"content": 1}).sort("_id", 1).limit(limit).batch_size(batch_size)
+
+        batch, fetched = [], 0
+        for document in cursor:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                fetched += len(batch)
+                yield batch
+                batch = []
+        if batch:
+            fetched += len(batch)
+            yield batch
+        logging.info(f"Fetched {fetched} documents from MongoDB.")
 
     except Exception as e:
         logging.error(f"Error during MongoDB extraction: {e}")
         raise
 
     finally:
-        client.close()
-        logging.info("MongoDB connection closed.")
+        if client:
+            client.close()
+            logging.info("MongoDB connection closed.")
 
 def transform_data(data: list) -> list:
     import math
@@ -87,30 +98,22 @@ def transform_data(data: list) -> list:
 
 
 def insert_data(engine, data: list):
-    """Load - Insert processed SQLModel objects into PostgreSQL using ON CONFLICT DO NOTHING."""
+    """Load - Insert processed SQLModel objects into PostgreSQL, skipping duplicates (by mongo_id)."""
     logging.info(f"Attempting to insert {len(data)} records into PostgreSQL.")  # Log the number of records to insert
 
     try:
-        create_table()  # Ensure the table exists before inserting data
-
-        with Session(engine) as session:  # Open a database session
-            # Prepare bulk insert statement using SQLAlchemy's insert function
-            stmt = insert(data[0].__class__).values([obj.model_dump() for obj in data])  # Convert each object to a dictionary
-            
-            # Use ON CONFLICT DO NOTHING to avoid duplicate inserts based on mongo_id
-            stmt = stmt.on_conflict_do_nothing(index_elements=["mongo_id"])
-
-            result = session.exec(stmt)  # Execute the statement and capture the result
-            session.commit()  # Commit the transaction
+        create_table(engine)  # Ensure the table exists before inserting data
 
-            # Calculate the number of inserted rows (rowcount = number of rows affected)
-            inserted_count = result.rowcount if result and result.rowcount is not None else 0
+        # Insert the batch through the storage repository, skipping rows whose mongo_id is already loaded
+        from flaskr.data_access.repository import IGNORE, SQLAlchemyRepository
+        inserted_count = SQLAlchemyRepository(engine).upsert(
+            "posts", [obj.model_dump() for obj in data], key="mongo_id", on_conflict=IGNORE)
 
-            # Log the number of records actually inserted or indicate that no records were inserted
-            if inserted_count > 0:
-                logging.info(f"{inserted_count} records actually inserted into PostgreSQL.")  # Successful insertion
-            else:
-                logging.info("No new records were inserted due to duplicates.")  # No insertion due to duplicates
+        # Log the number of records actually inserted or indicate that no records were inserted
+        if inserted_count > 0:
+            logging.info(f"{inserted_count} records actually inserted into PostgreSQL.")  # Successful insertion
+        else:
+            logging.info("No new records were inserted due to duplicates.")  # No insertion due to duplicates
 
     except Exception as e:
         logging.error(f"PostgreSQL insertion failed: {e}")  # Log any exception that occurs
@@ -130,16 +133,16 @@ def connect_to_postgres():
 
 
 
-def create_table():
+def create_table(engine):
     """Create tables based on SQLModel definitions"""
     SQLModel.metadata.create_all(engine)
     print("Table created successfully!")
 
 
 
-if __name__ == "__main__":
-    # Configure logging
-    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+@profiled("etl")
+def run_etl():
+    """Runs the whole ETL: every batch extracted from MongoDB is transformed and loaded into PostgreSQL."""
     start_time = time.time()  # Measure total execution time
     
     logging.info("ETL process started.")
@@ -147,22 +150,25 @@ if __name__ == "__main__":
     try:
         # raise RuntimeError("Simulated general error")
         
-        # Extract - Connect to MongoDB and fetch data
+        logging.info("Connecting to PostgreSQL.")
+        engine = connect_to_postgres()
+
+        # Extract - Stream data from MongoDB in batches, then transform and load each batch
         logging.info("Starting data extraction from MongoDB.")
-        data = extract_data()
-        logging.info(f"Extraction completed. Retrieved {len(data)} documents.")
+        total_extracted = total_transformed = 0
+        for data in extract_data():
+            total_extracted += len(data)
 
-        # Transform - Process the fetched data into SQL Model objects
-        logging.info("Starting data transformation.")
-        transformed_data = transform_data(data)
-        logging.info(f"Transformation completed. Processed {len(transformed_data)} records.")
+            # Transform - Process the fetched data into SQL Model objects
+            transformed_data = transform_data(data)
+            total_transformed += len(transformed_data)
 
-        # Load - Connect to PostgreSQL and insert data
-        logging.info("Connecting to PostgreSQL.")
-        engine = connect_to_postgres()
-        
-        logging.info("Starting data insertion into PostgreSQL.")
-        insert_data(engine, transformed_data)
+            # Load - Insert the batch into PostgreSQL
+            if transformed_data:
+                insert_data(engine, transformed_data)
+
+        logging.info(f"Extraction completed. Retrieved {total_extracted} documents.")
+        logging.info(f"Transformation completed. Processed {total_transformed} records.")
         logging.info("Data insertion completed successfully.")
 
     except Exception as e:
@@ -170,10 +176,16 @@ if __name__ == "__main__":
 
     finally:
         logging.info(f"ETL process finished in {time.time() - start_time:.2f} seconds.")
-    
 
-    
-    
-    
-    
-    
\ No newline at end of file
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load the scraped posts from MongoDB into PostgreSQL.")
+    parser.add_argument("--profile", action="store_true", help="Profile the run (same as APP_PROFILE=1).")
+    parser.add_argument("--profile-memory", action="store_true", help="Also trace memory allocations.")
+    args = parser.parse_args()
+    if args.profile or args.profile_memory:
+        enable_profiling(memory=args.profile_memory)
+
+    # Configure logging
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+    run_etl()
@@ -1,24 +1,47 @@
+import logging
 import smtplib
+import socket
 import os
 import sys
+import threading
+import time
 from email.mime.text import MIMEText
-from dotenv import load_dotenv
+from jinja2 import Environment
+
+from utils.env import load_env
 
 # הוספת נתיב לפרויקט (לפי הצורך)
 sys.path.append(r'C:\meshi\ApartmentHunterBot')
 
 # טען את כל הערכים מה-.env
-load_dotenv()
+load_env()
 
 # קריאה של משתנים מה-.env
 APP_PASSWORD = os.getenv("GOOGLE_APP_PASSWORD")          # סיסמה לאפליקציה
 SENDER_EMAIL = os.getenv("EMAIL_ADDRESS")               # כתובת השולח
-RECIPIENTS = os.getenv("EMAIL_RECIPIENTS")  # רשימת מקבלים מופרדת בפסיקים
+RECIPIENTS = [address.strip() for address in os.getenv("EMAIL_RECIPIENTS", "").split(",") if address.strip()]  # רשימת מקבלים מופרדת בפסיקים
+
+# שרת ה-SMTP (ברירת מחדל Gmail, אפשר להפנות לשרת מקומי כמו aiosmtpd לבדיקות)
+SMTP_HOST = os.getenv("SMTP_HOST", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 465))
+SMTP_USE_SSL = os.getenv("SMTP_USE_SSL", "true").lower() in ("1", "true", "yes")
+SMTP_IDLE_CHECK_SECONDS = 60    # Connections idle longer than this are checked with NOOP before reuse
 
 # תוכן המייל
 BODY = "Hello my name is Slim Shady"
 SUBJECT = "פוסטים לדירות בפייסבוק"
 
+# Compiled once at import, rendered for every digest
+DIGEST_TEMPLATE = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True).from_string(
+"""<div style='direction: rtl; text-align: right;'>
+{% for post in posts %}
+קישור - {{ post['link'] }}<br>
+{{ post['content'] }}<br>
+----------------<br>
+{% endfor %}
+</div>
+""")
+
 def format_posts_for_email(posts):
     """
     Formats a list of posts (documents) into a single string for email body.
@@ -29,27 +52,141 @@ def format_posts_for_email(posts):
     Returns:
     - A formatted string that can be used as the body of an email (HTML).
     """
-    formatted_message = "<div style='direction: rtl; text-align: right;'>\n"
-    for post in posts:
-        formatted_message += f"קישור - {post['link']}<br>\n"
-        formatted_message += f"{post['content']}<br>\n"
-        formatted_message += "----------------<br>\n"
-    formatted_message += "</div>\n"
-    return formatted_message
+    return DIGEST_TEMPLATE.render(posts=posts)
+
 
-def send_email(subject, body):
+class SMTPConnection:
     """
-    Send an HTML email using Gmail SMTP server.
+    Authenticated SMTP connection that is kept open across sends.
+
+    The connection is opened lazily, checked with NOOP after being idle and
+    reopened once if the server dropped it in the middle of a send.
     """
+
+    def __init__(self, host=SMTP_HOST, port=SMTP_PORT, use_ssl=SMTP_USE_SSL,
+                 username=SENDER_EMAIL, password=APP_PASSWORD):
+        self.host = host
+        self.port = port
+        self.use_ssl = use_ssl
+        self.username = username
+        self.password = password
+        self._server = None
+        self._last_used = 0
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        smtp_class = smtplib.SMTP_SSL if self.use_ssl else smtplib.SMTP
+        server = smtp_class(self.host, self.port, timeout=30)
+        if self.password:
+            server.login(self.username, self.password)
+        self._server = server
+        logging.info(f"Connected to SMTP server {self.host}:{self.port}")
+
+    def _ensure_connected(self):
+        if self._server is not None and time.monotonic() - self._last_used > SMTP_IDLE_CHECK_SECONDS:
+            try:
+                if self._server.noop()[0] != 250:
+                    self._close()
+            except smtplib.SMTPException:
+                self._close()
+            except OSError:
+                self._close()
+        if self._server is None:
+            self._connect()
+
+    def _close(self):
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self._server = None
+
+    def send(self, msg, to_addrs):
+        """
+        Sends a message, reconnecting once if the connection was dropped.
+
+        Only connection failures are retried: an SMTP error reply (rejected recipient,
+        failed login, ...) is raised at once, so a message is never sent twice.
+        """
+        with self._lock:
+            for attempt in (1, 2):
+                try:
+                    self._ensure_connected()
+                    self._server.sendmail(from_addr=self.username, to_addrs=to_addrs, msg=msg.as_string())
+                    self._last_used = time.monotonic()
+                    return
+                except (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, socket.timeout) as e:
+                    self._close()
+                    if attempt == 2:
+                        raise
+                    logging.warning(f"SMTP connection lost ({e}), reconnecting")
+
+    def close(self):
+        with self._lock:
+            self._close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+# Shared connection reused by every send in this process
+smtp_connection = SMTPConnection()
+
+def build_message(subject, body, recipients):
     msg = MIMEText(body, "html")
     msg['Subject'] = subject
     msg['From'] = SENDER_EMAIL
-    msg['To'] = ', '.join(RECIPIENTS)
-    
-    # חיבור ל-SMTP של Gmail דרך SSL
-    with smtplib.SMTP_SSL('smtp.gmail.com', 465) as smtp_server:
-        smtp_server.login(SENDER_EMAIL, APP_PASSWORD)
-        smtp_server.sendmail(from_addr=SENDER_EMAIL, to_addrs=RECIPIENTS, msg=msg.as_string())
-        print("Message sent successfully")
-
- 
+    msg['To'] = ', '.join(recipients)
+    return msg
+
+def send_email(subject, body, recipients=None):
+    """
+    Send an HTML email using the shared SMTP connection.
+
+    Parameters:
+    - recipients: List of addresses (defaults to EMAIL_RECIPIENTS).
+    """
+    recipients = recipients or RECIPIENTS
+    msg = build_message(subject, body, recipients)
+    smtp_connection.send(msg, to_addrs=recipients)
+    print("Message sent successfully")
+
+def send_digests(digests, subject=SUBJECT):
+    """
+    Sends one personalized digest per recipient over a single SMTP session.
+
+    Parameters:
+    - digests: A dict of recipient address -> list of posts.
+    - subject: Subject of every digest.
+
+    Returns:
+    - A dict with 'sent', 'failed' (recipient -> error), 'seconds' and 'emails_per_second'.
+    """
+    start_time = time.perf_counter()
+    sent, failed = 0, {}
+
+    for recipient, posts in digests.items():
+        if not posts:
+            continue
+        try:
+            msg = build_message(subject, format_posts_for_email(posts), [recipient])
+            smtp_connection.send(msg, to_addrs=[recipient])
+            sent += 1
+        except (smtplib.SMTPException, OSError) as e:
+            logging.error(f"Failed to send digest to {recipient}: {e}")
+            failed[recipient] = str(e)
+
+    seconds = time.perf_counter() - start_time
+    stats = {
+        "sent": sent,
+        "failed": failed,
+        "seconds": seconds,
+        "emails_per_second": sent / seconds if seconds > 0 else 0.0
+    }
+    logging.info(f"Sent {sent} digests ({len(failed)} failed) in {seconds:.2f}s "
+                 f"({stats['emails_per_second']:.1f} emails/s)")
+    return stats
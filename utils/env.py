@@ -0,0 +1,29 @@
+"""
+Loading of the project's .env file.
+
+Modules call `load_env()` instead of `load_dotenv()` so the file is read once per
+process, whichever module is imported first.
+"""
+import os
+import threading
+
+from dotenv import load_dotenv
+
+_loaded = False
+_lock = threading.Lock()
+
+
+def get_env_path() -> str:
+    # The .env file sits in the project directory (ApartmentHunterBot), the parent of utils/
+    return os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), '.env')
+
+
+def load_env():
+    """Loads the .env file into os.environ (existing variables win). Later calls do nothing."""
+    global _loaded
+    if _loaded:
+        return
+    with _lock:
+        if not _loaded:
+            load_dotenv(dotenv_path=get_env_path())
+            _loaded = True
@@ -0,0 +1,160 @@
+"""
+Offline geocoding of Hebrew city/street names.
+
+Names are resolved against a local gazetteer CSV (GAZETTEER_PATH, default
+data/gazetteer.csv, columns: city,street,lat,lon; an empty street is the city
+centroid) and every result, including misses, is kept in a persistent SQLite
+key-value cache (GEOCODE_CACHE_PATH) plus an in-memory dict, so repeated
+streets never reach the gazetteer again. `geocode_many` resolves a whole batch
+with one cache query and one cache write.
+
+Results are (lat, lon, precision) where precision is 'street' or 'city'. A
+'city' result is only the city centroid: it is stored with the record (as
+location_precision) but too coarse for radius/polygon search, which only uses
+'street' results, so the gazetteer needs street rows for the areas searched.
+"""
+import csv
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import namedtuple
+from datetime import datetime, timezone
+
+from utils.keyword_matcher import normalize_hebrew
+
+GeoResult = namedtuple("GeoResult", ["lat", "lon", "precision"])
+
+DEFAULT_GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "gazetteer.csv")
+DEFAULT_CACHE_PATH = "geocode_cache.sqlite3"
+
+# Street type prefixes and house numbers are dropped before lookup
+_STREET_PREFIX_PATTERN = re.compile(r"^(?:רחוב|רח'|רח\b|שדרות|שד'|שד\b|דרך|סמטת|סמ'|כיכר|ככר)\s*")
+_HOUSE_NUMBER_PATTERN = re.compile(r"\s*\d+[א-ת]?(?:\s*/\s*\d+)?\s*$")
+_PUNCTUATION_PATTERN = re.compile(r"[.,\"()\-]")
+_SPELLING_VARIANTS = (("קריית", "קרית"), ("תל-אביב", "תל אביב"), ("ת\"א", "תל אביב"))
+
+
+def normalize_city(city) -> str:
+    city = normalize_hebrew(city)
+    for variant, canonical in _SPELLING_VARIANTS:
+        city = city.replace(normalize_hebrew(variant), normalize_hebrew(canonical))
+    return " ".join(_PUNCTUATION_PATTERN.sub(" ", city).split())
+
+
+def normalize_street(street) -> str:
+    street = normalize_hebrew(street)
+    street = _STREET_PREFIX_PATTERN.sub("", street)
+    street = _HOUSE_NUMBER_PATTERN.sub("", street)
+    return " ".join(_PUNCTUATION_PATTERN.sub(" ", street).split())
+
+
+def cache_key(city, street=None) -> str:
+    return f"{normalize_city(city)}|{normalize_street(street) if street else ''}"
+
+
+class Geocoder:
+    """Gazetteer lookups behind a persistent cache"""
+
+    def __init__(self, gazetteer_path=None, cache_path=None):
+        self.gazetteer_path = gazetteer_path or os.getenv("GAZETTEER_PATH", DEFAULT_GAZETTEER_PATH)
+        self.cache_path = cache_path or os.getenv("GEOCODE_CACHE_PATH", DEFAULT_CACHE_PATH)
+        self._gazetteer = None
+        self._memory = {}           # cache key -> GeoResult or None
+        self._connection = None
+        self._lock = threading.Lock()
+
+    def _load_gazetteer(self):
+        gazetteer = {}
+        try:
+            with open(self.gazetteer_path, encoding="utf-8") as gazetteer_file:
+                for row in csv.DictReader(gazetteer_file):
+                    precision = "street" if row.get("street") else "city"
+                    gazetteer[cache_key(row["city"], row.get("street"))] = GeoResult(
+                        float(row["lat"]), float(row["lon"]), precision)
+        except (OSError, KeyError, ValueError) as e:
+            logging.error(f"Failed to load gazetteer {self.gazetteer_path}: {e}")
+        logging.info(f"Loaded {len(gazetteer)} gazetteer entries")
+        return gazetteer
+
+    def _gazetteer_version(self) -> str:
+        try:
+            stat = os.stat(self.gazetteer_path)
+            return f"{stat.st_mtime_ns}:{stat.st_size}"
+        except OSError:
+            return ""
+
+    def _cache(self):
+        if self._connection is None:
+            connection = sqlite3.connect(self.cache_path, check_same_thread=False)
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS geocode (key TEXT PRIMARY KEY, lat REAL, lon REAL, "
+                    "precision TEXT, updated_at TEXT)")
+                connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+                # Cached results (misses and city fallbacks included) are only valid for the gazetteer they came from
+                version = self._gazetteer_version()
+                row = connection.execute("SELECT value FROM meta WHERE key = 'gazetteer_version'").fetchone()
+                if row is None or row[0] != version:
+                    connection.execute("DELETE FROM geocode")
+                    connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('gazetteer_version', ?)",
+                                       (version,))
+            self._connection = connection
+        return self._connection
+
+    def _resolve(self, key):
+        """Looks a key up in the gazetteer, falling back to the city centroid."""
+        result = self._gazetteer.get(key)
+        if result is None:
+            result = self._gazetteer.get(key.split("|", 1)[0] + "|")
+        return result
+
+    def geocode_many(self, places) -> list:
+        """
+        Geocodes a batch of (city, street) pairs.
+
+        Returns:
+        - A GeoResult (or None when the city is unknown) per input pair, in order.
+        """
+        keys = [cache_key(city, street) if city else None for city, street in places]
+        with self._lock:
+            if self._gazetteer is None:
+                self._gazetteer = self._load_gazetteer()
+
+            missing = list({key for key in keys if key is not None and key not in self._memory})
+            if missing:
+                connection = self._cache()
+                for start in range(0, len(missing), 500):
+                    chunk = missing[start:start + 500]
+                    rows = connection.execute(
+                        f"SELECT key, lat, lon, precision FROM geocode WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk)
+                    for key, lat, lon, precision in rows:
+                        self._memory[key] = GeoResult(lat, lon, precision) if lat is not None else None
+
+                resolved = {key: self._resolve(key) for key in missing if key not in self._memory}
+                if resolved:
+                    now = datetime.now(timezone.utc).isoformat()
+                    with connection:
+                        connection.executemany(
+                            "INSERT OR REPLACE INTO geocode (key, lat, lon, precision, updated_at) VALUES (?, ?, ?, ?, ?)",
+                            [(key, *(result or (None, None, None)), now) for key, result in resolved.items()])
+                    self._memory.update(resolved)
+
+            return [self._memory.get(key) if key is not None else None for key in keys]
+
+    def geocode(self, city, street=None):
+        return self.geocode_many([(city, street)])[0]
+
+    def enrich(self, records, city_field="city", address_field="address"):
+        """Sets latitude/longitude/location_precision on each record (dict) from its city and address, in one batch."""
+        results = self.geocode_many([(record.get(city_field), record.get(address_field)) for record in records])
+        for record, result in zip(records, results):
+            if result is not None:
+                record["latitude"], record["longitude"] = result.lat, result.lon
+                record["location_precision"] = result.precision
+        return records
+
+
+geocoder = Geocoder()
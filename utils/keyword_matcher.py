@@ -0,0 +1,154 @@
+"""
+Multi-pattern keyword matching for post filtering.
+
+All include/exclude words are compiled into a single Aho-Corasick automaton, so
+checking a post is one pass over its text no matter how many rules exist.
+Text and rules go through the same Hebrew normalization (niqqud removed, final
+letters folded, quote/geresh variants unified, whitespace collapsed).
+"""
+import logging
+import re
+import threading
+from collections import deque, namedtuple
+
+# Niqqud and cantillation marks
+_NIQQUD_PATTERN = re.compile(r'[֑-ׇ]')
+_WHITESPACE_PATTERN = re.compile(r'\s+')
+
+_CHAR_MAP = str.maketrans({
+    'ך': 'כ', 'ם': 'מ', 'ן': 'נ', 'ף': 'פ', 'ץ': 'צ',
+    '״': '"', '”': '"', '“': '"', '„': '"',
+    '׳': "'", '’': "'", '‘': "'", '`': "'",
+    '־': '-', '–': '-', '—': '-',
+})
+
+EXCLUDE = "exclude"
+INCLUDE = "include"
+
+FilterResult = namedtuple("FilterResult", ["accepted", "rule", "kind"])
+
+
+def normalize_hebrew(text: str) -> str:
+    """Normalizes Hebrew text so spelling variants of the same word compare equal."""
+    if not text:
+        return ""
+    text = _NIQQUD_PATTERN.sub("", text)
+    text = text.translate(_CHAR_MAP).lower()
+    return _WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+class AhoCorasick:
+    """Aho-Corasick automaton over a fixed set of (pattern, payload) pairs"""
+
+    def __init__(self, patterns):
+        """
+        Parameters:
+        - patterns: Iterable of (pattern, payload) tuples. Patterns are matched as-is,
+          normalize them beforehand if needed.
+        """
+        self._goto = [{}]
+        self._fail = [0]
+        self._outputs = [[]]
+        # Closest state on the fail chain that has outputs (avoids copying output lists)
+        self._output_link = [0]
+
+        for pattern, payload in patterns:
+            if pattern:
+                self._add(pattern, payload)
+        self._build()
+
+    def _add(self, pattern, payload):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._output_link.append(0)
+            state = next_state
+        self._outputs[state].append(payload)
+
+    def _build(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                target = self._goto[fallback].get(char, 0)
+                self._fail[next_state] = target if target != next_state else 0
+                fail_state = self._fail[next_state]
+                self._output_link[next_state] = fail_state if self._outputs[fail_state] else self._output_link[fail_state]
+
+    def iter_matches(self, text):
+        """Yields (end_index, payload) for every pattern occurrence in the text."""
+        state = 0
+        goto, fail = self._goto, self._fail
+        for index, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+
+            match_state = state if self._outputs[state] else self._output_link[state]
+            while match_state:
+                for payload in self._outputs[match_state]:
+                    yield index, payload
+                match_state = self._output_link[match_state]
+
+
+class KeywordFilter:
+    """
+    Include/exclude keyword filter backed by one compiled automaton.
+
+    A post is rejected if it contains any exclude rule. If include rules exist,
+    it must also contain at least one of them. Rules can be swapped at runtime
+    with `load`, readers always see either the old or the new automaton.
+    """
+
+    def __init__(self, exclude=(), include=()):
+        self._lock = threading.Lock()
+        self._compiled = None       # (automaton, has_include), swapped as one reference
+        self.rules = ((), ())
+        self.load(exclude=exclude, include=include)
+
+    def load(self, exclude=(), include=()):
+        """Compiles a new rule set and swaps it in. No-op if the rules did not change."""
+        exclude, include = tuple(exclude or ()), tuple(include or ())
+        with self._lock:
+            if (exclude, include) == self.rules and self._compiled is not None:
+                return
+            patterns = [(normalize_hebrew(word), (EXCLUDE, word)) for word in exclude]
+            patterns += [(normalize_hebrew(word), (INCLUDE, word)) for word in include]
+            automaton = AhoCorasick(patterns)
+
+            # Single reference swap: readers never pair one rule set's automaton with the other's include flag
+            self._compiled = (automaton, bool(include))
+            self.rules = (exclude, include)
+        logging.info(f"Keyword filter compiled with {len(exclude)} exclude and {len(include)} include rules")
+
+    def check(self, text) -> FilterResult:
+        """
+        Checks a post against the rules in a single pass.
+
+        Returns:
+        - FilterResult(accepted, rule, kind): `rule` is the original word that decided
+          the result (None if the post was rejected for not matching any include rule).
+        """
+        automaton, has_include = self._compiled
+        first_include = None
+        for _, (kind, word) in automaton.iter_matches(normalize_hebrew(text)):
+            if kind == EXCLUDE:
+                return FilterResult(False, word, EXCLUDE)
+            if first_include is None:
+                first_include = word
+
+        if first_include is not None:
+            return FilterResult(True, first_include, INCLUDE)
+        if has_include:
+            return FilterResult(False, None, INCLUDE)
+        return FilterResult(True, None, None)
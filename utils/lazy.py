@@ -0,0 +1,36 @@
+"""
+Deferred construction of module-level clients.
+
+`LazyObject(factory)` stands in for the object `factory()` returns and only calls
+the factory on first attribute access, so importing a module that defines a
+client (Supabase, OpenAI) costs nothing and does not fail when the client's
+configuration is missing until the client is actually used.
+"""
+import threading
+
+
+class LazyObject:
+    """Proxy that builds the wrapped object on first use"""
+
+    def __init__(self, factory):
+        object.__setattr__(self, "_factory", factory)
+        object.__setattr__(self, "_instance", None)
+        object.__setattr__(self, "_lock", threading.Lock())
+
+    def _get_instance(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    object.__setattr__(self, "_instance", self._factory())
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self._get_instance(), name)
+
+    def __setattr__(self, name, value):
+        setattr(self._get_instance(), name, value)
+
+    def __repr__(self):
+        if self._instance is None:
+            return f"<LazyObject {getattr(self._factory, '__qualname__', self._factory)} (not created)>"
+        return repr(self._instance)
@@ -0,0 +1,173 @@
+"""
+Prometheus metrics for the web app, the data stores, the scraper and the ETL.
+
+Hot-path functions are instrumented with the `timed` decorator: the labelled
+histogram child is resolved once at decoration time, so every call only costs
+two perf_counter() reads and one observe().
+
+By default the metrics live in the memory of the process, which is right for
+the single `run.py` process. When the app runs in several worker processes,
+set PROMETHEUS_MULTIPROC_DIR to an empty directory shared by the workers (it
+must be set before the first import of prometheus_client and wiped at every
+deploy): every worker then writes its samples there and /metrics aggregates all
+workers with a MultiProcessCollector. Gauges declare how they are aggregated
+(multiprocess_mode). The live* modes only count the workers that are still
+running: the server should call `mark_process_dead(pid)` when a worker exits
+(e.g. gunicorn's child_exit hook), and /metrics also drops the samples of
+workers that are gone without it.
+"""
+import functools
+import glob
+import logging
+import os
+import threading
+import time
+
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, Gauge, Histogram, generate_latest, multiprocess
+
+ROUTE_LATENCY = Histogram(
+    "http_route_duration_seconds", "Latency of Flask routes", ["route"])
+
+DB_LATENCY = Histogram(
+    "db_operation_duration_seconds", "Latency of Supabase / Mongo calls", ["backend", "operation"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30))
+
+SCRAPER_PHASE = Histogram(
+    "scraper_phase_duration_seconds", "Duration of scraper phases", ["phase"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1800))
+
+EXTRACTION_LATENCY = Histogram(
+    "extraction_duration_seconds", "Latency of structured data extraction from posts", ["extractor"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30))
+
+# In-memory queues of each worker (the live feed): the total is the sum over the live workers
+QUEUE_DEPTH = Gauge(
+    "queue_depth", "Number of items waiting in internal queues", ["queue"], multiprocess_mode="livesum")
+
+# Queues stored in a database (the email outbox) have the same depth in every worker: report the latest sample
+SHARED_QUEUE_DEPTH = Gauge(
+    "shared_queue_depth", "Number of items waiting in queues shared by all workers", ["queue"],
+    multiprocess_mode="livemostrecent")
+
+# One series per live worker (pid label)
+APP_STARTUP = Gauge(
+    "app_startup_seconds", "Duration of the app startup phases (phase=total from the first import)", ["phase"],
+    multiprocess_mode="liveall")
+
+QUEUE_SAMPLE_SECONDS = 5
+
+_queue_size_functions = {}      # queue name -> size function of a per-worker queue (multiprocess mode)
+_shared_queue_size_functions = {}   # queue name -> size function of a shared queue, sampled on /metrics
+_sampler_thread = None
+
+
+def multiprocess_enabled() -> bool:
+    # Same check as prometheus_client, which switches its value storage when the variable is present
+    return "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+
+def timed(histogram, **labels):
+    """Decorator that observes the duration of every call in the given histogram."""
+    child = histogram.labels(**labels)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                child.observe(time.perf_counter() - start)
+        return wrapper
+
+    return decorator
+
+
+def register_queue(name, size_function, shared=False):
+    """
+    Reports the size of a queue.
+
+    Parameters:
+    - name: The queue label.
+    - size_function: Returns the current size.
+    - shared: True for a queue every worker sees whole (a database collection), False for an
+      in-memory queue of this worker.
+    """
+    gauge = SHARED_QUEUE_DEPTH if shared else QUEUE_DEPTH
+    if not multiprocess_enabled():
+        # Evaluated only when /metrics is scraped
+        gauge.labels(queue=name).set_function(size_function)
+    elif shared:
+        _shared_queue_size_functions[name] = size_function
+    else:
+        # Callback gauges only exist in the memory of their process, which the other workers can not read,
+        # so every worker writes its own depth to the shared directory
+        _queue_size_functions[name] = size_function
+        _start_queue_sampler()
+
+
+def _start_queue_sampler():
+    global _sampler_thread
+    if _sampler_thread is not None and _sampler_thread.is_alive():
+        return
+    _sampler_thread = threading.Thread(target=_sample_queues_forever, name="queue-depth-sampler", daemon=True)
+    _sampler_thread.start()
+
+
+def _sample_queues_forever():
+    while True:
+        _sample_queues(_queue_size_functions, QUEUE_DEPTH)
+        time.sleep(QUEUE_SAMPLE_SECONDS)
+
+
+def _sample_queues(size_functions, gauge):
+    for name, size_function in list(size_functions.items()):
+        try:
+            gauge.labels(queue=name).set(size_function())
+        except Exception as e:
+            logging.warning(f"Could not sample the {name} queue depth: {e}")
+
+
+def _process_alive(pid) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def mark_dead_workers(path=None) -> list:
+    """
+    Drops the live gauge samples of the workers that exited without `mark_process_dead`.
+
+    Returns:
+    - The pids of the workers that were dropped.
+    """
+    path = path or os.environ.get("PROMETHEUS_MULTIPROC_DIR")
+    # os.kill(pid, 0) is no liveness check on Windows, where multiprocess mode is not used anyway
+    if not path or os.name == "nt":
+        return []
+    pids = set()
+    for file_path in glob.glob(os.path.join(path, "gauge_live*_*.db")):
+        pid = os.path.basename(file_path)[:-len(".db")].rsplit("_", 1)[1]
+        if pid.isdigit():
+            pids.add(int(pid))
+    dead = sorted(pid for pid in pids if not _process_alive(pid))
+    for pid in dead:
+        multiprocess.mark_process_dead(pid, path)
+    return dead
+
+
+def render_metrics():
+    """Returns the exposition payload (of all workers in multiprocess mode) and its content type."""
+    if not multiprocess_enabled():
+        return generate_latest(), CONTENT_TYPE_LATEST
+
+    _sample_queues(_queue_size_functions, QUEUE_DEPTH)
+    _sample_queues(_shared_queue_size_functions, SHARED_QUEUE_DEPTH)
+    mark_dead_workers()
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
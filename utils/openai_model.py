@@ -1,18 +1,28 @@
 import os
 # import openai
 import json
-from openai import OpenAI
-from dotenv import load_dotenv
+from utils.env import load_env
+from utils.lazy import LazyObject
+from utils.metrics import EXTRACTION_LATENCY, timed
 
 # Set the OpenAI API key
 # openai.api_key = os.environ.get("OPENAI_API_KEY"))
-load_dotenv()
+load_env()
 
-client = OpenAI(
-    api_key=os.environ.get("OPENAI_API_KEY")  # This is the default and can be omitted
-)
 
+def _create_client():
+    from openai import OpenAI
 
+    return OpenAI(
+        api_key=os.environ.get("OPENAI_API_KEY")  # This is the default and can be omitted
+    )
+
+
+# Created on the first extraction (importing openai and building the client is slow)
+client = LazyObject(_create_client)
+
+
+@timed(EXTRACTION_LATENCY, extractor="llm")
 def extract_info(post_text):
     # Define the messages for the conversation
 
@@ -0,0 +1,190 @@
+'''
+Incremental Parquet export of the processed posts for analytics.
+
+MongoDB --> batches of processed rows --> Parquet files partitioned by month/city
+
+Layout (Hive partitioning, readable by DuckDB/pandas/Spark):
+    exports/posts/month=2024-05/city=תל אביב/part-<first _id of the batch>.parquet
+    exports/posts/_watermark.json      # last exported Mongo _id
+
+Each run exports only the posts inserted after the watermark, so it can run
+after every scrape. Query with DuckDB, e.g.:
+    SELECT month, city, median(price) FROM read_parquet('exports/posts/**/*.parquet', hive_partitioning=true)
+    GROUP BY ALL
+
+Usage: python utils/parquet_export.py [--full] [--output exports/posts]
+'''
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+from bson import ObjectId
+from dotenv import load_dotenv
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pymongo import MongoClient
+
+# Load the .env file
+load_dotenv()
+
+# Add the path to the project directory
+sys.path.append(os.getcwd())
+
+from utils.regex_extractor import extract_city, extract_rental_info
+
+DEFAULT_OUTPUT_DIR = os.path.join("exports", "posts")
+BATCH_SIZE = 5000
+WATERMARK_FILE = "_watermark.json"
+
+SCHEMA = pa.schema([
+    ("mongo_id", pa.string()),
+    ("post_id", pa.string()),
+    ("date_posted", pa.timestamp("s")),
+    ("price", pa.float64()),
+    ("rooms", pa.float64()),
+    ("size", pa.float64()),
+    ("group_url", pa.string()),
+    ("link", pa.string()),
+])
+
+PROJECTION = {"post_id": 1, "link": 1, "content": 1, "date_posted": 1, "price": 1, "rooms": 1, "size": 1,
+              "city": 1, "group_url": 1}
+
+
+def read_watermark(output_dir):
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as watermark:
+        return ObjectId(json.load(watermark)["last_id"])
+
+
+def write_watermark(output_dir, last_id):
+    path = os.path.join(output_dir, WATERMARK_FILE)
+    with open(f"{path}.tmp", "w", encoding="utf-8") as watermark:
+        json.dump({"last_id": str(last_id), "updated_at": datetime.now().isoformat()}, watermark)
+    os.replace(f"{path}.tmp", path)
+
+
+def _number(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _field(post, extracted, name):
+    return post.get(name) if post.get(name) is not None else extracted.get(name)
+
+
+def to_row(post):
+    """Converts a Mongo post into an export row, extracting the fields older posts were stored without."""
+    content = post.get("content") or ""
+    extracted = extract_rental_info(content) if post.get("price") is None and post.get("rooms") is None else {}
+    date_posted = post.get("date_posted")
+    if not isinstance(date_posted, datetime):
+        date_posted = post["_id"].generation_time.replace(tzinfo=None)
+
+    return {
+        "mongo_id": str(post["_id"]),
+        "post_id": post.get("post_id"),
+        "date_posted": date_posted.replace(microsecond=0),
+        "price": _number(_field(post, extracted, "price")),
+        "rooms": _number(_field(post, extracted, "rooms")),
+        "size": _number(_field(post, extracted, "size")),
+        "group_url": post.get("group_url"),
+        "link": post.get("link"),
+        # Partition keys
+        "month": date_posted.strftime("%Y-%m"),
+        "city": post.get("city") or extract_city(content) or "unknown",
+    }
+
+
+def _partition_value(value):
+    return str(value).replace("/", "_").replace(os.sep, "_")
+
+
+def write_batch(output_dir, rows):
+    """Writes one Parquet file per month/city partition. File names are deterministic, so a retried batch overwrites."""
+    partitions = {}
+    for row in rows:
+        partitions.setdefault((row["month"], row["city"]), []).append(row)
+
+    part_name = f"part-{rows[0]['mongo_id']}.parquet"
+    for (month, city), partition_rows in partitions.items():
+        directory = os.path.join(output_dir, f"month={month}", f"city={_partition_value(city)}")
+        os.makedirs(directory, exist_ok=True)
+        table = pa.Table.from_pylist(partition_rows, schema=SCHEMA)
+        path = os.path.join(directory, part_name)
+        pq.write_table(table, f"{path}.tmp", compression="zstd")
+        os.replace(f"{path}.tmp", path)
+    return len(partitions)
+
+
+def export_posts(output_dir=DEFAULT_OUTPUT_DIR, full=False, batch_size=BATCH_SIZE):
+    """
+    Exports the posts inserted since the last run (all posts with full=True).
+
+    Returns:
+    - The number of posts exported.
+    """
+    client = None
+    try:
+        logging.info("Connecting to MongoDB.")
+        client = MongoClient(os.environ.get("MONGO_URL"))
+        collection = client["posts"]["collection"]
+
+        os.makedirs(output_dir, exist_ok=True)
+        if full:
+            # Rewrite the dataset from scratch
+            for name in os.listdir(output_dir):
+                if name.startswith("month="):
+                    shutil.rmtree(os.path.join(output_dir, name))
+        last_id = None if full else read_watermark(output_dir)
+        filter = {"_id": {"$gt": last_id}} if last_id else {}
+        logging.info(f"Exporting posts after {last_id or 'the beginning'} to {output_dir}.")
+
+        exported = 0
+        batch = []
+        cursor = collection.find(filter, PROJECTION).sort("_id", 1).batch_size(batch_size)
+        for post in cursor:
+            batch.append(post)
+            if len(batch) >= batch_size:
+                exported += _flush(output_dir, batch)
+                batch = []
+        if batch:
+            exported += _flush(output_dir, batch)
+
+        logging.info(f"Exported {exported} posts.")
+        return exported
+
+    finally:
+        if client:
+            client.close()
+
+
+def _flush(output_dir, posts):
+    rows = [to_row(post) for post in posts]
+    partitions = write_batch(output_dir, rows)
+    # Advance the watermark only once the batch is durable
+    write_watermark(output_dir, posts[-1]["_id"])
+    logging.debug(f"Wrote {len(rows)} posts to {partitions} partitions.")
+    return len(rows)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser(description="Export processed posts to partitioned Parquet files.")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT_DIR, help="Dataset directory (default: exports/posts)")
+    parser.add_argument("--full", action="store_true", help="Rewrite the dataset with every post")
+    args = parser.parse_args()
+
+    start_time = time.time()
+    export_posts(output_dir=args.output, full=args.full)
+    logging.info(f"Export finished in {time.time() - start_time:.2f} seconds.")
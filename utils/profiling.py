@@ -0,0 +1,157 @@
+"""
+Opt-in sampling profiler for scraper and ETL runs.
+
+Enable with APP_PROFILE=1, or from a command line entry point with
+`enable_profiling()` (the scraper's and the ETL's --profile option). Functions
+decorated with `profiled` are then sampled from a background thread and, when
+they return, two files are written to APP_PROFILE_DIR (default: ./profiles):
+- <name>-<timestamp>-<pid>.collapsed: folded stacks, loadable by flamegraph.pl or speedscope
+- <name>-<timestamp>-<pid>.txt: top-N functions by self and total samples
+(the timestamp has microseconds, so runs in the same second or in parallel
+processes never overwrite each other). Decorate entry points that run once per
+job, not functions called per batch, or every call writes its own profile.
+With APP_PROFILE_MEMORY=1 (--profile-memory) the peak memory and top allocation sites (tracemalloc)
+are added to the summary. When disabled, the decorator only checks a flag.
+"""
+import functools
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+
+SAMPLE_INTERVAL_SECONDS = 0.005
+TOP_N = 25
+
+
+def _env_flag(name) -> bool:
+    return os.getenv(name, "false").lower() in ("1", "true", "yes")
+
+
+_enabled = {"profile": False, "memory": False}
+
+
+def enable_profiling(memory: bool = False):
+    """Turns profiling on for this process (for --profile / --profile-memory command line options)."""
+    _enabled["profile"] = True
+    _enabled["memory"] = memory
+
+
+def profiling_enabled() -> bool:
+    return _enabled["profile"] or _env_flag("APP_PROFILE")
+
+
+def memory_profiling_enabled() -> bool:
+    return _enabled["memory"] or _env_flag("APP_PROFILE_MEMORY")
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the call stack of one thread at a fixed interval"""
+
+    def __init__(self, thread_id=None, interval=SAMPLE_INTERVAL_SECONDS):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def write_collapsed(self, path):
+        with open(path, "w", encoding="utf-8") as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f"{stack} {count}\n")
+
+    def top(self, n=TOP_N):
+        """Returns (self counts, total counts) of the n hottest functions."""
+        self_counts, total_counts = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            frames = stack.split(";")
+            self_counts[frames[-1]] += count
+            for label in set(frames):
+                total_counts[label] += count
+        return self_counts.most_common(n), total_counts.most_common(n)
+
+
+def _write_summary(path, name, profiler, elapsed, memory_snapshot=None, peak_memory=None):
+    self_top, total_top = profiler.top()
+    lines = [f"Profile of {name}: {elapsed:.2f}s, {profiler.samples} samples "
+             f"every {profiler.interval * 1000:.0f}ms", "", "Top functions by self samples:"]
+    lines += [f"  {count:7d}  {count / max(profiler.samples, 1):6.1%}  {label}" for label, count in self_top]
+    lines += ["", "Top functions by total samples:"]
+    lines += [f"  {count:7d}  {count / max(profiler.samples, 1):6.1%}  {label}" for label, count in total_top]
+
+    if memory_snapshot is not None:
+        lines += ["", f"Peak traced memory: {peak_memory / 1024 / 1024:.1f} MiB", "Top allocation sites:"]
+        lines += [f"  {stat}" for stat in memory_snapshot.statistics("lineno")[:TOP_N]]
+
+    with open(path, "w", encoding="utf-8") as output:
+        output.write("\n".join(lines) + "\n")
+    return lines
+
+
+def profiled(name):
+    """Profiles every call of the decorated function when profiling is enabled."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not profiling_enabled():
+                return func(*args, **kwargs)
+
+            track_memory = memory_profiling_enabled() and not tracemalloc.is_tracing()
+            if track_memory:
+                tracemalloc.start()
+
+            profiler = SamplingProfiler()
+            profiler.start()
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                profiler.stop()
+
+                snapshot, peak = None, None
+                if track_memory:
+                    snapshot = tracemalloc.take_snapshot()
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+
+                output_dir = os.getenv("APP_PROFILE_DIR", "profiles")
+                os.makedirs(output_dir, exist_ok=True)
+                prefix = os.path.join(output_dir, f"{name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}")
+                profiler.write_collapsed(f"{prefix}.collapsed")
+                lines = _write_summary(f"{prefix}.txt", name, profiler, elapsed, snapshot, peak)
+                logging.info("\n".join(lines[:12]))
+                logging.info(f"Profile written to {prefix}.collapsed / {prefix}.txt")
+        return wrapper
+
+    return decorator
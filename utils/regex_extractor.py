@@ -1,5 +1,8 @@
 import re
 
+from utils.keyword_matcher import AhoCorasick, normalize_hebrew
+from utils.metrics import EXTRACTION_LATENCY, timed
+
 # Patterns for extraction
 UPDATED_PRICE_PATTERN = r'(?<!\d)(?:מחיר[:\s-]*|שכ["׳]?ד[:\s-]*|שכר\s*דירה[:\s-]*|עלות חודשית[:\s-]*)?\s*(\b\d{1,3}(?:,\d{3})+|\b\d{4,})\s*(?:ש["׳]?ח|₪|מיליון|שקל)?(?!\d)'
 ROOMS_PATTERN = r'(\d+(\.\d+)?)\s*(?:חדר(?:ים)?|חד)'
@@ -24,9 +27,59 @@ def extract_size(text):
     return float(match.group(1)) if match else None
 
 # Main function
+@timed(EXTRACTION_LATENCY, extractor="regex")
 def extract_rental_info(text):
     return {
         "price": extract_price(text),
         "rooms": extract_rooms(text),
         "size": extract_size(text),
-    }
\ No newline at end of file
+    }
+
+# Cities we know how to recognize in free text (Hebrew name -> canonical name)
+KNOWN_CITIES = {
+    "חיפה": "חיפה",
+    "טירת כרמל": "טירת כרמל",
+    "טירת הכרמל": "טירת כרמל",
+    "נשר": "נשר",
+    "קרית ביאליק": "קרית ביאליק",
+    "קריית ביאליק": "קרית ביאליק",
+    "קרית מוצקין": "קרית מוצקין",
+    "קריית מוצקין": "קרית מוצקין",
+    "תל אביב": "תל אביב",
+    "ת\"א": "תל אביב",
+    "גבעתיים": "גבעתיים",
+    "רמת גן": "רמת גן",
+    "ירושלים": "ירושלים",
+    "נתניה": "נתניה",
+    "הרצליה": "הרצליה",
+}
+
+# One-letter Hebrew prefixes that attach to a city name ("בחיפה", "לתל אביב", "ומחיפה")
+HEBREW_PREFIXES = "בהוכלמש"
+MAX_PREFIX_LETTERS = 2
+
+_city_matcher = None
+
+
+def _is_whole_word(text, start, end):
+    """Whether text[start:end] is a whole word, allowing Hebrew prefix letters before it."""
+    if end < len(text) and text[end].isalnum():
+        return False
+    word_start = start
+    while word_start > 0 and start - word_start < MAX_PREFIX_LETTERS and text[word_start - 1] in HEBREW_PREFIXES:
+        word_start -= 1
+    return word_start == 0 or not text[word_start - 1].isalnum()
+
+# Extract city
+def extract_city(text):
+    global _city_matcher
+    if _city_matcher is None:
+        _city_matcher = AhoCorasick((normalize_hebrew(name), (city, len(normalize_hebrew(name))))
+                                    for name, city in KNOWN_CITIES.items())
+
+    text = normalize_hebrew(text)
+    # A city name inside a longer word ("נשר" in "נשרף") is not a city
+    for end_index, (city, length) in _city_matcher.iter_matches(text):
+        if _is_whole_word(text, end_index + 1 - length, end_index + 1):
+            return city
+    return None
@@ -0,0 +1,157 @@
+"""
+Resilient HTTP calls to Supabase: per-endpoint circuit breakers, short deadlines
+and hedged GETs.
+
+Every request goes through the breaker of its endpoint (method + path, e.g.
+"GET /rest/v1/properties"). After BREAKER_FAILURES consecutive failures
+(connection errors, timeouts, 429/5xx) the breaker opens and calls fail at once
+with CircuitOpenError instead of waiting for a timeout; after BREAKER_RESET_SECONDS
+one trial call is let through (half-open) and its outcome closes or re-opens it.
+
+GETs are idempotent, so they get a short read deadline (READ_TIMEOUT) and, when
+the first attempt has not answered after HEDGE_AFTER seconds, a second identical
+request is sent and whichever answers first wins. Writes keep their callers'
+timeouts and are never sent twice.
+
+`http` has the `requests` call signatures (get/post/patch/delete).
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeout, as_completed
+from urllib.parse import urlsplit
+
+import requests
+
+BREAKER_FAILURES = int(os.getenv("SUPABASE_BREAKER_FAILURES", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("SUPABASE_BREAKER_RESET_SECONDS", 30))
+CONNECT_TIMEOUT = 3
+READ_TIMEOUT = float(os.getenv("SUPABASE_READ_TIMEOUT", 5))
+HEDGE_AFTER = float(os.getenv("SUPABASE_HEDGE_AFTER", 1.0))    # 0 disables hedging
+FAILURE_STATUS = {429, 500, 502, 503, 504}
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """Raised instead of calling an endpoint whose breaker is open"""
+
+
+class CircuitBreaker:
+    """Consecutive-failure circuit breaker"""
+
+    def __init__(self, name, failure_threshold: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """Whether a call may go through (lets one trial call through once the reset period passed)."""
+        with self._lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.reset_seconds:
+                self.state = HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logging.info(f"Circuit {self.name} closed")
+            self.state, self.failures = CLOSED, 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                logging.warning(f"Circuit {self.name} opened after {self.failures} failures")
+                self.state, self._opened_at = OPEN, time.monotonic()
+
+
+class ResilientHTTP:
+    """requests-compatible calls guarded by per-endpoint breakers"""
+
+    def __init__(self, read_timeout: float = READ_TIMEOUT, hedge_after: float = HEDGE_AFTER, max_workers: int = 16):
+        self.read_timeout = read_timeout
+        self.hedge_after = hedge_after
+        self._breakers = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedged-get")
+
+    def breaker(self, method, url) -> CircuitBreaker:
+        name = f"{method} {urlsplit(url).path}"
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(name)
+            return self._breakers[name]
+
+    def request(self, method, url, timeout=None, **kwargs) -> requests.Response:
+        breaker = self.breaker(method, url)
+        if not breaker.allow():
+            raise CircuitOpenError(f"Circuit {breaker.name} is open")
+
+        # Every call records an outcome, whatever it raises: a half-open trial that ended
+        # without one would keep the breaker half-open (and every later call rejected) forever
+        succeeded = False
+        try:
+            if method == "GET":
+                read_timeout = min(timeout, self.read_timeout) if timeout else self.read_timeout
+                response = self._hedged_get(url, timeout=(CONNECT_TIMEOUT, read_timeout), **kwargs)
+            else:
+                response = requests.request(method, url, timeout=(CONNECT_TIMEOUT, timeout or 30), **kwargs)
+            # Client errors (bad filter, bad row) say nothing about the backend's health
+            succeeded = response.status_code not in FAILURE_STATUS
+            return response
+        finally:
+            if succeeded:
+                breaker.record_success()
+            else:
+                breaker.record_failure()
+
+    def _hedged_get(self, url, **kwargs) -> requests.Response:
+        if not self.hedge_after:
+            return requests.get(url, **kwargs)
+
+        first = self._executor.submit(requests.get, url, **kwargs)
+        try:
+            return first.result(timeout=self.hedge_after)
+        except FuturesTimeout:
+            pass
+
+        second = self._executor.submit(requests.get, url, **kwargs)
+        error = None
+        for future in as_completed((first, second)):
+            try:
+                response = future.result()
+            except requests.RequestException as e:
+                error = e
+                continue
+            if response.status_code not in FAILURE_STATUS:
+                return response
+            error = error or requests.HTTPError(f"{response.status_code} from {url}", response=response)
+        if isinstance(error, requests.HTTPError) and error.response is not None:
+            return error.response
+        raise error
+
+    def get(self, url, **kwargs) -> requests.Response:
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs) -> requests.Response:
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url, **kwargs) -> requests.Response:
+        return self.request("PATCH", url, **kwargs)
+
+    def delete(self, url, **kwargs) -> requests.Response:
+        return self.request("DELETE", url, **kwargs)
+
+
+http = ResilientHTTP()
@@ -0,0 +1,43 @@
+"""
+Startup-time report.
+
+`create_app` times its phases with `StartupTimer.phase`; `report()` logs one line
+with the total (from the first flaskr import) and the slowest phases, and
+publishes every phase on /metrics as app_startup_seconds{phase=...}.
+"""
+import logging
+import time
+from contextlib import contextmanager
+
+from utils.metrics import APP_STARTUP
+
+
+class StartupTimer:
+    """Collects the durations of the startup phases"""
+
+    def __init__(self, started_at: float = None):
+        self.started_at = started_at if started_at is not None else time.perf_counter()
+        self.phases = []            # (name, seconds) in order
+
+    def record(self, name, seconds):
+        self.phases.append((name, seconds))
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def report(self) -> str:
+        total = time.perf_counter() - self.started_at
+        for name, seconds in self.phases:
+            APP_STARTUP.labels(phase=name).set(seconds)
+        APP_STARTUP.labels(phase="total").set(total)
+
+        slowest = sorted(self.phases, key=lambda phase: phase[1], reverse=True)
+        summary = ", ".join(f"{name} {seconds * 1000:.0f}ms" for name, seconds in slowest)
+        message = f"Startup finished in {total * 1000:.0f}ms ({summary})"
+        logging.info(message)
+        return message
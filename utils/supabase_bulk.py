@@ -0,0 +1,155 @@
+"""
+Chunked, concurrent bulk writes to the Supabase REST API (PostgREST).
+
+Rows are split into chunks of at most MAX_CHUNK_ROWS rows and MAX_CHUNK_BYTES of
+JSON, and the chunks are POSTed by at most MAX_WORKERS threads, as upserts
+(`on_conflict` + `Prefer: resolution=merge-duplicates`) when a conflict column is
+given. PostgREST writes a chunk in one statement, so one bad row fails its whole
+chunk: a chunk rejected because of its rows (400/409/422: bad value, constraint
+violation) is bisected until the bad rows are isolated. Other errors (401/403/404,
+...) would fail every half the same way, so they fail the whole chunk at once.
+Transient failures (timeouts, connection errors, 429/5xx) are retried
+once before the chunk's rows are reported as failed.
+
+`bulk_upsert` returns a BulkResult with the outcome of every row.
+"""
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from utils.resilience import http
+
+MAX_CHUNK_ROWS = int(os.getenv("SUPABASE_BULK_CHUNK_ROWS", 500))
+MAX_CHUNK_BYTES = int(os.getenv("SUPABASE_BULK_CHUNK_BYTES", 1_000_000))
+MAX_WORKERS = int(os.getenv("SUPABASE_BULK_WORKERS", 4))
+CHUNK_TIMEOUT = 30
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+ROW_REJECTION_STATUS = {400, 409, 422}     # Caused by some rows of the chunk
+MAX_ATTEMPTS = 2
+
+
+class BulkResult:
+    """Per-row outcome of a bulk write. Truthy when every row was written."""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.errors = {}            # row index -> error message
+
+    @property
+    def failed(self) -> list:
+        """Indexes of the rows that were not written."""
+        return sorted(self.errors)
+
+    @property
+    def succeeded(self) -> list:
+        """Indexes of the rows that were written."""
+        return [index for index in range(self.total) if index not in self.errors]
+
+    def __bool__(self):
+        return not self.errors
+
+    def __repr__(self):
+        return f"<BulkResult {self.total - len(self.errors)}/{self.total} rows written>"
+
+
+def chunk_rows(rows, max_rows: int = MAX_CHUNK_ROWS, max_bytes: int = MAX_CHUNK_BYTES):
+    """
+    Splits rows into chunks by row count and JSON size (a row larger than max_bytes gets its own chunk).
+
+    Returns:
+    - A list of (start, end) index ranges.
+    """
+    chunks = []
+    start = 0
+    size = 0
+    for index, row in enumerate(rows):
+        row_size = len(json.dumps(row, default=str).encode("utf-8")) + 1
+        if index > start and (index - start >= max_rows or size + row_size > max_bytes):
+            chunks.append((start, index))
+            start, size = index, 0
+        size += row_size
+    if start < len(rows):
+        chunks.append((start, len(rows)))
+    return chunks
+
+
+def _is_transient(error) -> bool:
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in TRANSIENT_STATUS
+    return isinstance(error, requests.RequestException)
+
+
+def _is_row_rejection(error) -> bool:
+    return (isinstance(error, requests.HTTPError) and error.response is not None
+            and error.response.status_code in ROW_REJECTION_STATUS)
+
+
+def _describe(error) -> str:
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return f"{error.response.status_code}: {error.response.text[:200]}"
+    return str(error)
+
+
+def bulk_upsert(url: str, headers: dict, rows: list, on_conflict: str = None, ignore_duplicates: bool = False,
+                max_workers: int = MAX_WORKERS, timeout: int = CHUNK_TIMEOUT) -> BulkResult:
+    """
+    Writes rows to a PostgREST table endpoint in concurrent chunks.
+
+    Parameters:
+    - url: The table endpoint, e.g. {SUPABASE_URL}/rest/v1/properties.
+    - headers: The client's auth headers.
+    - rows: JSON-serializable dicts (missing fields get the column default).
+    - on_conflict: Unique column to upsert on; rows are plainly inserted when None.
+    - ignore_duplicates: Leave conflicting rows untouched instead of merging them.
+
+    Returns:
+    - A BulkResult with the rows that failed and why.
+    """
+    result = BulkResult(len(rows))
+    if not rows:
+        return result
+
+    columns = sorted({field for row in rows for field in row})
+    params = {"columns": ",".join(columns)}
+    prefer = ["missing=default", "return=minimal"]
+    if on_conflict:
+        params["on_conflict"] = on_conflict
+        prefer.insert(0, "resolution=ignore-duplicates" if ignore_duplicates else "resolution=merge-duplicates")
+    headers = {**headers, "Prefer": ",".join(prefer)}
+
+    def post(start, end):
+        body = json.dumps(rows[start:end], default=str)
+        response = http.post(url, headers=headers, params=params, data=body, timeout=timeout)
+        response.raise_for_status()
+
+    def write(start, end) -> dict:
+        """Writes rows[start:end], bisecting on row rejections. Returns the errors by row index."""
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                post(start, end)
+                return {}
+            except requests.RequestException as e:
+                error = e
+                if not _is_transient(e):
+                    break
+        if _is_row_rejection(error) and end - start > 1:
+            middle = (start + end) // 2
+            return {**write(start, middle), **write(middle, end)}
+        return {index: _describe(error) for index in range(start, end)}
+
+    chunks = chunk_rows(rows)
+    if len(chunks) == 1:
+        result.errors.update(write(*chunks[0]))
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            for errors in executor.map(lambda chunk: write(*chunk), chunks):
+                result.errors.update(errors)
+
+    if result.errors:
+        first = result.failed[0]
+        logging.error(f"Bulk write to {url} failed for {len(result.errors)}/{len(rows)} rows "
+                      f"(row {first}: {result.errors[first]})")
+    return result
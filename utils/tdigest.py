@@ -0,0 +1,89 @@
+import math
+
+
+class TDigest:
+    """
+    Merging t-digest (Dunning & Ertl) for streaming quantile estimates.
+
+    Keeps at most ~compression centroids however many values are added, and two
+    digests can be merged, so per-bucket digests can be updated incrementally and
+    rolled up (e.g. weeks into a month) without the raw values.
+    """
+
+    def __init__(self, compression: int = 100, centroids=None):
+        self.compression = compression
+        self.centroids = [list(centroid) for centroid in (centroids or [])]   # [mean, weight], sorted by mean
+        self._buffer = []
+
+    @property
+    def count(self) -> float:
+        self._flush()
+        return sum(weight for _, weight in self.centroids)
+
+    def add(self, value: float, weight: float = 1):
+        self._buffer.append([float(value), weight])
+        if len(self._buffer) >= self.compression * 5:
+            self._flush()
+
+    def merge(self, other: "TDigest"):
+        other._flush()
+        self._buffer.extend([list(centroid) for centroid in other.centroids])
+        self._flush()
+        return self
+
+    def _k(self, q: float) -> float:
+        # Scale function k1: small centroids near the tails, large ones around the median
+        return self.compression / (2 * math.pi) * math.asin(2 * min(max(q, 0.0), 1.0) - 1)
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        items = sorted(self.centroids + self._buffer)
+        self._buffer = []
+        total = sum(weight for _, weight in items)
+
+        merged = []
+        mean, weight = items[0]
+        weight_before = 0.0
+        k_lower = self._k(0.0)
+        for item_mean, item_weight in items[1:]:
+            if self._k((weight_before + weight + item_weight) / total) - k_lower <= 1:
+                weight += item_weight
+                mean += (item_mean - mean) * item_weight / weight
+            else:
+                merged.append([mean, weight])
+                weight_before += weight
+                k_lower = self._k(weight_before / total)
+                mean, weight = item_mean, item_weight
+        merged.append([mean, weight])
+        self.centroids = merged
+
+    def quantile(self, q: float):
+        """Estimates the q-quantile (0..1). Returns None for an empty digest."""
+        self._flush()
+        if not self.centroids:
+            return None
+        if len(self.centroids) == 1:
+            return self.centroids[0][0]
+
+        target = q * sum(weight for _, weight in self.centroids)
+        cumulative = 0.0
+        for index, (mean, weight) in enumerate(self.centroids):
+            if cumulative + weight / 2 >= target:
+                if index == 0:
+                    return mean
+                previous_mean, previous_weight = self.centroids[index - 1]
+                previous_center = cumulative - previous_weight / 2
+                center = cumulative + weight / 2
+                return previous_mean + (mean - previous_mean) * (target - previous_center) / (center - previous_center)
+            cumulative += weight
+        return self.centroids[-1][0]
+
+    def to_list(self) -> list:
+        """Compact serializable form (rounded centroids)."""
+        self._flush()
+        return [[round(mean, 2), weight] for mean, weight in self.centroids]
+
+    @classmethod
+    def from_list(cls, centroids, compression: int = 100) -> "TDigest":
+        return cls(compression=compression, centroids=centroids)